@@ -0,0 +1 @@
+"""Benchmarks and load tests for the FoodLoop backend (run as ``python -m benchmarks.<name>``)."""
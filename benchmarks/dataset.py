@@ -0,0 +1,181 @@
+"""Seeded synthetic dataset for the benchmark suite.
+
+Retailers, NGOs and farmers spread evenly over a grid of pincodes a couple of
+kilometres apart (so radius searches find neighbours), a food catalog, each
+retailer's inventory and a history of NGO requests over the last
+``HISTORY_DAYS`` days. The same ``scale`` and ``seed`` always give the same
+rows. Every user's password is :data:`PASSWORD`.
+
+    python -m benchmarks.dataset PATH [--scale small]
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+
+from foodloop_app.demand import rebuild
+from foodloop_app.geo import cell_of
+from foodloop_app.migrations import refresh_statistics, upgrade
+from foodloop_app.models import (
+    ROLES,
+    Food,
+    FoodRequest,
+    InventoryItem,
+    PincodeCentroid,
+    Role,
+    User,
+    roles_users,
+)
+
+PASSWORD = "benchmark-password"
+HISTORY_DAYS = 180
+BATCH_SIZE = 10000
+GRID_COLUMNS = 20
+GRID_STEP = 0.02  # degrees, about 2 km
+ORIGIN = (12.90, 77.50)
+
+SCALES = {
+    "tiny": dict(pincodes=10, retailers=20, ngos=40, farmers=5, foods=500, items=2_000, requests=5_000),
+    "small": dict(pincodes=50, retailers=500, ngos=1_000, farmers=100, foods=5_000, items=100_000, requests=200_000),
+    "large": dict(
+        pincodes=500, retailers=5_000, ngos=10_000, farmers=1_000, foods=100_000, items=1_000_000, requests=2_000_000,
+    ),
+}
+
+
+def pincode(index):
+    return str(560001 + index)
+
+
+def user_email(role, index):
+    return f"{role.lower()}{index}@bench.example"
+
+
+def _batches(rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+
+def _insert(conn, table, rows):
+    for batch in _batches(rows):
+        conn.execute(insert(table), batch)
+
+
+def seed(engine, password_hash, scale="small", seed=42):
+    """Create the schema and fill an empty database behind ``engine``. Returns the row counts."""
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    upgrade(engine)
+    with engine.begin() as conn:
+        if conn.execute(select(func.count()).select_from(User)).scalar():
+            raise SystemExit("The benchmark database must be empty before seeding")
+
+        existing = {name for (name,) in conn.execute(select(Role.name))}
+        _insert(conn, Role, [{"name": name} for name in ROLES if name not in existing])
+        role_ids = dict(conn.execute(select(Role.name, Role.id)).all())
+
+        centroids = []
+        for index in range(sizes["pincodes"]):
+            latitude = ORIGIN[0] + (index // GRID_COLUMNS) * GRID_STEP
+            longitude = ORIGIN[1] + (index % GRID_COLUMNS) * GRID_STEP
+            cell_lat, cell_lon = cell_of(latitude, longitude)
+            centroids.append({
+                "pincode": pincode(index), "latitude": latitude, "longitude": longitude,
+                "cell_lat": cell_lat, "cell_lon": cell_lon,
+            })
+        _insert(conn, PincodeCentroid, centroids)
+
+        # Users of each role take pincodes round-robin, so index 0 of every role shares the first pincode
+        users, memberships, ids = [], [], {}
+        next_id = 1
+        for role, count in (("Retailer", sizes["retailers"]), ("Ngo", sizes["ngos"]), ("Farmer", sizes["farmers"])):
+            ids[role] = range(next_id, next_id + count)
+            for index in range(count):
+                users.append({
+                    "id": next_id, "email": user_email(role, index), "password": password_hash, "active": True,
+                    "city": "Bangalore", "pincode": pincode(index % sizes["pincodes"]), "contact": "0000000000",
+                    "fs_uniquifier": str(uuid.UUID(int=rng.getrandbits(128))),
+                })
+                memberships.append({"user_id": next_id, "role_id": role_ids[role]})
+                next_id += 1
+        _insert(conn, User, users)
+        _insert(conn, roles_users, memberships)
+
+        _insert(conn, Food, [
+            {"id": i, "name": f"Food {i}", "name_lower": f"food {i}", "is_refrigerated": i % 3 == 0,
+             "created_at": now - timedelta(days=HISTORY_DAYS)}
+            for i in range(1, sizes["foods"] + 1)
+        ])
+
+        # Retailer r's k-th item is a different food for every k, as the (user, food) index requires
+        retailers = ids["Retailer"]
+        items, listing = [], []
+        for i in range(1, sizes["items"] + 1):
+            user_id = retailers[(i - 1) % len(retailers)]
+            food_id = (user_id * 7919 + (i - 1) // len(retailers)) % sizes["foods"] + 1
+            best_before = now + timedelta(days=rng.randint(-5, 20), hours=rng.randint(0, 23))
+            status = rng.choices(("Selling", "Listing", "Expired"), weights=(70, 25, 5))[0]
+            if status == "Expired":
+                best_before = now - timedelta(days=rng.randint(11, 30))
+            items.append({
+                "id": i, "user_id": user_id, "food_id": food_id, "quantity": round(rng.uniform(1, 100), 1),
+                "held_quantity": 0.0, "best_before": best_before, "expires_at": best_before + timedelta(days=10),
+                "status": status, "enrichment_attempts": 0,
+            })
+            if status == "Listing":
+                listing.append(i)
+
+        # Requests go to listed items; recent pending ones hold part of the item's quantity
+        ngos = ids["Ngo"]
+        requests = []
+        for i in range(1, sizes["requests"] + 1):
+            item = items[rng.choice(listing) - 1]
+            quantity = round(rng.uniform(0.5, 5), 1)
+            created_at = now - timedelta(seconds=rng.randint(0, HISTORY_DAYS * 86400))
+            status = rng.choices(("approved", "ignored", "expired", "pending"), weights=(60, 20, 15, 5))[0]
+            hold_expires_at = None
+            if status == "pending":
+                created_at = now - timedelta(minutes=rng.randint(1, 300))
+                hold_expires_at = created_at + timedelta(hours=6)
+                if item["held_quantity"] + quantity > item["quantity"] / 2:
+                    status, hold_expires_at = "approved", None
+                else:
+                    item["held_quantity"] += quantity
+            requests.append({
+                "id": i, "inventory_item_id": item["id"], "requester_id": rng.choice(ngos), "quantity": quantity,
+                "status": status, "created_at": created_at, "hold_expires_at": hold_expires_at,
+            })
+        _insert(conn, InventoryItem, items)
+        _insert(conn, FoodRequest, requests)
+
+        rebuild(conn)
+        refresh_statistics(conn)
+    return {"users": len(users), "foods": sizes["foods"], "items": len(items), "requests": len(requests)}
+
+
+def main():
+    from flask_security.utils import hash_password
+
+    from foodloop_app import create_app
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="SQLite file to create")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        password_hash = hash_password(PASSWORD)
+    engine = create_engine(f"sqlite:///{args.path}")
+    started = time.perf_counter()
+    counts = seed(engine, password_hash, args.scale, args.seed)
+    engine.dispose()
+    print(", ".join(f"{count} {name}" for name, count in counts.items()) + f" in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
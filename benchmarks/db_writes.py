@@ -0,0 +1,147 @@
+"""Write throughput of the database configurations in ``foodloop_app.database``.
+
+Runs the shape of the hot write paths (a conditional stock ``UPDATE`` plus a
+``food_request`` insert per transaction) from concurrent threads, alongside
+reader threads running a feed-style join, against each configuration and
+reports committed transactions per second, "database is locked" failures
+and reads per second:
+
+* ``sqlite-default``: no pragmas (rollback journal, synchronous=FULL, pysqlite's 5 s lock wait);
+* ``sqlite-wal``: the app's ``SQLITE_PRAGMAS`` (WAL, synchronous=NORMAL, busy_timeout, mmap);
+* ``sqlite-wal-full``: the same with ``synchronous=FULL``;
+* ``postgresql``: with ``--postgres-url``, which must point at an empty
+  scratch database; the benchmark creates and drops the app's tables there.
+
+    python -m benchmarks.db_writes [--threads 8] [--readers 4] [--duration 5] [--postgres-url postgresql://...]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, func, insert, select, update
+from sqlalchemy.exc import OperationalError
+
+from foodloop_app import db
+from foodloop_app.database import configure_engine, engine_options, sqlite_pragmas
+from foodloop_app.models import Food, FoodRequest, InventoryItem, User
+
+ITEMS = 100
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{
+            "id": 1, "email": "bench@example.com", "password": "x", "active": True, "city": "City",
+            "pincode": "560001", "contact": "0", "fs_uniquifier": "bench",
+        }])
+        conn.execute(insert(Food), [
+            {"id": i, "name": f"Food {i}", "name_lower": f"food {i}", "created_at": now} for i in range(1, ITEMS + 1)
+        ])
+        conn.execute(insert(InventoryItem), [
+            {"id": i, "user_id": 1, "food_id": i, "quantity": 1e9, "held_quantity": 0, "status": "Listing"}
+            for i in range(1, ITEMS + 1)
+        ])
+
+
+def writer(engine, deadline, index, results):
+    committed, locked, latencies = 0, 0, []
+    n = index
+    while time.monotonic() < deadline:
+        item_id = n % ITEMS + 1
+        n += 1
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    update(InventoryItem)
+                    .where(InventoryItem.id == item_id, InventoryItem.quantity >= 1)
+                    .values(quantity=InventoryItem.quantity - 1)
+                )
+                conn.execute(insert(FoodRequest).values(
+                    inventory_item_id=item_id, requester_id=1, quantity=1, status="approved",
+                    created_at=datetime.utcnow(),
+                ))
+        except OperationalError:
+            locked += 1
+            continue
+        committed += 1
+        latencies.append(time.perf_counter() - started)
+    results[index] = (committed, locked, latencies)
+
+
+def reader(engine, deadline, index, results):
+    query = (
+        select(InventoryItem.id, Food.name, InventoryItem.quantity, func.count(FoodRequest.id))
+        .join(Food, InventoryItem.food_id == Food.id)
+        .outerjoin(FoodRequest, FoodRequest.inventory_item_id == InventoryItem.id)
+        .where(InventoryItem.status == "Listing")
+        .group_by(InventoryItem.id, Food.name, InventoryItem.quantity)
+    )
+    reads = 0
+    while time.monotonic() < deadline:
+        with engine.connect() as conn:
+            conn.execute(query).all()
+        reads += 1
+    results[index] = reads
+
+
+def run(engine, threads, readers, duration):
+    results = [None] * threads
+    reads = [0] * readers
+    deadline = time.monotonic() + duration
+    workers = [threading.Thread(target=writer, args=(engine, deadline, i, results)) for i in range(threads)]
+    workers += [threading.Thread(target=reader, args=(engine, deadline, i, reads)) for i in range(readers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    committed = sum(result[0] for result in results)
+    locked = sum(result[1] for result in results)
+    latencies = sorted(latency for result in results for latency in result[2])
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else float("nan")
+    return committed / duration, locked, p99, sum(reads) / duration
+
+
+def configurations(directory, postgres_url):
+    wal = sqlite_pragmas()
+    for name, pragmas in (
+        ("sqlite-default", {}),
+        ("sqlite-wal", wal),
+        ("sqlite-wal-full", dict(wal, synchronous="FULL")),
+    ):
+        url = f"sqlite:///{os.path.join(directory, name + '.sqlite3')}"
+        yield name, url, pragmas
+    if postgres_url:
+        yield "postgresql", postgres_url, {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8, help="concurrent writer threads")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent reader threads")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per configuration")
+    parser.add_argument("--postgres-url", help="empty scratch PostgreSQL database to include")
+    args = parser.parse_args()
+
+    print(f"{args.threads} writer and {args.readers} reader threads, {args.duration:g}s per configuration")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, url, pragmas in configurations(directory, args.postgres_url):
+            engine = create_engine(url, **engine_options(url))
+            configure_engine(engine, pragmas)
+            try:
+                seed(engine)
+                per_second, locked, p99, reads = run(engine, args.threads, args.readers, args.duration)
+                print(f"{name:16} {per_second:8.1f} tx/s  locked {locked:6}  p99 {p99:7.1f} ms  {reads:8.1f} reads/s")
+            finally:
+                if engine.dialect.name != "sqlite":
+                    db.metadata.drop_all(engine)
+                engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
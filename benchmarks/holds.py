@@ -0,0 +1,172 @@
+"""Concurrency check of NGO request holds and approvals (reservations.py).
+
+Builds the app on a scratch SQLite file (or ``--database-url``, an empty
+scratch database whose tables are created there), lists one item of
+``--quantity`` units, then through the routes:
+
+* sends ``--requests`` one-unit ``POST /ngo/request`` calls from
+  ``--threads`` threads at once. Exactly ``--quantity`` must succeed, the
+  rest must get 409, and the item's ``held_quantity`` must equal the sum of
+  its pending requests;
+* approves every successful request from ``--approvers`` threads at once.
+  Each request must be approved exactly once, and the item must end with
+  its quantity reduced by the approved total and nothing held.
+
+Prints the outcome and the time of each phase; exits with status 1 if a
+check fails. ``tests/test_reservations.py`` runs the same checks.
+
+    python -m benchmarks.holds [--quantity 50] [--requests 200] [--threads 16] [--approvers 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+
+PASSWORD = "holds-password"
+
+Result = namedtuple("Result", "held rejected approved duplicate_approvals hold_seconds approve_seconds")
+
+
+def build_app(database_url):
+    from foodloop_app import create_app, db
+    from foodloop_app.migrations import upgrade
+    from foodloop_app.models import ROLES, Role
+
+    os.environ.update(DATABASE_URL=database_url, GEMINI_BACKEND="stub", PASSWORD_HASH_WORKERS="0")
+    app = create_app()
+    app.config.update(EVENTS_BACKEND="memory", EXPIRY_SWEEP_INTERVAL=0, SLOW_REQUEST_SECONDS=float("inf"))
+    with app.app_context():
+        upgrade(db.engine)
+        db.session.add_all(Role(name=name) for name in ROLES)
+        db.session.commit()
+    return app
+
+
+def sign_up(app, email, role):
+    client = app.test_client()
+    response = client.post("/sign-up", json={
+        "email": email, "password": PASSWORD, "city": "City", "pincode": "560001", "contact": "0", "role": role,
+    })
+    assert response.status_code == 201, response.get_json()
+    response = client.post("/auth-login", json={"email": email, "password": PASSWORD})
+    assert response.status_code == 200, response.get_json()
+    return {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+
+def listed_item(app, retailer, quantity):
+    """Id of a new listed item of ``quantity`` units, with its dates from the stub model."""
+    app.config["SHELF_LIFE_ASYNC"] = False
+    client = app.test_client()
+    response = client.post("/retailers/add_item", json={"name": "Rice", "quantity": quantity}, headers=retailer)
+    assert response.status_code == 201, response.get_json()
+    item_id = response.get_json()["id"]
+    response = client.post(f"/retailers/inventory/{item_id}/list", headers=retailer)
+    assert response.status_code == 200, response.get_json()
+    return item_id
+
+
+def race(app, calls, threads):
+    """Run ``calls`` (``(method, url, json, headers)``) from ``threads`` threads released together.
+
+    Returns ``([(status, body)] in call order, seconds)``.
+    """
+    results = [None] * len(calls)
+    start = threading.Barrier(threads)
+
+    def run(offset):
+        client = app.test_client()
+        start.wait()
+        for index in range(offset, len(calls), threads):
+            method, url, json, headers = calls[index]
+            response = client.open(url, method=method, json=json, headers=headers)
+            results[index] = (response.status_code, response.get_json())
+
+    workers = [threading.Thread(target=run, args=(offset,)) for offset in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results, time.perf_counter() - started
+
+
+def item_state(app, item_id):
+    """``(quantity, held_quantity, {request status: total quantity})`` of the item, from the database."""
+    from foodloop_app import db
+    from foodloop_app.models import FoodRequest, InventoryItem
+
+    with app.app_context():
+        item = db.session.get(InventoryItem, item_id)
+        totals = Counter()
+        for status, quantity in db.session.query(FoodRequest.status, FoodRequest.quantity).filter(
+            FoodRequest.inventory_item_id == item_id
+        ):
+            totals[status] += quantity
+        state = item.quantity, item.held_quantity, dict(totals)
+        db.session.remove()
+    return state
+
+
+def run(app, quantity=50, requests=200, threads=16, approvers=4):
+    """Race holds, then approvals, on one item; raises ``AssertionError`` if a check fails."""
+    retailer = sign_up(app, "holds-retailer@example.com", "Retailer")
+    ngo = sign_up(app, "holds-ngo@example.com", "Ngo")
+    item_id = listed_item(app, retailer, quantity)
+
+    calls = [("POST", "/ngo/request", {"inventory_item_id": item_id, "quantity": 1}, ngo)] * requests
+    holds, hold_seconds = race(app, calls, threads)
+    statuses = Counter(status for status, _ in holds)
+    assert statuses[201] == min(quantity, requests), f"expected {min(quantity, requests)} holds, got {dict(statuses)}"
+    assert statuses[201] + statuses[409] == requests, f"unexpected responses: {dict(statuses)}"
+    _, held, totals = item_state(app, item_id)
+    assert held == totals.get("pending", 0) == statuses[201], (
+        f"held_quantity {held:g} != pending requests {totals.get('pending', 0):g}"
+    )
+
+    request_ids = [body["id"] for status, body in holds if status == 201]
+    calls = [
+        ("POST", f"/retailers/requests/{request_id}/approve", None, retailer)
+        for request_id in request_ids
+        for _ in range(approvers)
+    ]
+    approvals, approve_seconds = race(app, calls, threads)
+    approval_statuses = Counter(status for status, _ in approvals)
+    assert approval_statuses.keys() <= {200, 404, 409}, f"unexpected responses: {dict(approval_statuses)}"
+    applied = Counter(calls[index][1] for index, (status, _) in enumerate(approvals) if status == 200)
+    duplicates = sum(count - 1 for count in applied.values())
+    assert duplicates == 0, f"{duplicates} approvals applied more than once"
+    assert len(applied) == len(request_ids), f"{len(request_ids) - len(applied)} requests were never approved"
+    remaining, held, totals = item_state(app, item_id)
+    assert held == 0, f"{held:g} still held after every request was approved"
+    assert totals == {"approved": len(request_ids)}, f"request totals by status: {totals}"
+    assert remaining == quantity - len(request_ids), f"quantity {remaining:g}, expected {quantity - len(request_ids)}"
+    return Result(statuses[201], statuses[409], len(applied), duplicates, hold_seconds, approve_seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quantity", type=int, default=50, help="units of the listed item")
+    parser.add_argument("--requests", type=int, default=200, help="one-unit hold requests")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--approvers", type=int, default=4, help="concurrent approvals of each request")
+    parser.add_argument("--database-url", help="empty scratch database to use instead of a SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = build_app(args.database_url or f"sqlite:///{os.path.join(directory, 'holds.sqlite3')}")
+        try:
+            result = run(app, args.quantity, args.requests, args.threads, args.approvers)
+        except AssertionError as e:
+            print(f"FAILED: {e}")
+            sys.exit(1)
+    print(f"{result.held} of {args.requests} requests held {args.quantity} units ({result.rejected} rejected) "
+          f"in {result.hold_seconds * 1000:.0f} ms from {args.threads} threads")
+    print(f"{result.approved} requests approved once each from {args.approvers} concurrent approvals "
+          f"in {result.approve_seconds * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Query plans and timings of the hot filters, before and after the index migration.
+
+Seeds a throwaway SQLite database (about a million rows by default) with the
+schema as it was before the indexes existed, runs the hot queries, applies
+``foodloop_app.migrations.upgrade`` and runs them again.
+
+    python -m benchmarks.index_plan [--rows 1000000] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, inspect, select, text
+
+from foodloop_app import db
+from foodloop_app.migrations import upgrade
+from foodloop_app.models import Food, FoodRequest, InventoryItem, User
+
+PINCODES = 500
+
+
+def create_unindexed_schema(engine):
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            for index in inspect(conn).get_indexes(table.name):
+                conn.exec_driver_sql(f'DROP INDEX "{index["name"]}"')
+
+
+def seed(engine, rows):
+    users = max(rows // 100, 10)
+    foods = max(rows // 10, 10)
+    items = max(rows * 4 // 10, 10)
+    requests = max(rows - users - foods - items, 10)
+    now = datetime.utcnow()
+    rng = random.Random(42)
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            'INSERT INTO "user" (id, email, password, active, city, pincode, contact, fs_uniquifier) '
+            "VALUES (?, ?, 'x', 1, 'City', ?, '0', ?)",
+            [(i, f"user{i}@example.com", str(560000 + i % PINCODES), f"u{i}") for i in range(1, users + 1)],
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO food (id, name, name_lower, created_at) VALUES (?, ?, ?, ?)",
+            [(i, f"Food {i}", f"food {i}", now) for i in range(1, foods + 1)],
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO inventory_item (id, user_id, food_id, quantity, best_before, expires_at, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    i, rng.randint(1, users), (i - 1) % foods + 1, rng.choice([0, rng.uniform(1, 50)]),
+                    now + timedelta(days=7), now + timedelta(days=21),
+                    "Listing" if rng.random() < 0.05 else "Selling",
+                )
+                for i in range(1, items + 1)
+            ],
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO food_request (id, inventory_item_id, requester_id, quantity, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    i, rng.randint(1, items), rng.randint(1, users), rng.uniform(1, 10),
+                    rng.choice(["pending", "approved", "ignored"]),
+                    now - timedelta(days=rng.randint(0, 365)),
+                )
+                for i in range(1, requests + 1)
+            ],
+        )
+    return users, foods, items, requests
+
+
+def hot_queries(users):
+    user_id = users // 2
+    pincode = str(560000 + user_id % PINCODES)
+    return {
+        "add_item name lookup (ilike)": select(Food.id).where(Food.name.ilike("food 4242")),
+        "add_item name lookup (name_lower)": select(Food.id).where(Food.name_lower == "food 4242"),
+        "inventory by user": select(InventoryItem.id, Food.name)
+        .join(Food, InventoryItem.food_id == Food.id)
+        .where(InventoryItem.user_id == user_id),
+        "nearby listings by pincode": select(InventoryItem.id, Food.name)
+        .join(Food, InventoryItem.food_id == Food.id)
+        .join(User, InventoryItem.user_id == User.id)
+        .where(InventoryItem.status == "Listing", User.pincode == pincode, InventoryItem.quantity > 0),
+        "requests to a retailer": select(FoodRequest.id)
+        .join(InventoryItem, FoodRequest.inventory_item_id == InventoryItem.id)
+        .where(InventoryItem.user_id == user_id),
+        "requests by an NGO": select(FoodRequest.id).where(FoodRequest.requester_id == user_id),
+        "pending requests last 30 days": select(func.count(FoodRequest.id)).where(
+            FoodRequest.status == "pending",
+            FoodRequest.created_at >= datetime.utcnow() - timedelta(days=30),
+        ),
+    }
+
+
+def measure(engine, queries, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for label, query in queries.items():
+            compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+            plan = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+            started = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(query).all()
+            elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+            results[label] = (elapsed_ms, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="total rows to seed")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.sqlite3')}")
+        create_unindexed_schema(engine)
+        started = time.perf_counter()
+        users, foods, items, requests = seed(engine, args.rows)
+        print(
+            f"Seeded {users} users, {foods} foods, {items} inventory items, {requests} requests "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+        queries = hot_queries(users)
+        before = measure(engine, queries, args.repeat)
+        started = time.perf_counter()
+        upgrade(engine)
+        print(f"Migration (index build) took {time.perf_counter() - started:.1f}s\n")
+        after = measure(engine, queries, args.repeat)
+
+        for label in queries:
+            before_ms, before_plan = before[label]
+            after_ms, after_plan = after[label]
+            print(f"{label}: {before_ms:.2f} ms -> {after_ms:.2f} ms")
+            print(f"  before: {' | '.join(before_plan)}")
+            print(f"  after:  {' | '.join(after_plan)}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Throughput of the production server by worker count.
+
+Starts gunicorn with ``gunicorn.conf.py`` once per worker count on a local
+port, waits for ``/readyz``, then sends ``GET --path`` as a load-test NGO
+from ``--clients`` client processes (one keep-alive connection each) for
+``--duration`` seconds and reports requests per second and latency
+percentiles. Uses the app's configured database; run
+``flask --app run init-db`` first.
+
+    python -m benchmarks.load_test [--workers 1 2 4] [--threads 8] [--clients 16] [--duration 10]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACCOUNT = {
+    "email": "loadtest-ngo@example.com",
+    "password": "loadtest-password",
+    "city": "Bangalore",
+    "pincode": "560001",
+    "contact": "0000000000",
+    "role": "Ngo",
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def call(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers={"Content-Type": "application/json", **(headers or {})})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def start_server(port, workers, threads):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+               BIND=f"127.0.0.1:{port}", GUNICORN_ACCESS_LOG="", GUNICORN_LOG_LEVEL="warning")
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"], cwd=ROOT, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if call(port, "GET", "/readyz")[0] == 200:
+                return server
+        except OSError:
+            pass
+        if server.poll() is not None:
+            raise SystemExit(f"gunicorn exited with status {server.returncode}")
+        time.sleep(0.2)
+    server.kill()
+    raise SystemExit("gunicorn did not become ready within 60s; did you run `flask --app run init-db`?")
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    started = time.perf_counter()
+    server.wait()
+    return time.perf_counter() - started
+
+
+def login(port):
+    status, body = call(port, "POST", "/sign-up", ACCOUNT)
+    if status not in (201, 409):
+        raise SystemExit(f"Sign-up failed ({status}): {body[:200]!r}")
+    status, body = call(port, "POST", "/auth-login", {"email": ACCOUNT["email"], "password": ACCOUNT["password"]})
+    if status != 200:
+        raise SystemExit(f"Login failed ({status}): {body[:200]!r}")
+    return json.loads(body)["token"]
+
+
+def client(args):
+    """One keep-alive connection sending requests until ``deadline``; returns (latencies, errors)."""
+    port, path, token, deadline = args
+    headers = {"Authorization": f"Bearer {token}"}
+    latencies, errors = [], 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while time.time() < deadline:
+        started = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        if response.status != 200:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent client processes")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per worker count")
+    parser.add_argument("--path", default="/ngo/filtered_food", help="GET endpoint to load")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients on GET {args.path} for {args.duration:g}s, {args.threads} threads per worker")
+    with multiprocessing.Pool(args.clients) as pool:
+        for workers in args.workers:
+            port = free_port()
+            server = start_server(port, workers, args.threads)
+            try:
+                token = login(port)
+                call(port, "GET", args.path, headers={"Authorization": f"Bearer {token}"})  # warm up
+                deadline = time.time() + args.duration
+                results = pool.map(client, [(port, args.path, token, deadline)] * args.clients)
+            finally:
+                shutdown_s = stop_server(server)
+            latencies = sorted(latency for result, _ in results for latency in result)
+            errors = sum(errors for _, errors in results)
+            print(
+                f"workers={workers}: {len(latencies) / args.duration:8.1f} req/s  "
+                f"p50 {percentile(latencies, 0.5) * 1000:6.1f} ms  p99 {percentile(latencies, 0.99) * 1000:6.1f} ms  "
+                f"errors {errors}  shutdown {shutdown_s:.1f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Login throughput by password hash setting and hashing pool size.
+
+For each hash setting (scheme and cost, as set by the ``PASSWORD_*``
+variables of ``foodloop_app.passwords``) and each ``--pool`` size (0: hash
+on the request thread), builds the app on a scratch SQLite database with one
+user, measures the time of one hash, then sends ``POST /auth-login`` from
+``--threads`` threads for ``--duration`` seconds while another thread polls
+``/healthz``. Reports logins per second, login latency, and the latency of
+the health checks, i.e. how much the hashing slows everything else down.
+
+    python -m benchmarks.password_hashing [--threads 8] [--duration 5] [--pool 0 2 4]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.load_test import percentile
+
+PASSWORD = "benchmark-password"
+EMAIL = "hash-bench@example.com"
+
+SETTINGS = {
+    "argon2 (default cost)": {"PASSWORD_HASH_SCHEME": "argon2"},
+    "argon2 t=2 m=19MiB p=1": {
+        "PASSWORD_HASH_SCHEME": "argon2", "PASSWORD_ARGON2_TIME_COST": "2",
+        "PASSWORD_ARGON2_MEMORY_COST": "19456", "PASSWORD_ARGON2_PARALLELISM": "1",
+    },
+    "bcrypt rounds=12": {"PASSWORD_HASH_SCHEME": "bcrypt", "PASSWORD_BCRYPT_ROUNDS": "12"},
+    "bcrypt rounds=10": {"PASSWORD_HASH_SCHEME": "bcrypt", "PASSWORD_BCRYPT_ROUNDS": "10"},
+    "pbkdf2_sha256 600k": {"PASSWORD_HASH_SCHEME": "pbkdf2_sha256", "PASSWORD_PBKDF2_ROUNDS": "600000"},
+}
+VARIABLES = {name for setting in SETTINGS.values() for name in setting} | {"PASSWORD_HASH_WORKERS"}
+
+
+def build_app(directory, setting, pool):
+    from foodloop_app import create_app, db, passwords
+    from foodloop_app.models import ROLES, Role, User
+
+    for name in VARIABLES:
+        os.environ.pop(name, None)
+    os.environ.update(SETTINGS[setting], PASSWORD_HASH_WORKERS=str(pool))
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, f'{len(os.listdir(directory))}.sqlite3')}"
+    app = create_app()
+    app.config["SLOW_REQUEST_SECONDS"] = float("inf")
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Role(name=name) for name in ROLES)
+        password_hash = passwords.hash_password(PASSWORD)  # also starts the pool
+        started = time.perf_counter()
+        for _ in range(3):
+            passwords.hash_password(PASSWORD)
+        hash_ms = (time.perf_counter() - started) * 1000 / 3
+        db.session.add(User(email=EMAIL, password=password_hash, active=True, city="City", pincode="560001",
+                            contact="0", fs_uniquifier="hash-bench"))
+        db.session.commit()
+    return app, hash_ms
+
+
+def run(app, threads, duration):
+    deadline = time.monotonic() + duration
+    logins, errors, probes = [], [0], []
+    lock = threading.Lock()
+
+    def login():
+        client = app.test_client()
+        latencies = []
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = client.post("/auth-login", json={"email": EMAIL, "password": PASSWORD})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            logins.extend(latencies)
+
+    def probe():
+        client = app.test_client()
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            client.get("/healthz")
+            probes.append(time.perf_counter() - started)
+            time.sleep(0.01)
+
+    workers = [threading.Thread(target=login) for _ in range(threads)] + [threading.Thread(target=probe)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sorted(logins), errors[0], sorted(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8, help="concurrent login threads")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per setting")
+    parser.add_argument("--pool", type=int, nargs="+", default=[0, 2], help="hashing pool sizes to compare")
+    parser.add_argument("--settings", nargs="+", choices=sorted(SETTINGS), default=list(SETTINGS))
+    args = parser.parse_args()
+
+    os.environ.setdefault("GEMINI_BACKEND", "stub")
+    print(f"{args.threads} login threads, {args.duration:g}s per setting, {os.cpu_count()} CPUs")
+    print(f"{'setting':26} {'pool':>4} {'hash ms':>8} {'logins/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6} {'healthz p99 ms':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        for setting in args.settings:
+            for pool in args.pool:
+                app, hash_ms = build_app(directory, setting, pool)
+                logins, errors, probes = run(app, args.threads, args.duration)
+                print(
+                    f"{setting:26} {pool:4} {hash_ms:8.1f} {len(logins) / args.duration:9.1f} "
+                    f"{percentile(logins, 0.5) * 1000:8.1f} {percentile(logins, 0.99) * 1000:8.1f} {errors:6} "
+                    f"{percentile(probes, 0.99) * 1000:15.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Serialization cost of the list endpoints' rows, per encoder and JSON provider.
+
+Selects ``--rows`` rows (default 100k) of each list endpoint's projection
+from the benchmark dataset (``--scale small`` has 100k items and 200k
+requests), then times turning them into response bytes:
+
+* ``orm`` (inventory only): items loaded as ORM objects, dicts built with
+  ``isoformat()`` per date, Flask's default provider, as routes used to do;
+* ``render``: a dict per row from each field's render function, with
+  ``isoformat()`` per date, and Flask's default provider;
+* ``encoder+json``: the row encoder of pagination.py and the
+  standard library provider of json_provider.py;
+* ``encoder+orjson``: the same encoder and the orjson provider.
+
+Fetch is the query time; encode and dump are the row to dict and dict to
+bytes steps, best of ``--repeat`` runs. Speedup is against ``render``.
+
+    python -m benchmarks.serialization [--dataset PATH] [--rows 100000] [--repeat 3]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import dataset
+
+
+def best_of(repeat, fn):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def cases():
+    """(name, fields, make_query) of each list endpoint, without the per-user filter."""
+    from foodloop_app import db
+    from foodloop_app.models import Food, FoodRequest, InventoryItem, User
+    from foodloop_app.ngo_routes import LISTING_FIELDS, MY_REQUEST_FIELDS
+    from foodloop_app.retailer_routes import FOOD_REQUEST_FIELDS, INVENTORY_FIELDS
+
+    return [
+        ("retailer.inventory", INVENTORY_FIELDS, lambda columns: db.session.query(*columns)
+            .select_from(InventoryItem).join(Food, InventoryItem.food_id == Food.id)),
+        ("retailer.requested_food", FOOD_REQUEST_FIELDS, lambda columns: db.session.query(*columns)
+            .select_from(FoodRequest).join(InventoryItem, FoodRequest.inventory_item_id == InventoryItem.id)),
+        ("ngo.filtered_food", LISTING_FIELDS, lambda columns: db.session.query(*columns)
+            .select_from(User).join(InventoryItem, InventoryItem.user_id == User.id)
+            .join(Food, InventoryItem.food_id == Food.id)),
+        ("ngo.my_requests", MY_REQUEST_FIELDS, lambda columns: db.session.query(*columns)
+            .select_from(FoodRequest).join(InventoryItem, FoodRequest.inventory_item_id == InventoryItem.id)
+            .join(Food, InventoryItem.food_id == Food.id)),
+    ]
+
+
+def render(fields, names, rows):
+    """Rows to dicts through each field's render, as pagination.py did before row encoders."""
+    renders = {
+        name: fields[name].render or (lambda row, key=fields[name].columns[0].key: row._mapping[key])
+        for name in names
+    }
+    return [{name: renders[name](row) for name in names} for row in rows]
+
+
+def orm_inventory(limit):
+    """Inventory rows as ORM objects and hand-built dicts."""
+    from sqlalchemy.orm import joinedload
+
+    from foodloop_app.models import InventoryItem
+
+    items = InventoryItem.query.options(joinedload(InventoryItem.food)).order_by(InventoryItem.id).limit(limit).all()
+    return items, lambda: [
+        {
+            "id": item.id,
+            "name": item.food.name,
+            "quantity": item.quantity,
+            "held_quantity": item.held_quantity,
+            "best_before": item.best_before.isoformat() if item.best_before else None,
+            "expires_at": item.expires_at.isoformat() if item.expires_at else None,
+            "status": item.status or "Selling",
+            "food_created_at": item.food.created_at.isoformat() if item.food.created_at else None,
+        }
+        for item in items
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", help="seeded SQLite file to use (created with --scale if missing)")
+    parser.add_argument("--scale", choices=sorted(dataset.SCALES), default="small")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from flask.json.provider import DefaultJSONProvider
+    from flask_security.utils import hash_password
+    from sqlalchemy import create_engine
+
+    from foodloop_app import create_app, json_provider
+    from foodloop_app.pagination import parse_fields, row_encoder, select_columns
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.dataset or os.path.join(directory, "dataset.sqlite3")
+        if not os.path.exists(path):
+            with create_app().app_context():
+                password_hash = hash_password(dataset.PASSWORD)
+            engine = create_engine(f"sqlite:///{path}")
+            print(f"Seeded {dataset.seed(engine, password_hash, args.scale)}")
+            engine.dispose()
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        app = create_app()
+        providers = {"default": DefaultJSONProvider(app), "json": json_provider.JSONProvider(app)}
+        if json_provider.orjson is not None:
+            providers["orjson"] = json_provider.OrjsonProvider(app)
+
+        print(f"{'endpoint':24} {'path':15} {'rows':>7} {'fetch ms':>9} {'encode ms':>10} {'dump ms':>8} "
+              f"{'total ms':>9} {'MB':>6} {'speedup':>8}")
+        with app.test_request_context():
+            for name, fields, make_query in cases():
+                names = parse_fields(fields)
+                columns = select_columns(fields, names)
+                fetch, rows = best_of(args.repeat, lambda: make_query(columns).limit(args.rows).all())
+                runs = []
+                if name == "retailer.inventory":
+                    started = time.perf_counter()
+                    items, build = orm_inventory(args.rows)
+                    orm_fetch = time.perf_counter() - started
+                    runs.append(("orm", orm_fetch, build, providers["default"]))
+                runs.append(("render", fetch, lambda: render(fields, names, rows), providers["default"]))
+                for provider in ("json", "orjson"):
+                    if provider in providers:
+                        app.json = providers[provider]  # what row_encoder checks for ISO datetimes
+                        encode = row_encoder(fields, names, columns)
+                        runs.append((f"encoder+{provider}", fetch, lambda encode=encode: [encode(row) for row in rows],
+                                     providers[provider]))
+                results = []
+                for label, fetched, build, provider in runs:
+                    app.json = provider
+                    encoded, items = best_of(args.repeat, build)
+                    if isinstance(provider, json_provider.JSONProvider):
+                        dump = lambda: provider.dumps_bytes(items, compact=True)
+                    else:
+                        dump = lambda: provider.dumps(items, separators=(",", ":")).encode()
+                    dumped, body = best_of(args.repeat, dump)
+                    results.append((label, len(items), fetched, encoded, dumped, len(body)))
+                baseline = next(sum(result[2:5]) for result in results if result[0] == "render")
+                for label, count, fetched, encoded, dumped, size in results:
+                    total = fetched + encoded + dumped
+                    print(f"{name:24} {label:15} {count:7} {fetched * 1000:9.1f} {encoded * 1000:10.1f} "
+                          f"{dumped * 1000:8.1f} {total * 1000:9.1f} {size / 1e6:6.1f} {baseline / total:7.2f}x")
+
+if __name__ == "__main__":
+    main()
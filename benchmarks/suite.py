@@ -0,0 +1,397 @@
+"""Route latency, throughput and query-count regression suite.
+
+Seeds the synthetic dataset of ``benchmarks.dataset`` (or copies the one in
+``--dataset``, seeding it there first if the file does not exist), then:
+
+1. calls every route of the auth, retailer, NGO and farmer blueprints
+   ``--repeat`` times through the Flask test client, recording latency and
+   the SQL statements each call runs (on every engine);
+2. unless ``--skip-load``, starts gunicorn on the same database and sends a
+   mix of the main read routes and NGO requests from ``--clients`` client
+   processes for ``--load-duration`` seconds.
+
+Model calls go to the deterministic ``stub`` backend. The results (p50, p95
+and p99 latency per route, median statements per call, load throughput) are
+compared with ``--baseline``. The run exits with status 1 when a latency
+grows by more than ``--tolerance`` (and at least ``--min-ms``), a route runs
+more statements, or throughput falls by more than ``--tolerance``.
+Baselines are machine specific; record one with ``--save-baseline`` on the
+machine that runs the comparison.
+
+    python -m benchmarks.suite [--scale small] [--repeat 30] [--dataset PATH] [--save-baseline]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from benchmarks import dataset
+from benchmarks.load_test import call, free_port, percentile, start_server, stop_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# role keys the Authorization header in ctx.headers: that role's access token, or e.g. "Retailer.refresh"
+Scenario = namedtuple("Scenario", "name role request expect prepare", defaults=(200, None))
+
+# Routes called through the test client, in order: later scenarios use what earlier ones created
+SCENARIOS = [
+    Scenario("auth.sign_up", None, lambda ctx, i: ("POST", "/sign-up", {
+        "email": f"new{i}-{ctx.run}@bench.example", "password": dataset.PASSWORD, "city": "Bangalore",
+        "pincode": dataset.pincode(0), "contact": "0000000000", "role": "Ngo",
+    }), 201),
+    Scenario("auth.login", None, lambda ctx, i: ("POST", "/auth-login", {
+        "email": dataset.user_email("Retailer", 0), "password": dataset.PASSWORD,
+    })),
+    Scenario("auth.refresh", "Retailer.refresh", lambda ctx, i: ("POST", "/auth-refresh", None)),
+    Scenario("auth.logout", "Retailer.logout", lambda ctx, i: ("POST", "/auth-logout", None),
+             prepare=lambda ctx, i: ctx.mint_logout_token()),
+    Scenario("retailer.get_inventory", "Retailer", lambda ctx, i: ("GET", "/retailers/inventory", None)),
+    Scenario("retailer.add_inventory_item", "Retailer", lambda ctx, i: ("POST", "/retailers/add_item", {
+        "name": f"Bench food {ctx.run} {i}", "quantity": 10,
+    }), 201),
+    Scenario("retailer.add_inventory_items", "Retailer", lambda ctx, i: ("POST", "/retailers/add_items", [
+        {"name": f"Food {(i * 20 + k) % ctx.foods + 1}", "quantity": 1} for k in range(20)
+    ])),
+    Scenario("retailer.sell_inventory_item", "Retailer", lambda ctx, i: (
+        "POST", f"/retailers/inventory/{ctx.stock_item}/sell", {"quantity": 1},
+    )),
+    Scenario("retailer.list_inventory_item", "Retailer", lambda ctx, i: (
+        "POST", f"/retailers/inventory/{ctx.new_items[i]}/list", None,
+    )),
+    Scenario("retailer.get_notifications", "Retailer", lambda ctx, i: ("GET", "/retailers/notifications", None)),
+    Scenario("retailer.ignore_notification", "Retailer", lambda ctx, i: (
+        "POST", f"/retailers/food/{ctx.new_items[i]}/ignore", None,
+    )),
+    Scenario("retailer.get_food_enrichment", "Retailer", lambda ctx, i: (
+        "GET", f"/retailers/food/{ctx.new_foods[i]}/enrichment", None,
+    )),
+    Scenario("retailer.get_shelf_life_cache_stats", None, lambda ctx, i: (
+        "GET", "/retailers/shelf_life_cache/stats", None,
+    )),
+    Scenario("retailer.get_food_requests", "Retailer", lambda ctx, i: ("GET", "/retailers/requested_food", None)),
+    Scenario("ngo.get_nearby_food", "Ngo", lambda ctx, i: ("GET", "/ngo/filtered_food", None)),
+    Scenario("ngo.get_nearby_food.uncached", "Ngo", lambda ctx, i: ("GET", "/ngo/filtered_food", None),
+             prepare=lambda ctx, i: ctx.invalidate_feed()),
+    Scenario("ngo.create_food_request", "Ngo", lambda ctx, i: ("POST", "/ngo/request", {
+        "inventory_item_id": ctx.listing_item, "quantity": 1,
+    }), 201),
+    Scenario("ngo.get_my_requests", "Ngo", lambda ctx, i: ("GET", "/ngo/my_requests", None)),
+    Scenario("retailer.approve_request", "Retailer", lambda ctx, i: (
+        "POST", f"/retailers/requests/{ctx.requests[i]}/approve", None,
+    )),
+    Scenario("retailer.ignore_request", "Retailer", lambda ctx, i: (
+        "POST", f"/retailers/requests/{ctx.requests[-1]}/ignore", None,
+    ), prepare=lambda ctx, i: ctx.place_request()),
+    Scenario("retailer.remove_inventory_item", "Retailer", lambda ctx, i: (
+        "DELETE", f"/retailers/item/remove/{ctx.new_items[i]}", None,
+    )),
+    Scenario("farmer.simple_demand_forecast", "Farmer", lambda ctx, i: (
+        "GET", "/farmer/simple_demand_forecast", None,
+    )),
+    Scenario("farmer.get_demand_forecast", "Farmer", lambda ctx, i: ("GET", "/farmer/demand_forecast", None)),
+    Scenario("events.long_poll", "Ngo", lambda ctx, i: ("GET", "/events?timeout=0", None)),
+]
+
+# Requests the load generator cycles through: (label, role, method, path, body)
+LOAD_MIX = [
+    ("retailer.get_inventory", "Retailer", "GET", "/retailers/inventory", None),
+    ("retailer.get_food_requests", "Retailer", "GET", "/retailers/requested_food", None),
+    ("retailer.get_notifications", "Retailer", "GET", "/retailers/notifications", None),
+    ("ngo.get_nearby_food", "Ngo", "GET", "/ngo/filtered_food", None),
+    ("ngo.get_my_requests", "Ngo", "GET", "/ngo/my_requests", None),
+    ("ngo.create_food_request", "Ngo", "POST", "/ngo/request", {"quantity": 0.01}),
+    ("farmer.get_demand_forecast", "Farmer", "GET", "/farmer/demand_forecast", None),
+    ("farmer.simple_demand_forecast", "Farmer", "GET", "/farmer/simple_demand_forecast", None),
+]
+
+
+def prepare_database(args, directory):
+    """A fresh working copy of the seeded dataset; returns its path."""
+    from flask_security.utils import hash_password
+    from sqlalchemy import create_engine
+
+    from foodloop_app import create_app
+
+    template = args.dataset or os.path.join(directory, "dataset.sqlite3")
+    if not os.path.exists(template):
+        with create_app().app_context():
+            password_hash = hash_password(dataset.PASSWORD)
+        engine = create_engine(f"sqlite:///{template}")
+        started = time.perf_counter()
+        counts = dataset.seed(engine, password_hash, args.scale, args.seed)
+        engine.dispose()
+        print(f"Seeded {counts} in {time.perf_counter() - started:.1f}s")
+    path = os.path.join(directory, "work.sqlite3")
+    source, target = sqlite3.connect(template), sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return path
+
+
+def build_context(app, client):
+    """Logins and fixture rows of the first retailer, NGO and farmer, who share a pincode."""
+    from foodloop_app import db, feed_cache, forecasting
+    from foodloop_app.models import Food, InventoryItem, User
+
+    ctx = SimpleNamespace(run=int(time.time()), new_items=[], new_foods=[], requests=[], headers={})
+    with app.app_context():
+        retailer = User.query.filter_by(email=dataset.user_email("Retailer", 0)).one()
+        retailer_identity = retailer.fs_uniquifier
+        ctx.foods = Food.query.count()
+        now = datetime.utcnow()
+        fixtures = []
+        for name, status in ((f"Bench stock {ctx.run}", "Selling"), (f"Bench listing {ctx.run}", "Listing")):
+            food = Food(name=name)
+            item = InventoryItem(
+                user_id=retailer.id, food=food, quantity=1e9, held_quantity=0, status=status,
+                best_before=now + timedelta(days=30), expires_at=now + timedelta(days=60),
+            )
+            db.session.add(item)
+            fixtures.append(item)
+        db.session.commit()
+        ctx.stock_item, ctx.listing_item = (item.id for item in fixtures)
+        forecasting.refresh([retailer.pincode])
+        db.session.commit()
+        ctx.pincode = retailer.pincode
+
+    for role in ("Retailer", "Ngo", "Farmer"):
+        response = client.post("/auth-login", json={"email": dataset.user_email(role, 0), "password": dataset.PASSWORD})
+        ctx.headers[role] = {"Authorization": f"Bearer {response.get_json()['token']}"}
+        ctx.headers[f"{role}.refresh"] = {"Authorization": f"Bearer {response.get_json()['refresh_token']}"}
+
+    def mint_logout_token():
+        # Every logout revokes its token, so each call gets a new one without a password login
+        from flask_jwt_extended import create_access_token
+
+        with app.app_context():
+            token = create_access_token(identity=retailer_identity)
+        ctx.headers["Retailer.logout"] = {"Authorization": f"Bearer {token}"}
+
+    def invalidate_feed():
+        with app.app_context():
+            feed_cache.invalidate_pincodes([ctx.pincode])
+            db.session.commit()
+
+    def place_request():
+        response = client.post("/ngo/request", json={"inventory_item_id": ctx.listing_item, "quantity": 1},
+                               headers=ctx.headers["Ngo"])
+        ctx.requests.append(response.get_json()["id"])
+
+    ctx.invalidate_feed, ctx.place_request, ctx.mint_logout_token = invalidate_feed, place_request, mint_logout_token
+    return ctx
+
+
+def run_routes(app, repeat):
+    """Latency and statement counts of every scenario through the test client, and its context."""
+    from foodloop_app import db
+    from foodloop_app.query_counter import count_queries
+
+    client = app.test_client()
+    ctx = build_context(app, client)
+    with app.app_context():
+        engines = list(db.engines.values())
+    results = {}
+    for scenario in SCENARIOS:
+        latencies, statement_counts = [], []
+        for i in range(repeat):
+            if scenario.prepare:
+                scenario.prepare(ctx, i)
+            method, path, body = scenario.request(ctx, i)
+            headers = ctx.headers.get(scenario.role, {})
+            with ExitStack() as stack:
+                statements = [stack.enter_context(count_queries(engine)) for engine in engines]
+                started = time.perf_counter()
+                response = client.open(path, method=method, json=body, headers=headers)
+                latencies.append(time.perf_counter() - started)
+            statement_counts.append(sum(len(executed) for executed in statements))
+            if response.status_code != scenario.expect:
+                raise SystemExit(
+                    f"{scenario.name}: expected {scenario.expect}, got {response.status_code}: "
+                    f"{response.get_data(as_text=True)[:300]}"
+                )
+            if scenario.name == "retailer.add_inventory_item":
+                created = response.get_json()
+                ctx.new_items.append(created["id"])
+                ctx.new_foods.append(created["food_id"])
+            elif scenario.name == "ngo.create_food_request":
+                ctx.requests.append(response.get_json()["id"])
+        results[scenario.name] = dict(summarize(latencies), queries=sorted(statement_counts)[len(statement_counts) // 2])
+    return results, ctx
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        f"p{round(fraction * 100)}_ms": round(percentile(latencies, fraction) * 1000, 3)
+        for fraction in (0.5, 0.95, 0.99)
+    }
+
+
+def mixed_client(args):
+    """One keep-alive connection cycling through ``requests`` until ``deadline``."""
+    port, requests, offset, deadline = args
+    latencies = {label: [] for label, *_ in requests}
+    errors = 0
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    n = offset
+    while time.time() < deadline:
+        label, method, path, body, headers = requests[n % len(requests)]
+        n += 1
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                         headers={"Content-Type": "application/json", **headers})
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        if response.status >= 400:
+            errors += 1
+        latencies[label].append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+
+def run_load(args, listing_item):
+    port = free_port()
+    server = start_server(port, args.workers, args.threads)
+    try:
+        headers = {}
+        for role in ("Retailer", "Ngo", "Farmer"):
+            status, body = call(port, "POST", "/auth-login",
+                                {"email": dataset.user_email(role, 0), "password": dataset.PASSWORD})
+            if status != 200:
+                raise SystemExit(f"Load test login failed ({status}): {body[:200]!r}")
+            headers[role] = {"Authorization": f"Bearer {json.loads(body)['token']}"}
+        requests = [
+            (label, method, path, dict(body, inventory_item_id=listing_item) if body else None, headers[role])
+            for label, role, method, path, body in LOAD_MIX
+        ]
+        deadline = time.time() + args.load_duration
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.map(mixed_client, [(port, requests, n, deadline) for n in range(args.clients)])
+    finally:
+        stop_server(server)
+    routes = {label: [] for label, *_ in LOAD_MIX}
+    for latencies, _ in results:
+        for label, values in latencies.items():
+            routes[label].extend(values)
+    total = sum(len(values) for values in routes.values())
+    return {
+        "throughput_rps": round(total / args.load_duration, 1),
+        "errors": sum(errors for _, errors in results),
+        "routes": {label: summarize(values) for label, values in routes.items()},
+    }
+
+
+def compare(results, baseline, tolerance, min_ms):
+    """Human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+
+    def latency(name, new, old):
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in old and new[key] > old[key] * (1 + tolerance) and new[key] - old[key] >= min_ms:
+                regressions.append(f"{name} {key}: {old[key]:.1f} -> {new[key]:.1f}")
+
+    for name, old in baseline.get("routes", {}).items():
+        new = results["routes"].get(name)
+        if new is None:
+            continue
+        latency(name, new, old)
+        if new["queries"] > old["queries"]:
+            regressions.append(f"{name} queries: {old['queries']} -> {new['queries']}")
+    old_load, new_load = baseline.get("load"), results.get("load")
+    if old_load and new_load:
+        if new_load["throughput_rps"] < old_load["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"load throughput: {old_load['throughput_rps']} -> {new_load['throughput_rps']} req/s")
+        for name, old in old_load["routes"].items():
+            if name in new_load["routes"]:
+                latency(f"load {name}", new_load["routes"][name], old)
+    return regressions
+
+
+def report(results):
+    print(f"\n{'route':40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for name, row in results["routes"].items():
+        print(f"{name:40} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['p99_ms']:9.2f} {row['queries']:8}")
+    load = results.get("load")
+    if load:
+        print(f"\nLoad: {load['throughput_rps']} req/s, {load['errors']} errors")
+        for name, row in load["routes"].items():
+            print(f"{name:40} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['p99_ms']:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(dataset.SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dataset", help="seeded SQLite file to reuse (created if missing); runs use a copy")
+    parser.add_argument("--repeat", type=int, default=30, help="test client calls per route")
+    parser.add_argument("--skip-load", action="store_true", help="skip the gunicorn load phase")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=8, help="load generator processes")
+    parser.add_argument("--load-duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative latency/throughput change")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = prepare_database(args, directory)
+        # Read by create_app here and by the gunicorn workers of the load phase
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        os.environ["GEMINI_BACKEND"] = "stub"
+        os.environ["LOG_LEVEL"] = "WARNING"
+
+        from foodloop_app import create_app
+
+        app = create_app()
+        # Synchronous stub estimates and no background sweep keep the statement counts repeatable
+        app.config.update(SHELF_LIFE_ASYNC=False, EXPIRY_SWEEP_INTERVAL=0, SLOW_REQUEST_SECONDS=float("inf"))
+        started = time.perf_counter()
+        routes, ctx = run_routes(app, args.repeat)
+        results = {"scale": args.scale, "repeat": args.repeat, "routes": routes}
+        print(f"Ran {len(SCENARIOS)} routes x {args.repeat} in {time.perf_counter() - started:.1f}s")
+        if not args.skip_load:
+            results["load"] = run_load(args, ctx.listing_item)
+
+    report(results)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; record one with --save-baseline")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("scale") != args.scale:
+        raise SystemExit(f"The baseline was recorded at scale {baseline.get('scale')!r}, not {args.scale!r}")
+    regressions = compare(results, baseline, args.tolerance, args.min_ms)
+    if regressions:
+        print("\nRegressions against the baseline:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
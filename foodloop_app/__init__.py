@@ -5,8 +5,13 @@ from flask_jwt_extended import JWTManager
 from flask_security.datastore import SQLAlchemyUserDatastore
 from flask_security.core import Security
 from datetime import timedelta
+import os
 
-db = SQLAlchemy()
+from . import database, json_provider, passwords
+from .routing import RoutingSession
+
+# GET requests read from the replica bind when one is configured (see routing.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 from .models import (
     User,
@@ -14,6 +19,16 @@ from .models import (
     InventoryItem,
     Food,
     FoodRequest,
+    ShelfLifeEstimate,
+    PincodeCentroid,
+    FeedVersion,
+    DailyDemand,
+    DemandForecast,
+    ForecastRun,
+    Notification,
+    SweepWatermark,
+    EventLog,
+    RevokedToken,
 )  
 
 
@@ -22,19 +37,123 @@ user_datastore = SQLAlchemyUserDatastore(db, User, Role)
 
 def create_app():
     app = Flask(__name__)
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///db.sqlite3"
+    # orjson when installed; JSON_PROVIDER=json forces the standard library (see json_provider.py).
+    # Set as the class too: Flask-Security wraps app.json_provider_class in its own provider.
+    app.json_provider_class = json_provider.provider_class()
+    app.json = app.json_provider_class(app)
+    # Database URL, pool and SQLite pragmas come from the environment (see database.py)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database.database_url()
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = database.engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    app.config["SQLALCHEMY_BINDS"] = database.binds()
+    app.config["SQLITE_PRAGMAS"] = database.sqlite_pragmas()
+    # Seconds a user's reads stay on the primary after they write (see routing.py)
+    app.config["READ_YOUR_WRITES_WINDOW"] = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
     app.config["SECRET_KEY"] = "super-secret"
     app.config["SECURITY_PASSWORD_SALT"] = "super-secret"
+    # Password hash scheme and cost, and the pool hashes run in (see passwords.py)
+    app.config["SECURITY_PASSWORD_HASH"] = os.getenv("PASSWORD_HASH_SCHEME", "argon2")
+    app.config["SECURITY_PASSWORD_HASH_PASSLIB_OPTIONS"] = passwords.passlib_options()
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # processes; 0 hashes inline
+    app.config["PASSWORD_HASH_MAX_PENDING"] = 64  # waiting hashes before sign-ins get 503
+    app.config["PASSWORD_HASH_TIMEOUT"] = 10  # seconds
     app.config["JWT_SECRET_KEY"] = "super-secret-jwt"
     app.config["SECURITY_REGISTERABLE"] = True
     app.config["WTF_CSRF_ENABLED"] = False  # Disable CSRF globally
     app.config["SECURITY_CSRF_PROTECT"] = False  # Disable CSRF for Flask-Security
-    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=1)
+    # Short-lived access tokens; clients renew them at /auth-refresh without the password
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(minutes=15)
+    app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=30)
+    app.config["JWT_REFRESH_TOKEN_RENEW_WITHIN"] = timedelta(days=15)  # then a refresh also rotates the refresh token
+    # Revoked tokens (see revocation.py); times in seconds
+    app.config["REVOCATION_SYNC_INTERVAL"] = 2  # how soon other workers reject a revoked token
+    app.config["REVOCATION_SYNC_OVERLAP"] = 60  # re-read window for late commits and clock skew between workers
+    app.config["REVOCATION_PRUNE_INTERVAL"] = 3600
+    app.config["REVOCATION_BLOOM_CAPACITY"] = 100000
+    app.config["REVOCATION_BLOOM_ERROR_RATE"] = 0.001
+    # Users resolved from access tokens (see identity.py)
+    app.config["IDENTITY_CACHE_TTL"] = 300  # seconds; bounds how long other workers serve a deleted user
+    app.config["IDENTITY_SYNC_INTERVAL"] = 5  # how soon other workers see a user update or deactivation
+    app.config["IDENTITY_SYNC_OVERLAP"] = 60  # re-read window for late commits and clock skew between workers
+    app.config["IDENTITY_CACHE_MAX_ENTRIES"] = 10000
+    # Persistent cache of Gemini shelf-life estimates (see shelf_life.py)
+    app.config["SHELF_LIFE_CACHE_TTL"] = timedelta(days=30)
+    app.config["SHELF_LIFE_CACHE_MAX_ENTRIES"] = 10000
+    app.config["SHELF_LIFE_BATCH_SIZE"] = 100  # item names per batched model prompt
+    # "gemini" or "stub" (offline, deterministic; for tests and benchmarks)
+    app.config["GEMINI_BACKEND"] = os.getenv("GEMINI_BACKEND", "gemini")
+    # Process-wide cap on model calls (see gemini.py)
+    app.config["GEMINI_CALLS_PER_SECOND"] = 2.0
+    app.config["GEMINI_BURST"] = 4
+    app.config["GEMINI_RATE_LIMIT_TIMEOUT"] = 30  # seconds a background call may wait for a slot
+    app.config["GEMINI_REQUEST_RATE_LIMIT_TIMEOUT"] = 2  # the same inside an HTTP request, which holds a worker
+    # Farmer demand insight text (see insights.py); times in seconds
+    app.config["INSIGHTS_CACHE_TTL"] = 6 * 60 * 60
+    app.config["INSIGHTS_RETRY_AFTER"] = 60
+    app.config["INSIGHTS_CACHE_MAX_ENTRIES"] = 5000
+    app.config["INSIGHTS_WORKERS"] = 2
+    # Local demand forecasts for farmers (see forecasting.py)
+    app.config["FORECAST_HISTORY_DAYS"] = 182
+    app.config["FORECAST_HORIZON_WEEKS"] = 12
+    app.config["FORECAST_MAX_AGE"] = timedelta(hours=24)  # older forecasts are recomputed in the background
+    app.config["FORECAST_WORKERS"] = 1
+    # Background shelf-life enrichment of new food types (see enrichment.py)
+    app.config["SHELF_LIFE_ASYNC"] = True
+    app.config["ENRICHMENT_WORKERS"] = 4
+    app.config["ENRICHMENT_MAX_ATTEMPTS"] = 3
+    app.config["ENRICHMENT_RETRY_BACKOFF"] = 2.0  # seconds, doubled per retry
+    app.config["BATCH_INTAKE_MAX_ROWS"] = 5000  # rows per /retailers/add_items call
+    # How long an NGO request holds its quantity before the retailer must act (see reservations.py)
+    app.config["REQUEST_HOLD_TTL"] = timedelta(hours=6)
+    # Seconds between expiry sweeps in each process; 0 turns them off (see notifications.py)
+    app.config["EXPIRY_SWEEP_INTERVAL"] = 300
+    # Keyset pagination of list endpoints (see pagination.py)
+    app.config["PAGE_SIZE_DEFAULT"] = 100
+    app.config["PAGE_SIZE_MAX"] = 1000
+    app.config["EXPORT_BATCH_SIZE"] = 1000  # rows fetched per round trip by ?format=ndjson
+    # Radius search of /ngo/filtered_food (see geo.py)
+    app.config["NEARBY_RADIUS_KM_DEFAULT"] = 10
+    app.config["NEARBY_RADIUS_KM_MAX"] = 100
+    app.config["FEED_CACHE_MAX_ENTRIES"] = 1024  # serialized feed pages kept per process (see feed_cache.py)
+    # Push channel for new requests and listings (see events.py); times in seconds
+    app.config["EVENTS_BACKEND"] = "database"  # or "memory" for a single worker
+    app.config["EVENTS_BUFFER_SIZE"] = 10000  # recent events kept per process
+    app.config["EVENTS_POLL_INTERVAL"] = 1.0
+    app.config["EVENTS_RETENTION"] = timedelta(hours=1)
+    app.config["EVENTS_GAP_WAIT"] = 5.0  # how long a missing event id may hold back later ones
+    app.config["EVENTS_LONG_POLL_TIMEOUT"] = 25
+    app.config["EVENTS_STREAM_MAX_AGE"] = 300  # then the client reconnects with Last-Event-ID
+    # Request, SQL and model-call metrics at /metrics (see metrics.py)
+    app.config["SLOW_REQUEST_SECONDS"] = float(os.getenv("SLOW_REQUEST_SECONDS", "1"))
+    app.config["METRICS_DIR"] = os.getenv("METRICS_DIR")  # shared by the workers of one server
+    app.config["METRICS_WRITE_INTERVAL"] = 10  # seconds
     CORS(app, resources={r"/*": {"origins": "*"}})
 
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            database.configure_engine(engine, app.config["SQLITE_PRAGMAS"])
+
+    from . import metrics, routing
+
+    metrics.register(app)
+    routing.register(app)
     jwt = JWTManager(app)
 
+    from .identity import register_user_loader
+
+    register_user_loader(jwt)
+
+    from . import revocation
+
+    revocation.register(jwt)
+
+    from .notifications import register_sweeper
+
+    register_sweeper(app)
+
+    from . import demand  # registers the demand rollup's FoodRequest events
+    from . import events  # registers delivery of published events on commit
+
     # Setup Flask-Security-Too
     security = Security(app, user_datastore)
 
@@ -43,10 +162,18 @@ def create_app():
     from .retailer_routes import retailer_bp
     from .ngo_routes import ngo_bp
     from .farmer_routes import farmer_bp
+    from .events_routes import events_bp
+    from .health_routes import health_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(retailer_bp)
     app.register_blueprint(ngo_bp)
     app.register_blueprint(farmer_bp)
+    app.register_blueprint(events_bp)
+    app.register_blueprint(health_bp)
+
+    from .cli import register_commands
+
+    register_commands(app)
 
     return app
@@ -1,25 +1,28 @@
 # backend/foodloop_app/auth_routes.py
+import time
 import uuid
 from flask import Blueprint, request, jsonify, current_app
-from flask_security.utils import hash_password, verify_password, login_user, logout_user
-from flask_jwt_extended import create_access_token
+from flask_security.utils import login_user, logout_user
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token, get_current_user, get_jwt
 from flask_security import roles_accepted, roles_required
 from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
 
 # Import db and user_datastore initialized in __init__.py
 from foodloop_app import db, user_datastore
 
 # Import models
-from .models import User, Role
+from .models import User, Role, ROLES
+from . import identity, passwords, revocation
+from .passwords import PasswordHashBusy
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/")
 
 
 @auth_bp.route("/sign-up", methods=["POST"])
 def sign_up():
-    print(f"data: {request.get_json()}")
-    print("Raw data:", request.data)
     data = request.get_json()
     if not data or not all(
         key in data
@@ -37,19 +40,24 @@ def sign_up():
     if User.query.filter_by(email=email).first():
         return jsonify({"error": "Email address is already registered"}), 409
 
-    print(f"Received role: {role_name}")
-    valid_roles = ["Retailer", "Ngo", "Farmer", "Admin"]
-    if role_name not in valid_roles:
+    if role_name not in ROLES:
         return jsonify({"error": f"Invalid role: {role_name}"}), 403
 
     role = Role.query.filter_by(name=role_name).first()
     if not role:
+        # Roles are created by `flask --app run init-db`
         return jsonify({"error": f"Role '{role_name}' not found"}), 400
 
+    try:
+        # Hashed in the password pool, not on this thread (see passwords.py)
+        password_hash = passwords.hash_password(password)
+    except PasswordHashBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
     try:
         user = User(
             email=email,
-            password=hash_password(password),
+            password=password_hash,
             active=True,
             city=city,
             pincode=pincode,
@@ -62,9 +70,8 @@ def sign_up():
         return jsonify({"message": "User created successfully"}), 201
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(
-            f"User creation failed: {e}, data received {request.get_json()}"
-        )
+        # Not the request body: it carries the password
+        current_app.logger.error("User creation failed for %s: %s", email, e)
         return (
             jsonify({"error": f"An error occurred during registration: {str(e)}"}),
             500,
@@ -73,9 +80,6 @@ def sign_up():
 
 @auth_bp.route("/auth-login", methods=["POST"])
 def login():
-    print("logn route")
-    print("Authorization header:", request.headers.get("Authorization"))
-
     data = request.get_json()
     if not data or not all(key in data for key in ["email", "password"]):
         return jsonify({"error": "Email and password are required"}), 402
@@ -85,13 +89,20 @@ def login():
 
     user = User.query.filter_by(email=email).first()
 
-    print("user exists")
-
-    if user and verify_password(password, user.password):
+    try:
+        # Also rehashes the password if the hash settings changed since it was stored
+        verified = user is not None and passwords.verify_and_update(user, password)
+    except PasswordHashBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
+    if verified:
+        if db.session.is_modified(user):
+            db.session.commit()  # Store the rehashed password
         login_user(user)
-
-        print("user logged in")
-        access_token = create_access_token(identity=email)
+        access_token = _access_token(user)
+        # Renews access tokens at /auth-refresh, so the password is not hashed again until it expires
+        refresh_token = create_refresh_token(identity=user.fs_uniquifier)
+        identity.remember(user)
         user_data = {
             "id": user.id,
             "email": user.email,
@@ -105,6 +116,8 @@ def login():
                 {
                     "message": "Login successful",
                     "token": access_token,
+                    "expires_in": _expires_in(),
+                    "refresh_token": refresh_token,
                     "user": user_data,
                 }
             ),
@@ -114,6 +127,53 @@ def login():
         return jsonify({"error": "Invalid email or password"}), 401
 
 
+def _access_token(user):
+    # Routes resolve the user from the token through identity.py's cache
+    return create_access_token(identity=user.fs_uniquifier)
+
+
+def _expires_in():
+    return int(current_app.config["JWT_ACCESS_TOKEN_EXPIRES"].total_seconds())
+
+
+@auth_bp.route("/auth-refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh():
+    # Inactive or deleted users are turned away by identity.py's user lookup
+    user = get_current_user()
+    response = {"token": _access_token(user), "expires_in": _expires_in()}
+
+    token = get_jwt()
+    renew_within = current_app.config["JWT_REFRESH_TOKEN_RENEW_WITHIN"]
+    if token["exp"] - time.time() < renew_within.total_seconds():
+        # Sliding sign-in: a fresh refresh token, and the old one stops working
+        response["refresh_token"] = create_refresh_token(identity=user.fs_uniquifier)
+        revocation.revoke(token)
+    return jsonify(response), 200
+
+
+@auth_bp.route("/auth-logout", methods=["POST"])
+@jwt_required(verify_type=False)
+def auth_logout():
+    # Revokes the token in the Authorization header (access or refresh) and the refresh token in the body
+    token = get_jwt()
+    refresh_token = (request.get_json(silent=True) or {}).get("refresh_token")
+    other = None
+    if refresh_token:
+        try:
+            other = decode_token(refresh_token, allow_expired=True)
+        except (JWTExtendedException, PyJWTError):
+            return jsonify({"error": "Invalid refresh token"}), 400
+        if other["sub"] != token["sub"]:
+            return jsonify({"error": "Refresh token belongs to another user"}), 400
+
+    revocation.revoke(token)
+    if other is not None:
+        revocation.revoke(other)
+    logout_user()
+    return jsonify({"message": "Logged out successfully"}), 200
+
+
 @auth_bp.route("/logout", methods=["POST"])
 def logout():
     logout_user()
@@ -0,0 +1,84 @@
+# foodloop_app/background.py
+"""Bounded thread pools for work that must not run on the request thread.
+
+Each named pool has its own worker limit, and every task runs inside an
+application context so it can use ``db.session`` like a view does.
+:func:`every` runs a task periodically on its own thread the same way.
+"""
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executors_lock = threading.Lock()
+_schedules = {}
+
+
+def _executor(name, max_workers):
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"foodloop-{name}")
+            _executors[name] = executor
+        return executor
+
+
+def submit(name, max_workers, fn, *args, **kwargs):
+    """Run ``fn(*args, **kwargs)`` on the ``name`` pool inside the current app's context."""
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                logger.error("Background task %s failed", getattr(fn, "__name__", fn), exc_info=True)
+                raise
+
+    return _executor(name, max_workers).submit(run)
+
+
+def every(name, interval, fn):
+    """Run ``fn()`` every ``interval`` seconds inside the current app's context.
+
+    Starts one daemon thread per ``name`` and process; later calls with the
+    same name do nothing. The first run is one interval after the start.
+    """
+    if name in _schedules:
+        return
+    app = current_app._get_current_object()
+    with _executors_lock:
+        if name in _schedules:
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                with app.app_context():
+                    try:
+                        fn()
+                    except Exception:
+                        logger.error("Scheduled task %s failed", name, exc_info=True)
+
+        _schedules[name] = stop
+        threading.Thread(target=run, name=f"foodloop-{name}", daemon=True).start()
+
+
+def shutdown(wait=True):
+    """Stop accepting background work and optionally wait for queued tasks."""
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+        for stop in _schedules.values():
+            stop.set()
+        _schedules.clear()
+    for executor in executors:
+        executor.shutdown(wait=wait)
+
+
+atexit.register(shutdown, wait=False)
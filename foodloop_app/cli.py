@@ -0,0 +1,108 @@
+# foodloop_app/cli.py
+"""Maintenance commands, run as ``flask --app run <command>``."""
+import time
+
+import click
+
+from foodloop_app import db
+
+
+def register_commands(app):
+    @app.cli.command("init-db")
+    def init_db():
+        """Create or upgrade the schema and add the user roles; run once per deploy, before the workers start."""
+        from .migrations import upgrade
+        from .models import ROLES, Role
+
+        upgrade(db.engine)
+        existing = {name for (name,) in db.session.query(Role.name)}
+        for name in ROLES:
+            if name not in existing:
+                db.session.add(Role(name=name))
+        db.session.commit()
+        click.echo("Database initialized with roles.")
+
+    @app.cli.command("upgrade-db")
+    def upgrade_db():
+        """Create missing tables and upgrade existing ones to the current models."""
+        from .migrations import upgrade
+
+        upgrade(db.engine)
+        click.echo("Database upgraded.")
+
+    @app.cli.command("sync-replica")
+    def sync_replica():
+        """Copy the SQLite primary onto the SQLite replica; for trying replica routing locally."""
+        import sqlite3
+
+        from .routing import REPLICA
+
+        engines = db.engines
+        if REPLICA not in engines:
+            raise click.ClickException("DATABASE_REPLICA_URL is not set.")
+        primary, replica = engines[None], engines[REPLICA]
+        if primary.dialect.name != "sqlite" or replica.dialect.name != "sqlite":
+            raise click.ClickException("sync-replica copies SQLite files; use the server's replication otherwise.")
+        source = sqlite3.connect(primary.url.database)
+        target = sqlite3.connect(replica.url.database)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        click.echo(f"Copied {primary.url.database} to {replica.url.database}.")
+
+    @app.cli.command("load-pincodes")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    def load_pincodes(path):
+        """Load pincode centroids (CSV with pincode, latitude, longitude) for radius search."""
+        from .geo import load_centroids, read_centroids
+
+        try:
+            centroids = read_centroids(path)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        db.create_all()
+        load_centroids(centroids)
+        click.echo(f"Loaded {len(centroids)} pincode centroids.")
+
+    @app.cli.command("rebuild-demand")
+    def rebuild_demand():
+        """Recompute the daily demand rollup from all food requests."""
+        from .demand import rebuild
+
+        with db.engine.begin() as conn:
+            buckets = rebuild(conn)
+        click.echo(f"Rebuilt daily demand: {buckets} rows.")
+
+    @app.cli.command("forecast-demand")
+    def forecast_demand():
+        """Recompute the farmer demand forecasts of every pincode."""
+        from .forecasting import refresh
+
+        started = time.perf_counter()
+        series = refresh()
+        db.session.commit()
+        click.echo(f"Forecast {series} demand series in {time.perf_counter() - started:.2f}s.")
+
+    @app.cli.command("expire-holds")
+    def expire_holds():
+        """Release the stock held by NGO requests whose hold has expired."""
+        from .reservations import expire_holds as release_expired
+
+        released = 0
+        while True:
+            batch = release_expired()
+            db.session.commit()
+            if not batch:
+                break
+            released += batch
+        click.echo(f"Released {released} expired holds.")
+
+    @app.cli.command("sweep-expiry")
+    def sweep_expiry():
+        """Notify retailers about ageing stock, expire stock past its date and release expired holds."""
+        from .notifications import scheduled_sweep
+
+        notified, expired = scheduled_sweep()
+        click.echo(f"Notified {notified} items past best before; expired {expired} items.")
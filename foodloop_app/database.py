@@ -0,0 +1,97 @@
+# foodloop_app/database.py
+"""Database URL, connection pool and SQLite tuning, from the environment.
+
+``DATABASE_URL`` picks the database (default: SQLite ``db.sqlite3`` in the
+instance folder); ``postgres://`` URLs are accepted as ``postgresql://``.
+``DATABASE_REPLICA_URL`` optionally adds a read replica (see routing.py).
+Pool settings apply to every engine: ``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``,
+``DB_POOL_TIMEOUT``, ``DB_POOL_RECYCLE`` (seconds) and ``DB_POOL_PRE_PING``.
+
+Every new SQLite connection gets ``SQLITE_PRAGMAS``. WAL lets readers run
+alongside the single writer; ``synchronous=NORMAL`` is durable in WAL mode
+except for the last transactions on power loss; ``busy_timeout`` makes a
+writer wait for the lock instead of failing with "database is locked".
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_URL = "sqlite:///db.sqlite3"
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _normalize(url):
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def database_url():
+    return _normalize(os.getenv("DATABASE_URL", DEFAULT_URL))
+
+
+def replica_url():
+    """The read replica's URL, or None without ``DATABASE_REPLICA_URL``."""
+    url = os.getenv("DATABASE_REPLICA_URL")
+    return _normalize(url) if url else None
+
+
+def binds():
+    """``SQLALCHEMY_BINDS``: the read replica, if configured, with the same pool settings."""
+    url = replica_url()
+    if url is None:
+        return {}
+    return {"replica": {"url": url, **engine_options(url)}}
+
+
+def engine_options(url):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for ``url``: the connection pool settings."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}  # One shared in-memory connection; there is no pool to size
+    return {
+        "pool_size": _env_int("DB_POOL_SIZE", 10),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 20),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        # Below typical server and proxy idle timeouts
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+
+
+def sqlite_pragmas():
+    """``SQLITE_PRAGMAS``, applied in this order to every new SQLite connection."""
+    return {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "mmap_size": _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    }
+
+
+def configure_engine(engine, pragmas):
+    """Apply ``pragmas`` to each new connection of ``engine`` if it is SQLite."""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
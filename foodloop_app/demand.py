@@ -0,0 +1,136 @@
+# foodloop_app/demand.py
+"""Daily demand rollup behind the farmer forecast.
+
+``daily_demand`` holds, per retailer pincode, day, food and request status,
+the total quantity requested by NGOs and the number of requests. Mapper
+events on :class:`FoodRequest` keep it current in the same flush that writes
+the request: a new request adds to its bucket, a status or quantity change
+moves the amount between buckets and a deleted request is subtracted.
+Readers aggregate a bounded window of days instead of the whole request
+history.
+
+Bulk ``UPDATE``/``DELETE`` statements on ``food_request`` bypass the events.
+Code that changes a status that way calls :func:`status_changed` itself (see
+reservations.py); after other such maintenance run
+``flask --app run rebuild-demand``.
+"""
+import logging
+from collections import defaultdict
+
+from sqlalchemy import event, inspect, select
+
+from .models import DailyDemand, FoodRequest, InventoryItem, User
+from .upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+REBUILD_BATCH_SIZE = 5000
+
+daily_demand = DailyDemand.__table__
+
+
+def _bucket(connection, inventory_item_id, created_at, status):
+    row = connection.execute(
+        select(User.pincode, InventoryItem.food_id)
+        .select_from(InventoryItem)
+        .join(User, InventoryItem.user_id == User.id)
+        .where(InventoryItem.id == inventory_item_id)
+    ).first()
+    if row is None:
+        return None
+    return {
+        "pincode": row.pincode or "",
+        "day": created_at.date(),
+        "food_id": row.food_id,
+        "status": status or "pending",
+    }
+
+
+def _add(connection, key, quantity, requests):
+    """Add to one bucket, creating it on first use."""
+    upsert(
+        daily_demand,
+        {**key, "quantity": quantity, "requests": requests},
+        key=list(key),
+        update=lambda excluded: {
+            "quantity": daily_demand.c.quantity + excluded.quantity,
+            "requests": daily_demand.c.requests + excluded.requests,
+        },
+        connection=connection,
+    )
+    if requests < 0:
+        # Drop buckets whose last request moved out, as a rebuild would
+        match = [daily_demand.c[name] == value for name, value in key.items()]
+        connection.execute(daily_demand.delete().where(*match, daily_demand.c.requests <= 0))
+
+
+def _history_value(target, attribute):
+    history = inspect(target).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attribute)
+
+
+@event.listens_for(FoodRequest, "after_insert")
+def _request_created(mapper, connection, target):
+    key = _bucket(connection, target.inventory_item_id, target.created_at, target.status)
+    if key is not None:
+        _add(connection, key, target.quantity, 1)
+
+
+@event.listens_for(FoodRequest, "after_update")
+def _request_updated(mapper, connection, target):
+    old_status = _history_value(target, "status")
+    old_quantity = _history_value(target, "quantity")
+    old_item_id = _history_value(target, "inventory_item_id")
+    if (old_status, old_quantity, old_item_id) == (target.status, target.quantity, target.inventory_item_id):
+        return
+    old_key = _bucket(connection, old_item_id, target.created_at, old_status)
+    if old_key is not None:
+        _add(connection, old_key, -old_quantity, -1)
+    new_key = _bucket(connection, target.inventory_item_id, target.created_at, target.status)
+    if new_key is not None:
+        _add(connection, new_key, target.quantity, 1)
+
+
+def status_changed(connection, inventory_item_id, created_at, quantity, old_status, new_status):
+    """Move a request whose status was changed by an ``UPDATE`` statement to its new bucket."""
+    old_key = _bucket(connection, inventory_item_id, created_at, old_status)
+    if old_key is None:
+        return
+    _add(connection, old_key, -quantity, -1)
+    _add(connection, dict(old_key, status=new_status), quantity, 1)
+
+
+@event.listens_for(FoodRequest, "after_delete")
+def _request_deleted(mapper, connection, target):
+    key = _bucket(connection, target.inventory_item_id, target.created_at, target.status)
+    if key is not None:
+        _add(connection, key, -target.quantity, -1)
+
+
+def rebuild(connection):
+    """Recompute the whole rollup from ``food_request``. Returns the number of buckets."""
+    totals = defaultdict(lambda: [0.0, 0])
+    requests = connection.execute(
+        select(User.pincode, InventoryItem.food_id, FoodRequest.created_at, FoodRequest.status, FoodRequest.quantity)
+        .select_from(FoodRequest)
+        .join(InventoryItem, FoodRequest.inventory_item_id == InventoryItem.id)
+        .join(User, InventoryItem.user_id == User.id)
+        .where(FoodRequest.created_at.is_not(None)),
+        execution_options={"yield_per": REBUILD_BATCH_SIZE},
+    )
+    for pincode, food_id, created_at, status, quantity in requests:
+        total = totals[(pincode or "", created_at.date(), food_id, status or "pending")]
+        total[0] += quantity
+        total[1] += 1
+
+    connection.execute(daily_demand.delete())
+    rows = [
+        {"pincode": pincode, "day": day, "food_id": food_id, "status": status, "quantity": quantity, "requests": count}
+        for (pincode, day, food_id, status), (quantity, count) in totals.items()
+    ]
+    for start in range(0, len(rows), REBUILD_BATCH_SIZE):
+        connection.execute(daily_demand.insert(), rows[start:start + REBUILD_BATCH_SIZE])
+    logger.info("Rebuilt daily demand rollup: %s buckets", len(rows))
+    return len(rows)
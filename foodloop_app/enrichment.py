@@ -0,0 +1,159 @@
+# foodloop_app/enrichment.py
+"""Background shelf-life enrichment for new inventory items.
+
+``/retailers/add_item`` creates a retailer's new ``InventoryItem`` straight
+away with status ``PendingDates`` when no cached estimate exists, and hands it
+to this queue; ``/retailers/add_items`` hands over all such items of a batch
+as one job. A bounded worker pool asks the model for
+``best_before``/``expires_at`` in one batched prompt per job, retries failures
+with exponential backoff, and moves each item to ``Selling``, or to
+``DatesFailed`` once every attempt is used up.
+"""
+import logging
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import update
+
+from foodloop_app import db
+from . import background
+from .models import Food, InventoryItem
+from .shelf_life import generate_shelf_life_many, ShelfLifeError
+
+logger = logging.getLogger(__name__)
+
+PENDING = "PendingDates"
+FAILED = "DatesFailed"
+READY = "Selling"
+
+# Items queued or running in this process, so a poll does not enqueue them twice
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def enqueue(item_id, city):
+    """Schedule shelf-life estimation for a ``PendingDates`` item. Returns False if already queued."""
+    return bool(enqueue_batch([item_id], city))
+
+
+def enqueue_batch(item_ids, city):
+    """Schedule one batched estimation for several ``PendingDates`` items of the same city.
+
+    Items already queued in this process are skipped. Returns the ids queued.
+    """
+    with _in_flight_lock:
+        queued = [item_id for item_id in dict.fromkeys(item_ids) if item_id not in _in_flight]
+        _in_flight.update(queued)
+    if not queued:
+        return []
+
+    background.submit(
+        "enrichment",
+        current_app.config["ENRICHMENT_WORKERS"],
+        _run,
+        queued,
+        city,
+    )
+    return queued
+
+
+def is_in_flight(item_id):
+    with _in_flight_lock:
+        return item_id in _in_flight
+
+
+def status_payload(item):
+    """JSON-ready enrichment status for an inventory item."""
+    return {
+        "id": item.id,
+        "food_id": item.food_id,
+        "name": item.food.name,
+        "status": item.status,
+        "pending": item.status == PENDING,
+        "best_before": item.best_before.isoformat() if item.best_before else None,
+        "expires_at": item.expires_at.isoformat() if item.expires_at else None,
+        "attempts": item.enrichment_attempts or 0,
+        "error": item.enrichment_error,
+    }
+
+
+def _run(item_ids, city):
+    try:
+        _enrich(item_ids, city)
+    finally:
+        with _in_flight_lock:
+            _in_flight.difference_update(item_ids)
+
+
+def _enrich(item_ids, city):
+    max_attempts = current_app.config["ENRICHMENT_MAX_ATTEMPTS"]
+    backoff = current_app.config["ENRICHMENT_RETRY_BACKOFF"]
+
+    items = db.session.query(InventoryItem.id, Food.name, InventoryItem.enrichment_attempts).join(
+        Food, InventoryItem.food_id == Food.id
+    ).filter(InventoryItem.id.in_(item_ids), InventoryItem.status == PENDING).all()
+    # name -> [item ids, attempts so far]; items of one name share an estimate
+    remaining = {}
+    for item_id, name, attempts in items:
+        state = remaining.setdefault(name, [[], attempts or 0])
+        state[0].append(item_id)
+    errors = {}
+
+    while remaining:
+        for state in remaining.values():
+            state[1] += 1
+        try:
+            outcomes = generate_shelf_life_many(list(remaining), city)
+        except ShelfLifeError as e:
+            db.session.rollback()
+            errors = dict.fromkeys(remaining, e.message)
+            if not e.retryable:
+                break
+        except Exception as e:
+            db.session.rollback()
+            errors = dict.fromkeys(remaining, f"Model call failed: {e}")
+        else:
+            errors = {}
+            for name, outcome in outcomes.items():
+                if isinstance(outcome, ShelfLifeError):
+                    errors[name] = outcome.message
+                    continue
+                ids, attempts = remaining.pop(name)
+                # Only still-pending items are updated, so a duplicate worker cannot clobber them
+                db.session.execute(
+                    update(InventoryItem)
+                    .where(InventoryItem.id.in_(ids), InventoryItem.status == PENDING)
+                    .values(
+                        best_before=outcome[0],
+                        expires_at=outcome[1],
+                        status=READY,
+                        enrichment_attempts=attempts,
+                        enrichment_error=None,
+                    )
+                )
+                logger.debug("Shelf-life enrichment done for items %s after %s attempt(s)", ids, attempts)
+            db.session.commit()
+
+        for name, message in errors.items():
+            logger.warning("Shelf-life enrichment attempt %s for '%s' failed: %s", remaining[name][1], name, message)
+        exhausted = [name for name, (_, attempts) in remaining.items() if attempts >= max_attempts]
+        _mark_failed({name: remaining.pop(name) for name in exhausted}, errors)
+        if remaining:
+            time.sleep(backoff * 2 ** (min(attempts for _, attempts in remaining.values()) - 1))
+
+    # Reached only through a non-retryable error
+    _mark_failed(remaining, errors)
+
+
+def _mark_failed(states, errors):
+    if not states:
+        return
+    for name, (ids, attempts) in states.items():
+        db.session.execute(
+            update(InventoryItem)
+            .where(InventoryItem.id.in_(ids), InventoryItem.status == PENDING)
+            .values(status=FAILED, enrichment_attempts=attempts, enrichment_error=errors.get(name))
+        )
+        logger.error("Shelf-life enrichment gave up on items %s: %s", ids, errors.get(name))
+    db.session.commit()
@@ -0,0 +1,280 @@
+# foodloop_app/events.py
+"""Push channel for changes clients would otherwise poll for.
+
+Writes publish small events to channels: ``user:<id>`` for one retailer or
+NGO (their requests) and ``pincode:<pincode>`` for the NGO feed of an area.
+:func:`publish` only stages an event on the session; it is delivered after
+the transaction commits and dropped if it rolls back, so clients never hear
+about a change that did not happen. Clients read with a ``since`` cursor
+(``/events`` long-poll or ``/events/stream`` server-sent events) and refetch
+the affected list.
+
+``EVENTS_BACKEND`` picks the delivery backend:
+
+* ``"database"`` (default) appends events to the ``event_log`` table, so
+  every worker sees them. Each process tails the table into its own buffer
+  every ``EVENTS_POLL_INTERVAL`` seconds (one query however many clients are
+  waiting) and right after its own publishes. Ids are handed out before
+  commit, so a lower id can become visible after a higher one; the tail
+  stops at a missing id until it shows up or ``EVENTS_GAP_WAIT`` seconds
+  pass (a rolled-back insert never fills it), so cursors never skip an
+  event that is about to commit;
+* ``"memory"`` keeps events in this process only; for a single worker;
+* any class with the same ``publish``/``read``/``latest`` (and optionally
+  ``close``) methods, e.g. one on a message broker, built with the app config.
+
+Each process keeps the last ``EVENTS_BUFFER_SIZE`` events. A cursor older
+than that reads as ``reset``: the client missed events and should refetch.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, event, insert, select
+
+from foodloop_app import db
+from . import background
+from .models import EventLog
+
+logger = logging.getLogger(__name__)
+
+Message = namedtuple("Message", "id channel type data")
+
+STAGED_KEY = "staged_events"
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def pincode_channel(pincode):
+    return f"pincode:{pincode}"
+
+
+def publish(channel, type, data):
+    """Send an event to ``channel`` once the current transaction commits."""
+    session = db.session()
+    if not session.in_transaction():
+        session.begin()  # So a rollback before any SQL still discards the event
+    session.info.setdefault(STAGED_KEY, []).append((channel, type, data))
+
+
+@event.listens_for(db.session, "after_commit")
+def _deliver(session):
+    staged = session.info.pop(STAGED_KEY, None)
+    if not staged:
+        return
+    try:
+        backend().publish(staged)
+    except Exception:
+        # The write itself is committed; clients catch up on their next full fetch
+        logger.error("Could not deliver %s events", len(staged), exc_info=True)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _discard(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(STAGED_KEY, None)
+
+
+class Buffer:
+    """The latest messages of this process in id order; readers wait for new ones."""
+
+    def __init__(self, size, start_id):
+        self._messages = deque(maxlen=size)
+        self._changed = threading.Condition()
+        self.last_id = start_id
+        # Messages up to this id are not in the buffer (evicted or older than it)
+        self.dropped_through = start_id
+        self.closed = False
+
+    def extend(self, messages):
+        if not messages:
+            return
+        with self._changed:
+            for message in messages:
+                if len(self._messages) == self._messages.maxlen:
+                    self.dropped_through = self._messages[0].id
+                self._messages.append(message)
+            self.last_id = messages[-1].id
+            self._changed.notify_all()
+
+    def close(self):
+        """Return every waiting and future read at once; for shutdown."""
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+    def read(self, channels, since, timeout, limit):
+        """Messages on ``channels`` after ``since``, waiting up to ``timeout`` seconds for one.
+
+        Returns ``(messages, cursor, reset)``.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                if since < self.dropped_through:
+                    return [], self.last_id, True
+                matched = []
+                # Newest first, stopping at the cursor, so a read costs the number of new messages
+                for message in reversed(self._messages):
+                    if message.id <= since:
+                        break
+                    if message.channel in channels:
+                        matched.append(message)
+                if matched:
+                    matched = matched[::-1][:limit]
+                    return matched, matched[-1].id, False
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.closed:
+                    # Nothing for these channels up to last_id; skip past it next time
+                    return [], max(since, self.last_id), False
+                self._changed.wait(remaining)
+
+
+class MemoryBackend:
+    """Events delivered within this process only."""
+
+    def __init__(self, config):
+        # Ids are microsecond timestamps, so cursors from before a restart read as reset
+        self._next_id = time.time_ns() // 1000
+        self._lock = threading.Lock()
+        self.buffer = Buffer(config["EVENTS_BUFFER_SIZE"], self._next_id)
+
+    def publish(self, staged):
+        with self._lock:
+            messages = []
+            for channel, type, data in staged:
+                self._next_id = max(self._next_id + 1, time.time_ns() // 1000)
+                messages.append(Message(self._next_id, channel, type, data))
+            self.buffer.extend(messages)
+
+    def read(self, channels, since, timeout, limit):
+        return self.buffer.read(channels, since, timeout, limit)
+
+    def latest(self):
+        return self.buffer.last_id
+
+    def close(self):
+        self.buffer.close()
+
+
+class DatabaseBackend:
+    """Events shared by all workers through the ``event_log`` table."""
+
+    def __init__(self, config):
+        self.size = config["EVENTS_BUFFER_SIZE"]
+        self.interval = config["EVENTS_POLL_INTERVAL"]
+        self.retention = config["EVENTS_RETENTION"]
+        self.gap_wait = config["EVENTS_GAP_WAIT"]
+        self.buffer = None
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        self._gap_seen_at = None  # when the tail first found the id after buffer.last_id missing
+
+    def publish(self, staged):
+        now = datetime.utcnow()
+        rows = [
+            {"channel": channel, "type": type, "payload": json.dumps(data), "created_at": now}
+            for channel, type, data in staged
+        ]
+        with db.engine.begin() as conn:
+            conn.execute(insert(EventLog), rows)
+        # Wake this process's readers now rather than at the next poll
+        self._start()
+        self.poll()
+
+    def read(self, channels, since, timeout, limit):
+        self._start()
+        return self.buffer.read(channels, since, timeout, limit)
+
+    def latest(self):
+        self._start()
+        return self.buffer.last_id
+
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+
+    def _start(self):
+        """Fill the buffer with the newest events and start following the table."""
+        if self.buffer is None:
+            with self._lock:
+                if self.buffer is None:
+                    with db.engine.connect() as conn:
+                        rows = conn.execute(
+                            select(EventLog.id, EventLog.channel, EventLog.type, EventLog.payload)
+                            .order_by(EventLog.id.desc())
+                            .limit(self.size)
+                        ).all()
+                    rows.reverse()
+                    buffer = Buffer(self.size, rows[0].id - 1 if rows else 0)
+                    buffer.extend([_message(row) for row in rows])
+                    self.buffer = buffer
+        background.every("events-follow", self.interval, self.poll)
+
+    def poll(self):
+        """Move events written since the last poll, by any worker, into the buffer."""
+        with self._lock:
+            with db.engine.begin() as conn:
+                rows = conn.execute(
+                    select(EventLog.id, EventLog.channel, EventLog.type, EventLog.payload)
+                    .where(EventLog.id > self.buffer.last_id)
+                    .order_by(EventLog.id)
+                    .limit(self.size)
+                ).all()
+                if time.monotonic() - self._pruned_at > self.retention.total_seconds() / 10:
+                    conn.execute(delete(EventLog).where(EventLog.created_at < datetime.utcnow() - self.retention))
+                    self._pruned_at = time.monotonic()
+            self.buffer.extend([_message(row) for row in self._contiguous(rows)])
+
+    def _contiguous(self, rows):
+        """The leading ``rows`` without a missing id before them, or all once a gap is ``gap_wait`` old."""
+        expected = self.buffer.last_id + 1
+        for position, row in enumerate(rows):
+            if row.id != expected:
+                now = time.monotonic()
+                if self._gap_seen_at is None:
+                    self._gap_seen_at = now
+                if now - self._gap_seen_at < self.gap_wait:
+                    rows = rows[:position]  # read again from the gap next poll
+                    break
+                logger.debug("Event ids %s to %s never committed; skipping them", expected, row.id - 1)
+            self._gap_seen_at = None
+            expected = row.id + 1
+        return rows
+
+
+def _message(row):
+    return Message(row.id, row.channel, row.type, json.loads(row.payload))
+
+
+BACKENDS = {"memory": MemoryBackend, "database": DatabaseBackend}
+
+_backend = None
+_backend_choice = None
+_backend_lock = threading.Lock()
+
+
+def backend():
+    """This process's backend for the configured ``EVENTS_BACKEND``."""
+    global _backend, _backend_choice
+    choice = current_app.config["EVENTS_BACKEND"]
+    with _backend_lock:
+        if _backend is None or _backend_choice != choice:
+            factory = BACKENDS[choice] if isinstance(choice, str) else choice
+            _backend = factory(current_app.config)
+            _backend_choice = choice
+        return _backend
+
+
+def close():
+    """End this process's long-polls and streams; for shutdown."""
+    with _backend_lock:
+        current = _backend
+    if current is not None and hasattr(current, "close"):
+        current.close()
@@ -0,0 +1,123 @@
+# foodloop_app/events_routes.py
+import json
+import time
+
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from flask_jwt_extended import jwt_required, get_current_user
+
+from . import events, lifecycle
+from .geo import nearby_pincodes
+
+events_bp = Blueprint("events", __name__, url_prefix="/events")
+
+PAGE_SIZE = 100  # events per long-poll response
+HEARTBEAT_SECONDS = 15  # keeps proxies from closing an idle stream
+
+
+class EventsRequestError(ValueError):
+    """Raised for malformed ``since``, ``timeout`` or radius arguments."""
+
+
+def _channels(user):
+    """The user's own channel, plus the feeds around them for NGOs (same area arguments as /ngo/filtered_food)."""
+    channels = {events.user_channel(user.id)}
+    if "Ngo" in user.roles:
+        pincode = request.args.get("pincode") or user.pincode
+        max_radius = current_app.config["NEARBY_RADIUS_KM_MAX"]
+        try:
+            radius_km = float(request.args.get("radius_km", current_app.config["NEARBY_RADIUS_KM_DEFAULT"]))
+        except ValueError:
+            raise EventsRequestError("'radius_km' must be a number")
+        if not 0 <= radius_km <= max_radius:
+            raise EventsRequestError(f"'radius_km' must be between 0 and {max_radius}")
+        channels.update(events.pincode_channel(code) for code in nearby_pincodes(pincode, radius_km))
+    return channels
+
+
+def _since(backend):
+    """The client's cursor; without one, start from now."""
+    raw = request.args.get("since") or request.headers.get("Last-Event-ID")
+    if not raw:
+        return backend.latest()
+    try:
+        return int(raw)
+    except ValueError:
+        raise EventsRequestError("'since' must be a cursor returned by this endpoint")
+
+
+def _payload(message):
+    return {"id": message.id, "type": message.type, "data": message.data}
+
+
+@events_bp.route("", methods=["GET"])
+@jwt_required()
+def long_poll():
+    user = get_current_user()
+
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    backend = events.backend()
+    max_timeout = current_app.config["EVENTS_LONG_POLL_TIMEOUT"]
+    try:
+        channels = _channels(user)
+        since = _since(backend)
+        try:
+            timeout = float(request.args.get("timeout", max_timeout))
+        except ValueError:
+            raise EventsRequestError("'timeout' must be a number")
+        if not 0 <= timeout <= max_timeout:
+            raise EventsRequestError(f"'timeout' must be between 0 and {max_timeout}")
+    except EventsRequestError as e:
+        return jsonify({"error": str(e)}), 422
+
+    # Held open until an event arrives or the timeout passes
+    messages, cursor, reset = backend.read(channels, since, timeout, PAGE_SIZE)
+    return jsonify({
+        "events": [_payload(message) for message in messages],
+        "cursor": str(cursor),
+        "reset": reset,
+    }), 200
+
+
+@events_bp.route("/stream", methods=["GET"])
+@jwt_required()
+def stream():
+    user = get_current_user()
+
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    backend = events.backend()
+    try:
+        channels = _channels(user)
+        since = _since(backend)
+    except EventsRequestError as e:
+        return jsonify({"error": str(e)}), 422
+
+    # Server-sent events; the stream ends after EVENTS_STREAM_MAX_AGE seconds so
+    # long-lived connections do not pin a worker, and EventSource reconnects
+    # with the last id as Last-Event-ID
+    deadline = time.monotonic() + current_app.config["EVENTS_STREAM_MAX_AGE"]
+
+    def generate(cursor):
+        yield "retry: 1000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if lifecycle.is_draining():
+                return  # The client reconnects to another worker
+            messages, cursor, reset = backend.read(channels, cursor, min(HEARTBEAT_SECONDS, remaining), PAGE_SIZE)
+            if reset:
+                yield f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"
+            for message in messages:
+                yield f"id: {message.id}\nevent: {message.type}\ndata: {json.dumps(message.data)}\n\n"
+            if not messages and not reset:
+                yield ": keepalive\n\n"
+
+    return Response(
+        stream_with_context(generate(since)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
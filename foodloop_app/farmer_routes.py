@@ -1,15 +1,14 @@
 # foodloop_app/farmer_routes.py
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_current_user
 from flask_security.decorators import roles_required
 from sqlalchemy import func, desc 
 from datetime import datetime, timedelta
-import google.generativeai as genai
 from dotenv import load_dotenv
-import os
 
 from foodloop_app import db
-from .models import User, FoodRequest, InventoryItem, Food
+from . import forecasting, gemini, insights
+from .models import DailyDemand, DemandForecast, Food, ForecastRun
 
 farmer_bp = Blueprint("farmer", __name__, url_prefix="/farmer")
 
@@ -19,8 +18,7 @@ load_dotenv()
 @jwt_required()
 def get_simple_demand_forecast():
 
-    current_user_email = get_jwt_identity()
-    farmer_user = User.query.filter_by(email=current_user_email).first()
+    farmer_user = get_current_user()
 
     if not farmer_user:
         return jsonify({"error": "Farmer user not found"}), 404
@@ -30,22 +28,16 @@ def get_simple_demand_forecast():
          return jsonify({"message": "Farmer profile requires a pincode to provide regional insights."}), 200
 
     # Define the time threshold for the latest 4 months
-    four_months_ago = datetime.utcnow() - timedelta(days=120) # Approximately 4 months
+    four_months_ago = (datetime.utcnow() - timedelta(days=120)).date() # Approximately 4 months
 
-    # --- 1. Query All Historical Demand Data (NGO Requests) for the pincode ---
+    # --- 1. Read Demand Data (NGO Requests) for the pincode from the daily rollup (see demand.py) ---
     try:
-        all_demanded_foods_data_query = db.session.query(
-            Food.name,
-            func.sum(FoodRequest.quantity).label('total_requested_quantity'),
-            FoodRequest.created_at
-        ).join(InventoryItem, FoodRequest.inventory_item_id == InventoryItem.id
-        ).join(Food, InventoryItem.food_id == Food.id).join(User, InventoryItem.user_id == User.id).filter(User.pincode == farmer_pincode).group_by(Food.name, FoodRequest.created_at).order_by(FoodRequest.created_at.asc()).all() # Order by date to easily find oldest
-
-        all_demanded_foods_data = [{"name": item.name, "total_requested_quantity": item.total_requested_quantity, "created_at": item.created_at} for item in all_demanded_foods_data_query]
-
+        has_market_data = db.session.query(DailyDemand.id).filter(
+            DailyDemand.pincode == farmer_pincode, DailyDemand.requests > 0
+        ).first() is not None
 
         # --- 2. Handle Case: No Data ---
-        if not all_demanded_foods_data:
+        if not has_market_data:
             # No market data found at all
             return jsonify({
                 "top_demanded_foods": [],
@@ -53,22 +45,19 @@ def get_simple_demand_forecast():
                 "data_source": "none" # Indicate no data
             }), 200
 
-        # --- 3. Data Exists: Determine Time Range and Filter if necessary ---
-        oldest_data_date = all_demanded_foods_data[0]['created_at'] # Since we ordered by asc
-
-        if oldest_data_date < four_months_ago:
-            recent_demanded_foods_data = [
-                item for item in all_demanded_foods_data
-                if item['created_at'] >= four_months_ago
-            ]
-            data_for_analysis = recent_demanded_foods_data
-            data_source_message = "Analysis based on the latest 4 months of market data."
-        else:
-            # Data is within the last 4 months, use all available data
-            data_for_analysis = all_demanded_foods_data
-            data_source_message = "Analysis based on all available recent market data."
-
-        if not data_for_analysis:
+        # --- 3. Sum the latest 4 months per food in SQL; only the top 5 rows come back ---
+        total_requested_quantity = func.sum(DailyDemand.quantity).label('total_requested_quantity')
+        top_demanded_foods = db.session.query(
+            Food.name,
+            total_requested_quantity
+        ).join(Food, DailyDemand.food_id == Food.id).filter(
+            DailyDemand.pincode == farmer_pincode,
+            DailyDemand.day >= four_months_ago
+        ).group_by(Food.id, Food.name).having(func.sum(DailyDemand.requests) > 0).order_by(
+            desc(total_requested_quantity)
+        ).limit(5).all()
+
+        if not top_demanded_foods:
              return jsonify({
                 "top_demanded_foods": [],
                 "demand_forecast_text": "No recent market data available for analysis.",
@@ -76,24 +65,10 @@ def get_simple_demand_forecast():
             }), 200
 
 
-        # --- 4. Aggregate Data for Analysis Prompt (Sum quantities per food item within the selected range) ---
-        aggregated_data = {}
-        for item in data_for_analysis:
-            food_name = item['name']
-            quantity = item['total_requested_quantity']
-            if food_name in aggregated_data:
-                aggregated_data[food_name] += quantity
-            else:
-                aggregated_data[food_name] = quantity
-
-        sorted_aggregated_data = sorted(aggregated_data.items(), key=lambda item: item[1], reverse=True)[:5] # Get top 5
-
+        # --- 4. Summarize the Top Items for the Analysis Prompt ---
         data_summary_for_gemini = f"Market data from pincode {farmer_pincode} over the relevant period:\n"
-        if sorted_aggregated_data:
-             for name, quantity in sorted_aggregated_data:
-                data_summary_for_gemini += f"- {name}: {quantity:.1f}kg\n"
-        else:
-             data_summary_for_gemini += "No specific food item data available in the selected period (quantities might be zero or data structure issue)."
+        for name, quantity in top_demanded_foods:
+            data_summary_for_gemini += f"- {name}: {quantity:.1f}kg\n"
 
 
         # --- 5. Construct Simple Prompt for Gemini ---
@@ -103,42 +78,85 @@ Analyze the following market data from a specific region (pincode {farmer_pincod
 Provide a very brief insight into what this data indicates about local demand and a simple text forecast or suggestion for farmers in this region regarding these top items. Keep it concise, a paragraph or a few bullet points.
 """
 
-        # --- 6. Call Gemini API ---
-        demand_forecast_text = "Could not get forecast insights."
-        try:
-            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-            if os.getenv("GEMINI_API_KEY"):
-                model = genai.GenerativeModel('gemini-1.5-pro')
-                gemini_response = model.generate_content(gemini_prompt)
-                demand_forecast_text = gemini_response.text.strip()
-            else:
-                 demand_forecast_text = "AI service is not configured (API key missing)."
-
-        except Exception as e:
-            # Catch any error during Gemini call (API issues, network etc.)
-            print(f"Error calling Gemini API: {e}")
-            demand_forecast_text = f"Failed to get AI insights: {e}"
-
-        # --- 7. Prepare Top Demanded Foods for Frontend Display (based on the data used for analysis) ---
-        aggregated_for_display = {}
-        for item in data_for_analysis:
-             food_name = item['name']
-             quantity = item['total_requested_quantity']
-             if food_name in aggregated_for_display:
-                 aggregated_for_display[food_name] += quantity
-             else:
-                 aggregated_for_display[food_name] = quantity
-
-        top_foods_list = [{"item_name": name, "total_requested_quantity": quantity} for name, quantity in sorted(aggregated_for_display.items(), key=lambda item: item[1], reverse=True)[:5]]
+        # --- 6. Insight Text: cached per pincode and summary, (re)generated in the background ---
+        # The data below is returned right away; see insights.py
+        if gemini.is_configured():
+            demand_forecast_text, insight_status = insights.insight_for(
+                farmer_pincode, data_summary_for_gemini, gemini_prompt
+            )
+        else:
+            demand_forecast_text, insight_status = "AI service is not configured (API key missing).", "unavailable"
+
+        # --- 7. Prepare Top Demanded Foods for Frontend Display (the same rows used for analysis) ---
+        top_foods_list = [{"item_name": name, "total_requested_quantity": quantity} for name, quantity in top_demanded_foods]
 
 
         # --- 8. Send Response to Frontend ---
         return jsonify({
             "top_demanded_foods": top_foods_list,
             "demand_forecast_text": demand_forecast_text,
+            "insight_status": insight_status, # "fresh", "stale", "pending", "error" or "unavailable"
             "data_source": "historical" # Indicate that historical data was used for analysis
         }), 200
 
     except Exception as e:
-         print(f"Unexpected error in simple_demand_forecast: {e}")
+         current_app.logger.exception("Unexpected error in simple_demand_forecast")
          return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+
+@farmer_bp.route("/demand_forecast", methods=["GET"])
+@jwt_required()
+def get_demand_forecast():
+    farmer_user = get_current_user()
+
+    if not farmer_user:
+        return jsonify({"error": "Farmer user not found"}), 404
+
+    farmer_pincode = farmer_user.pincode
+    if not farmer_pincode:
+         return jsonify({"message": "Farmer profile requires a pincode to provide regional insights."}), 200
+
+    max_weeks = current_app.config["FORECAST_HORIZON_WEEKS"]
+    try:
+        weeks = int(request.args.get("weeks", 4))
+    except ValueError:
+        return jsonify({"error": "'weeks' must be an integer"}), 422
+    if not 1 <= weeks <= max_weeks:
+        return jsonify({"error": f"'weeks' must be between 1 and {max_weeks}"}), 422
+
+    # Forecasts are precomputed (flask forecast-demand); missing or old ones are recomputed in the background
+    run = db.session.get(ForecastRun, farmer_pincode)
+    stale = forecasting.is_stale(run)
+    if stale:
+        forecasting.schedule_refresh(farmer_pincode)
+    computed_at = run.computed_at if run else None
+
+    rows = db.session.query(DemandForecast, Food.name).join(Food, DemandForecast.food_id == Food.id).filter(
+        DemandForecast.pincode == farmer_pincode
+    ).order_by(DemandForecast.food_id, DemandForecast.week_start).all()
+
+    forecasts = {}
+    for forecast, item_name in rows:
+        entry = forecasts.setdefault(forecast.food_id, {
+            "food_id": forecast.food_id,
+            "item_name": item_name,
+            "model": forecast.model,
+            "weeks": [],
+        })
+        if len(entry["weeks"]) < weeks:
+            entry["weeks"].append({
+                "week_start": forecast.week_start.isoformat(),
+                "quantity": round(forecast.quantity, 2),
+                "lower": round(forecast.lower, 2),
+                "upper": round(forecast.upper, 2),
+            })
+        computed_at = computed_at or forecast.computed_at  # rows stored before forecast_run existed
+
+    return jsonify({
+        "pincode": farmer_pincode,
+        "computed_at": computed_at.isoformat() if computed_at else None,
+        # "stale": older forecasts shown while they are recomputed; "pending": none computed yet
+        "status": "fresh" if not stale else "stale" if computed_at else "pending",
+        # Largest expected demand first
+        "forecasts": sorted(forecasts.values(), key=lambda entry: entry["weeks"][0]["quantity"], reverse=True),
+    }), 200
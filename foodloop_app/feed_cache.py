@@ -0,0 +1,90 @@
+# foodloop_app/feed_cache.py
+"""Cache of the NGO listing feed (``/ngo/filtered_food``) with ETags.
+
+Every pincode has a version number in the ``feed_version`` table. Writes that
+change what a feed shows bump the version of the retailer's pincode in the
+same transaction (:func:`invalidate_pincodes`). A feed's ETag is a hash of its query arguments
+and the distances and versions of the pincodes in its radius. Reading those is
+a few primary key lookups, much cheaper than the listing join.
+
+Since the versions live in the app database, every worker sees an
+invalidation as soon as it is committed; subscribers of the pincode also get
+a ``feed.changed`` event then (see events.py). Only the serialized bodies are kept
+per process, in an LRU of ``FEED_CACHE_MAX_ENTRIES`` keyed by ETag.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from foodloop_app import db
+from . import events
+from .models import FeedVersion
+from .upsert import upsert
+
+# Response headers replayed with a cached body
+CACHED_HEADERS = ("X-Next-Cursor", "Link")
+
+_feeds = OrderedDict()  # etag -> (body, headers)
+_feeds_lock = threading.Lock()
+
+
+def invalidate_pincodes(pincodes):
+    """Bump the feed version of ``pincodes``; call before the write is committed."""
+    pincodes = {pincode for pincode in pincodes if pincode is not None}
+    if not pincodes:
+        return
+    upsert(
+        FeedVersion,
+        [{"pincode": pincode, "version": 1} for pincode in sorted(pincodes)],
+        key=["pincode"],
+        update=lambda excluded: {"version": FeedVersion.version + 1},
+    )
+    for pincode in pincodes:
+        events.publish(events.pincode_channel(pincode), "feed.changed", {"pincode": pincode})
+
+
+def feed_etag(distances):
+    """ETag of the feed covering ``distances`` (``{pincode: metres}``) for this request's arguments."""
+    versions = dict(
+        db.session.query(FeedVersion.pincode, FeedVersion.version).filter(FeedVersion.pincode.in_(list(distances)))
+    )
+    state = {
+        "args": sorted(request.args.items(multi=True)),
+        "pincodes": sorted((pincode, distance, versions.get(pincode, 0)) for pincode, distance in distances.items()),
+    }
+    return hashlib.sha1(json.dumps(state, separators=(",", ":")).encode()).hexdigest()
+
+
+def cached_response(etag):
+    """304 if the client already has ``etag``, the cached feed if this process has it, else None."""
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    with _feeds_lock:
+        entry = _feeds.get(etag)
+        if entry is not None:
+            _feeds.move_to_end(etag)
+    if entry is None:
+        return None
+    body, headers = entry
+    response = current_app.response_class(body, mimetype="application/json", headers=headers)
+    response.set_etag(etag)
+    return response
+
+
+def store_response(etag, response):
+    """Cache a successful JSON feed page under ``etag`` and tag it; other responses pass through."""
+    if not isinstance(response, current_app.response_class) or response.status_code != 200 or response.is_streamed:
+        return response
+    headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+    with _feeds_lock:
+        _feeds[etag] = (response.get_data(), headers)
+        _feeds.move_to_end(etag)
+        while len(_feeds) > current_app.config["FEED_CACHE_MAX_ENTRIES"]:
+            _feeds.popitem(last=False)
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,246 @@
+# foodloop_app/forecasting.py
+"""Local demand forecasts per pincode and food, computed with NumPy.
+
+Daily requested quantities come from the ``daily_demand`` rollup (see
+demand.py), over the last ``FORECAST_HISTORY_DAYS`` days, one row per
+(pincode, food) series. Every series is fitted at once as a matrix:
+
+* additive exponential smoothing with a weekly (day-of-week) seasonal term.
+  Each series picks the ``(alpha, gamma)`` pair from ``SMOOTHING_GRID``
+  with the smallest one-step-ahead squared error.
+* series with less than two weeks of history fall back to seasonal naive,
+  i.e. next week repeats the last one.
+
+Daily forecasts are summed into weekly totals with a 95% interval. The
+interval grows with the horizon as for simple exponential smoothing,
+``var(h) = sigma^2 * (1 + (h - 1) * alpha^2)``, and ignores correlation
+between the days of a week. Results are stored in ``demand_forecast`` and
+served by ``/farmer/demand_forecast``.
+
+``forecast_run`` records when each pincode was last computed and how many
+series it had, so a pincode without demand is not recomputed on every read.
+A refresh first locks (or creates) the ``forecast_run`` rows of its
+pincodes, so two refreshes of a pincode, e.g. from two workers, run one
+after the other instead of both inserting forecasts. The route never
+computes: it serves what is stored and, when that is missing or older than
+``FORECAST_MAX_AGE``, hands the pincode to :func:`schedule_refresh`.
+"""
+import logging
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, update
+
+from foodloop_app import db
+from . import background
+from .models import DailyDemand, DemandForecast, ForecastRun
+from .upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+SEASON = 7  # days
+SMOOTHING_GRID = [(alpha, gamma) for alpha in (0.1, 0.3, 0.5) for gamma in (0.05, 0.2)]
+Z_95 = 1.96
+SEASONAL_SMOOTHING = "seasonal_smoothing"
+SEASONAL_NAIVE = "seasonal_naive"
+
+# Pincodes queued or being recomputed in this process
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def smooth(history, starts, horizon_weeks):
+    """Fit every series in ``history`` and forecast ``horizon_weeks`` weekly totals.
+
+    ``history`` is an ``(S, T)`` array of daily quantities, oldest first, and
+    ``starts[s]`` the index of series ``s``'s first demand. Returns
+    ``(forecast, lower, upper, naive)``: three ``(S, horizon_weeks)`` arrays
+    and a boolean array marking the series forecast with seasonal naive.
+    """
+    history = np.asarray(history, dtype=float)
+    starts = np.asarray(starts)
+    n_series, n_days = history.shape
+    horizon = horizon_weeks * SEASON
+    alphas = np.array([alpha for alpha, _ in SMOOTHING_GRID])[:, None]
+    gammas = np.array([gamma for _, gamma in SMOOTHING_GRID])[:, None]
+    n_params = len(SMOOTHING_GRID)
+
+    # Level starts at each series' mean over its own history, seasonal terms at 0
+    active_days = np.maximum(n_days - starts, 1)
+    initial = history.sum(axis=1) / active_days
+    level = np.broadcast_to(initial, (n_params, n_series)).copy()
+    season = np.zeros((SEASON, n_params, n_series))
+    squared_error = np.zeros((n_params, n_series))
+
+    # Day-major copies so each step reads contiguous rows
+    observed = np.ascontiguousarray(history.T)
+    days = np.arange(n_days)[:, None]
+    active = days >= starts[None, :]
+    # The first week only warms up the seasonal terms
+    scored = days >= starts[None, :] + SEASON
+    counted = scored.sum(axis=0)
+
+    for t in range(n_days):
+        phase_season = season[t % SEASON]
+        error = observed[t] - level - phase_season
+        error *= active[t]
+        squared_error += error * error * scored[t]
+        level += alphas * error
+        phase_season += gammas * (observed[t] - level - phase_season) * active[t]
+
+    best = np.argmin(squared_error, axis=0)
+    pick = (best, np.arange(n_series))
+    sigma = np.sqrt(squared_error[pick] / np.maximum(counted, 1))
+    alpha = alphas[:, 0][best]
+
+    future_phase = (n_days + np.arange(horizon)) % SEASON
+    daily = level[pick][:, None] + season[:, best, np.arange(n_series)].T[:, future_phase]
+    steps = np.arange(1, horizon + 1)
+    daily_variance = sigma[:, None] ** 2 * (1 + (steps[None, :] - 1) * alpha[:, None] ** 2)
+
+    # Seasonal naive for short histories: the last observed week, repeated,
+    # with that week's day-to-day spread as the daily error
+    naive = (n_days - starts) < 2 * SEASON
+    if naive.any():
+        last_week = np.roll(history[:, n_days - SEASON:], n_days % SEASON, axis=1)  # column = phase
+        spread = last_week.std(axis=1)
+        daily = np.where(naive[:, None], last_week[:, future_phase], daily)
+        daily_variance = np.where(naive[:, None], spread[:, None] ** 2, daily_variance)
+
+    daily = np.clip(daily, 0, None)
+    weekly = daily.reshape(n_series, horizon_weeks, SEASON).sum(axis=2)
+    half_width = Z_95 * np.sqrt(daily_variance.reshape(n_series, horizon_weeks, SEASON).sum(axis=2))
+    return weekly, np.clip(weekly - half_width, 0, None), weekly + half_width, naive
+
+
+def load_history(pincodes, today, history_days):
+    """Daily demand matrix for every (pincode, food) with demand in the window.
+
+    Returns ``(keys, history, starts)``; ``keys[s]`` is ``(pincode, food_id)``.
+    """
+    first_day = today - timedelta(days=history_days)
+    query = db.session.query(
+        DailyDemand.pincode, DailyDemand.food_id, DailyDemand.day, func.sum(DailyDemand.quantity)
+    ).filter(DailyDemand.day >= first_day, DailyDemand.day < today)
+    if pincodes is not None:
+        query = query.filter(DailyDemand.pincode.in_(pincodes))
+    rows = query.group_by(DailyDemand.pincode, DailyDemand.food_id, DailyDemand.day).all()
+
+    keys = sorted({(pincode, food_id) for pincode, food_id, _, _ in rows})
+    index = {key: position for position, key in enumerate(keys)}
+    history = np.zeros((len(keys), history_days))
+    if rows:
+        series = np.array([index[(pincode, food_id)] for pincode, food_id, _, _ in rows])
+        offsets = np.array([(_as_date(day) - first_day).days for _, _, day, _ in rows])
+        np.add.at(history, (series, offsets), np.array([quantity for _, _, _, quantity in rows], dtype=float))
+    has_demand = history != 0
+    starts = np.where(has_demand.any(axis=1), has_demand.argmax(axis=1), history_days)
+    return keys, history, starts
+
+
+def refresh(pincodes=None, today=None):
+    """Recompute and store the forecasts of ``pincodes`` (default: all). Returns the series count.
+
+    Forecasts are written in the caller's session; the caller commits.
+    """
+    config = current_app.config
+    today = today or datetime.utcnow().date()
+    horizon_weeks = config["FORECAST_HORIZON_WEEKS"]
+    history_days = config["FORECAST_HISTORY_DAYS"]
+    computed_at = datetime.utcnow()
+
+    stale = DemandForecast.query
+    if pincodes is None:
+        # Lock every known pincode first, then add the ones with new demand
+        db.session.execute(update(ForecastRun).values(computed_at=computed_at))
+        _claim({pincode for (pincode,) in db.session.query(ForecastRun.pincode)} | {
+            pincode for (pincode,) in db.session.query(DailyDemand.pincode)
+            .filter(DailyDemand.day >= today - timedelta(days=history_days), DailyDemand.day < today).distinct()
+        }, computed_at)
+    else:
+        pincodes = set(pincodes)
+        _claim(pincodes, computed_at)
+        stale = stale.filter(DemandForecast.pincode.in_(pincodes))
+    keys, history, starts = load_history(pincodes, today, history_days)
+    stale.delete(synchronize_session=False)
+    if not keys:
+        return 0
+
+    forecast, lower, upper, naive = smooth(history, starts, horizon_weeks)
+    rows = [
+        {
+            "pincode": pincode,
+            "food_id": food_id,
+            "week_start": today + timedelta(weeks=week),
+            "quantity": float(forecast[position, week]),
+            "lower": float(lower[position, week]),
+            "upper": float(upper[position, week]),
+            "model": SEASONAL_NAIVE if naive[position] else SEASONAL_SMOOTHING,
+            "computed_at": computed_at,
+        }
+        for position, (pincode, food_id) in enumerate(keys)
+        for week in range(horizon_weeks)
+    ]
+    db.session.execute(DemandForecast.__table__.insert(), rows)
+    series = {}
+    for pincode, _ in keys:
+        series[pincode] = series.get(pincode, 0) + 1
+    db.session.execute(update(ForecastRun), [{"pincode": pincode, "series": count} for pincode, count in series.items()])
+    logger.info("Forecast %s demand series", len(keys))
+    return len(keys)
+
+
+def _claim(pincodes, computed_at):
+    """Lock the ``forecast_run`` rows of ``pincodes``, created with no series if missing, until the caller commits."""
+    if not pincodes:
+        return
+    # A row another worker is creating is waited for until its refresh commits
+    upsert(
+        ForecastRun,
+        [{"pincode": pincode, "computed_at": computed_at, "series": 0} for pincode in sorted(pincodes)],
+        key=["pincode"],
+        update=lambda excluded: {"computed_at": excluded.computed_at, "series": 0},
+    )
+
+
+def is_stale(run):
+    """Whether the :class:`ForecastRun` ``run`` (None: never computed) is due for recomputing."""
+    return run is None or run.computed_at < datetime.utcnow() - current_app.config["FORECAST_MAX_AGE"]
+
+
+def schedule_refresh(pincode):
+    """Recompute ``pincode`` on the ``forecasts`` pool unless this process already is. Returns False if it is."""
+    with _in_flight_lock:
+        if pincode in _in_flight:
+            return False
+        _in_flight.add(pincode)
+    try:
+        background.submit("forecasts", current_app.config["FORECAST_WORKERS"], _refresh_stale, pincode)
+    except Exception:
+        with _in_flight_lock:
+            _in_flight.discard(pincode)
+        raise
+    return True
+
+
+def _refresh_stale(pincode):
+    try:
+        # Background threads read the primary, so this sees refreshes by other workers
+        stale = is_stale(db.session.get(ForecastRun, pincode))
+        db.session.rollback()  # the refresh starts with its lock, in a new transaction
+        if stale:
+            refresh([pincode])
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(pincode)
+
+
+def _as_date(value):
+    # SQLite hands back DATE values as strings when they come out of an aggregate query
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
@@ -0,0 +1,136 @@
+# foodloop_app/gemini.py
+"""Single entry point for text generation calls.
+
+``GEMINI_BACKEND`` selects where prompts go: ``"gemini"`` (default) calls the
+Gemini API, ``"stub"`` answers locally and deterministically so the app can
+run in tests and benchmarks without network access or an API key.
+
+Every call first takes a token from a process-wide token bucket refilled at
+``GEMINI_CALLS_PER_SECOND`` (bursts up to ``GEMINI_BURST``), so no mix of
+shelf-life estimates and demand insights can exceed the model quota.
+Call latency and failures are counted in metrics.py.
+"""
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import google.generativeai as genai
+from flask import current_app, has_request_context
+
+from . import metrics
+
+MODEL_NAME = "gemini-1.5-pro"
+
+
+class GeminiNotConfigured(Exception):
+    """Raised when the Gemini backend is selected but no API key is set."""
+
+
+class GeminiRateLimited(Exception):
+    """Raised when no call slot frees up in time.
+
+    Background tasks wait up to ``GEMINI_RATE_LIMIT_TIMEOUT`` seconds, calls made
+    while serving a request only ``GEMINI_REQUEST_RATE_LIMIT_TIMEOUT``.
+    """
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, at most ``capacity`` saved up."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """Take one token, waiting up to ``timeout`` seconds. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+_bucket = None
+_bucket_lock = threading.Lock()
+
+
+def _call_slot():
+    global _bucket
+    rate = current_app.config["GEMINI_CALLS_PER_SECOND"]
+    burst = current_app.config["GEMINI_BURST"]
+    with _bucket_lock:
+        if _bucket is None or (_bucket.rate, _bucket.capacity) != (rate, burst):
+            _bucket = TokenBucket(rate, burst)
+        bucket = _bucket
+    timeout = "GEMINI_REQUEST_RATE_LIMIT_TIMEOUT" if has_request_context() else "GEMINI_RATE_LIMIT_TIMEOUT"
+    if not bucket.acquire(current_app.config[timeout]):
+        raise GeminiRateLimited("Too many model calls; try again shortly")
+
+
+def is_configured():
+    return current_app.config["GEMINI_BACKEND"] == "stub" or bool(os.getenv("GEMINI_API_KEY"))
+
+
+def get_model():
+    if current_app.config["GEMINI_BACKEND"] == "stub":
+        return StubModel()
+    if not os.getenv("GEMINI_API_KEY"):
+        raise GeminiNotConfigured("Gemini API key not configured")
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel(MODEL_NAME)
+
+
+def generate(prompt):
+    """Send ``prompt`` to the configured model and return the stripped reply text."""
+    with metrics.gemini_call(current_app.config["GEMINI_BACKEND"]):
+        model = get_model()
+        _call_slot()
+        response = model.generate_content(prompt)
+        return response.text.strip()
+
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """Offline stand-in for ``genai.GenerativeModel``.
+
+    Shelf-life prompts (single or numbered batch) get dates 10 and 30 days
+    after the date in the prompt; any other prompt gets a fixed insight
+    paragraph.
+    """
+
+    SHELF_LIFE_PROMPT = re.compile(r"the current date is (\d{4}-\d{2}-\d{2})")
+    NUMBERED_ITEM = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+    def generate_content(self, prompt):
+        match = self.SHELF_LIFE_PROMPT.search(prompt)
+        if match:
+            today = datetime.combine(date.fromisoformat(match.group(1)), datetime.min.time())
+            best_before = today + timedelta(days=10, hours=12)
+            expires_at = today + timedelta(days=30, hours=12)
+            dates = f"best_before:{best_before.isoformat()}, expires_at:{expires_at.isoformat()}"
+            numbers = self.NUMBERED_ITEM.findall(prompt)
+            if numbers:
+                # Batched prompt: one numbered answer line per item
+                return _StubResponse("\n".join(f"{number}: {dates}" for number in numbers))
+            return _StubResponse(dates)
+        return _StubResponse(
+            "Demand in this region is steady for the listed items. "
+            "Consider keeping a regular supply of the top items."
+        )
@@ -0,0 +1,124 @@
+# foodloop_app/geo.py
+"""Distance between pincodes, from an offline table of pincode centroids.
+
+Centroids are loaded from a local CSV file (``flask --app run load-pincodes``)
+into :class:`~foodloop_app.models.PincodeCentroid`. Each centroid is also
+bucketed into a grid cell of ``CELL_DEGREES`` so the pincodes around a point
+are found with an indexed range scan over the surrounding cells, then trimmed
+to the exact radius with the haversine distance.
+"""
+import csv
+import math
+
+from sqlalchemy import case
+
+from foodloop_app import db
+from foodloop_app.models import PincodeCentroid
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+CELL_DEGREES = 0.1  # about 11 km of latitude per cell
+
+# Accepted CSV headers (case-insensitive), e.g. the India Post pincode directory
+PINCODE_COLUMNS = ("pincode",)
+LATITUDE_COLUMNS = ("latitude", "lat")
+LONGITUDE_COLUMNS = ("longitude", "lon", "lng", "long")
+
+
+def cell_of(latitude, longitude):
+    return math.floor(latitude / CELL_DEGREES), math.floor(longitude / CELL_DEGREES)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def nearby_pincodes(pincode, radius_km):
+    """Pincodes within ``radius_km`` of ``pincode``, as ``{pincode: distance in metres}``.
+
+    A pincode missing from the centroid table only matches itself.
+    """
+    origin = db.session.get(PincodeCentroid, pincode)
+    if origin is None:
+        return {pincode: 0}
+
+    lat_span = radius_km / KM_PER_DEGREE
+    # Longitude degrees shrink towards the poles; clamp to keep the box finite
+    lon_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(origin.latitude)), 0.01))
+    min_cell_lat, min_cell_lon = cell_of(origin.latitude - lat_span, origin.longitude - lon_span)
+    max_cell_lat, max_cell_lon = cell_of(origin.latitude + lat_span, origin.longitude + lon_span)
+
+    candidates = db.session.query(
+        PincodeCentroid.pincode, PincodeCentroid.latitude, PincodeCentroid.longitude
+    ).filter(
+        PincodeCentroid.cell_lat.between(min_cell_lat, max_cell_lat),
+        PincodeCentroid.cell_lon.between(min_cell_lon, max_cell_lon),
+    )
+    distances = {}
+    for code, latitude, longitude in candidates:
+        distance = haversine_km(origin.latitude, origin.longitude, latitude, longitude)
+        if distance <= radius_km:
+            distances[code] = round(distance * 1000)
+    distances[pincode] = 0
+    return distances
+
+
+def distance_expression(column, distances):
+    """SQL expression giving the distance in metres for the pincode in ``column``."""
+    return case(distances, value=column, else_=None)
+
+
+def _pick(header, names):
+    lowered = {name.strip().lower(): name for name in header}
+    for name in names:
+        if name in lowered:
+            return lowered[name]
+    raise ValueError(f"Pincode file needs one of the columns: {', '.join(names)}")
+
+
+def read_centroids(path):
+    """Average latitude/longitude per pincode from a CSV file.
+
+    Files listing several post offices per pincode are collapsed to their mean
+    position; rows without usable coordinates (e.g. ``NA``) are skipped.
+    """
+    sums = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        pincode_column = _pick(reader.fieldnames or [], PINCODE_COLUMNS)
+        latitude_column = _pick(reader.fieldnames, LATITUDE_COLUMNS)
+        longitude_column = _pick(reader.fieldnames, LONGITUDE_COLUMNS)
+        for row in reader:
+            pincode = (row[pincode_column] or "").strip()
+            try:
+                latitude = float(row[latitude_column])
+                longitude = float(row[longitude_column])
+            except (TypeError, ValueError):
+                continue
+            if not pincode or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                continue
+            total = sums.setdefault(pincode, [0.0, 0.0, 0])
+            total[0] += latitude
+            total[1] += longitude
+            total[2] += 1
+    return {pincode: (lat / count, lon / count) for pincode, (lat, lon, count) in sums.items()}
+
+
+def load_centroids(centroids):
+    """Replace the centroid table with ``{pincode: (latitude, longitude)}``."""
+    rows = []
+    for pincode, (latitude, longitude) in centroids.items():
+        cell_lat, cell_lon = cell_of(latitude, longitude)
+        rows.append({
+            "pincode": pincode,
+            "latitude": latitude,
+            "longitude": longitude,
+            "cell_lat": cell_lat,
+            "cell_lon": cell_lon,
+        })
+    db.session.query(PincodeCentroid).delete()
+    if rows:
+        db.session.execute(PincodeCentroid.__table__.insert(), rows)
+    db.session.commit()
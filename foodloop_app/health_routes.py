@@ -0,0 +1,27 @@
+# foodloop_app/health_routes.py
+from flask import Blueprint, Response, jsonify
+
+from . import lifecycle, metrics
+
+health_bp = Blueprint("health", __name__)
+
+
+@health_bp.route("/healthz", methods=["GET"])
+def liveness():
+    # The process is up and serving; says nothing about the database
+    return jsonify({"status": "ok"}), 200
+
+
+@health_bp.route("/readyz", methods=["GET"])
+def readiness():
+    # Load balancers send traffic only while this returns 200 (see lifecycle.py)
+    error = lifecycle.readiness_error()
+    if error:
+        return jsonify({"status": "unavailable", "error": error}), 503
+    return jsonify({"status": "ready"}), 200
+
+
+@health_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    # Prometheus scrape target; restrict it to the internal network at the proxy
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,182 @@
+# foodloop_app/identity.py
+"""Resolve the user behind a JWT without a database query per request.
+
+Access tokens carry the user's ``fs_uniquifier`` as their identity.
+Protected routes get the user from ``flask_jwt_extended.get_current_user()``,
+loaded by the ``user_lookup_loader`` registered here. The loader reads from a
+bounded in-process LRU of :class:`Identity` snapshots.
+
+Updating, deactivating or deleting a user through the ORM evicts its entry in
+the process that made the change. An update also stamps ``user.changed_at``;
+every other process reads the users changed since its last look every
+``IDENTITY_SYNC_INTERVAL`` seconds (:func:`sync`) and evicts them too. A
+deleted user leaves no row to find, so other processes only drop it after
+``IDENTITY_CACHE_TTL``; deactivate users to lock them out at once.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, selectinload
+
+from foodloop_app import db
+from . import background
+from .models import User
+from .routing import primary, set_user
+
+_PENDING_EVICTIONS = "identity_evictions"
+
+_identities = OrderedDict()  # token identity (fs_uniquifier) -> (loaded_at, Identity)
+_identities_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Identity:
+    """Read-only snapshot of a user, safe to share between requests and threads."""
+
+    id: int
+    email: str
+    city: str
+    pincode: str
+    contact: str
+    fs_uniquifier: str
+    active: bool
+    roles: frozenset
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            id=user.id,
+            email=user.email,
+            city=user.city,
+            pincode=user.pincode,
+            contact=user.contact,
+            fs_uniquifier=user.fs_uniquifier,
+            active=bool(user.active),
+            roles=frozenset(role.name for role in user.roles),
+        )
+
+
+def remember(user):
+    """Cache a snapshot of ``user``, e.g. right after login."""
+    identity = Identity.from_user(user)
+    _put(identity.fs_uniquifier, identity)
+    return identity
+
+
+def lookup(token_identity):
+    """The active user a token identity refers to, or None."""
+    identity = _get(token_identity)
+    if identity is None:
+        query = User.query.options(selectinload(User.roles))
+        # From the primary, so a user who just signed up is not unknown on a lagging replica
+        with primary():
+            user = query.filter_by(fs_uniquifier=token_identity).first()
+            if user is None and "@" in token_identity:
+                # Tokens issued before identities moved to fs_uniquifier carry the email
+                user = query.filter_by(email=token_identity).first()
+        if user is None:
+            return None
+        identity = Identity.from_user(user)
+        _put(token_identity, identity)
+        _start_sync()
+    return identity if identity.active else None
+
+
+def evict_users(user_ids):
+    """Drop the cached snapshots of ``user_ids``, under whichever token identity they were cached."""
+    with _identities_lock:
+        stale = [key for key, (_, identity) in _identities.items() if identity.id in user_ids]
+        for key in stale:
+            del _identities[key]
+
+
+def sync():
+    """Evict users changed through other processes since the last sync."""
+    app = current_app._get_current_object()
+    with _sync_lock:
+        state = app.extensions.setdefault("identity_sync", {"synced_through": None, "seen": {}})
+        now = datetime.utcnow()
+        overlap = timedelta(seconds=app.config["IDENTITY_SYNC_OVERLAP"])
+        since = (state["synced_through"] or now) - overlap
+        with db.engine.connect() as conn:
+            changed = conn.execute(select(User.id, User.changed_at).where(User.changed_at >= since)).all()
+        # Changes re-read within the overlap were handled already
+        fresh = {row.id for row in changed if state["seen"].get(row.id) != row.changed_at}
+        state["seen"] = {row.id: row.changed_at for row in changed}
+        state["synced_through"] = max([now] + [row.changed_at for row in changed])
+    if fresh:
+        evict_users(fresh)
+
+
+def _start_sync():
+    app = current_app._get_current_object()
+    background.every(f"identity-sync-{id(app)}", app.config["IDENTITY_SYNC_INTERVAL"], sync)
+
+
+def _get(key):
+    with _identities_lock:
+        entry = _identities.get(key)
+        if entry is None:
+            return None
+        loaded_at, identity = entry
+        if time.monotonic() - loaded_at > current_app.config["IDENTITY_CACHE_TTL"]:
+            del _identities[key]
+            return None
+        _identities.move_to_end(key)
+        return identity
+
+
+def _put(key, identity):
+    with _identities_lock:
+        _identities[key] = (time.monotonic(), identity)
+        _identities.move_to_end(key)
+        while len(_identities) > current_app.config["IDENTITY_CACHE_MAX_ENTRIES"]:
+            _identities.popitem(last=False)
+
+
+def register_user_loader(jwt):
+    @jwt.user_lookup_loader
+    def load_user(jwt_header, jwt_data):
+        identity = lookup(jwt_data[current_app.config["JWT_IDENTITY_CLAIM"]])
+        if identity is not None:
+            set_user(identity.id)  # For read-your-writes routing
+        return identity
+
+    @jwt.user_lookup_error_loader
+    def user_lookup_error(jwt_header, jwt_data):
+        return jsonify({"error": "User not found or inactive"}), 401
+
+
+@event.listens_for(User, "before_update")
+def _stamp_changed_user(mapper, connection, user):
+    # Also called for role-only changes, which mark the user dirty
+    user.changed_at = datetime.utcnow()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _evict_changed_user(mapper, connection, user):
+    # Role changes count too: they mark the user dirty
+    evict_users({user.id})
+    # Evicted again after commit, in case a request cached the old row in between
+    session = Session.object_session(user)
+    if session is not None:
+        session.info.setdefault(_PENDING_EVICTIONS, set()).add(user.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_after_commit(session):
+    user_ids = session.info.pop(_PENDING_EVICTIONS, None)
+    if user_ids:
+        evict_users(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending_evictions(session):
+    session.info.pop(_PENDING_EVICTIONS, None)
@@ -0,0 +1,94 @@
+# foodloop_app/insights.py
+"""Cached model-written demand insights for the farmer forecast.
+
+Insight text is cached per pincode and hash of the demand summary it was
+written from, for ``INSIGHTS_CACHE_TTL`` seconds. Requests never wait on the
+model: a missing or expired entry is regenerated on the ``insights``
+background pool, and meanwhile the caller gets the pincode's previous text
+(``"stale"``) or a placeholder (``"pending"``). Concurrent requests for the
+same entry share one in-flight call. Calls are also rate limited globally in
+gemini.py.
+
+A failed call is remembered for ``INSIGHTS_RETRY_AFTER`` seconds instead of
+being cached as text. Until a later attempt succeeds, the caller gets older
+text as ``"stale"`` or a notice as ``"error"``; the first request after that
+time starts the retry.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from . import background, gemini
+
+logger = logging.getLogger(__name__)
+
+PENDING_TEXT = "Insights for your region are being prepared. Check back in a moment."
+FAILED_TEXT = "Insights for your region are unavailable right now. Check back later."
+
+_entries = OrderedDict()  # (pincode, summary hash) -> (text, expires_at)
+_latest = {}  # pincode -> key of its most recently generated entry
+_failures = OrderedDict()  # key -> time.monotonic() after which a failed generation is retried
+_in_flight = set()
+_lock = threading.Lock()
+
+
+def insight_for(pincode, summary, prompt):
+    """Return ``(text, status)`` for ``summary`` without waiting on the model.
+
+    ``status`` is ``"fresh"``, ``"stale"`` (older text while a refresh runs
+    or after it failed), ``"pending"`` (nothing to show yet) or ``"error"``
+    (the last attempt failed and there is nothing older to show).
+    """
+    key = (pincode, hashlib.sha256(summary.encode()).hexdigest())
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[1] > now:
+            _entries.move_to_end(key)
+            return entry[0], "fresh"
+        if entry is None:
+            entry = _entries.get(_latest.get(pincode))
+        failed = key in _failures  # until a generation succeeds
+        if _failures.get(key, 0) <= now and key not in _in_flight:
+            _in_flight.add(key)
+            try:
+                background.submit("insights", current_app.config["INSIGHTS_WORKERS"], _refresh, key, prompt)
+            except Exception:
+                _in_flight.discard(key)  # e.g. the pool is shut down; the next request tries again
+                raise
+    if entry is not None:
+        return entry[0], "stale"
+    if failed:
+        return FAILED_TEXT, "error"
+    return PENDING_TEXT, "pending"
+
+
+def _refresh(key, prompt):
+    config = current_app.config
+    try:
+        text = gemini.generate(prompt)
+    except Exception as e:
+        logger.error("Demand insight generation failed: %s", e)
+        with _lock:
+            _in_flight.discard(key)
+            # Older text, if any, stays as it was; only the retry is delayed
+            _failures[key] = time.monotonic() + config["INSIGHTS_RETRY_AFTER"]
+            _failures.move_to_end(key)
+            while len(_failures) > config["INSIGHTS_CACHE_MAX_ENTRIES"]:
+                _failures.popitem(last=False)
+        return
+
+    with _lock:
+        _in_flight.discard(key)
+        _failures.pop(key, None)
+        _entries[key] = (text, time.monotonic() + config["INSIGHTS_CACHE_TTL"])
+        _entries.move_to_end(key)
+        _latest[key[0]] = key
+        while len(_entries) > config["INSIGHTS_CACHE_MAX_ENTRIES"]:
+            evicted, _ = _entries.popitem(last=False)
+            if _latest.get(evicted[0]) == evicted:
+                del _latest[evicted[0]]
@@ -0,0 +1,42 @@
+# foodloop_app/lifecycle.py
+"""Readiness and graceful shutdown of a server process (see gunicorn.conf.py).
+
+A process is ready once it can reach the database and ``flask --app run
+init-db`` has created the schema and roles. On shutdown the server stops
+accepting connections and waits up to ``graceful_timeout`` for requests in
+flight; :func:`begin_shutdown` ends long-polls and event streams at once so
+they do not hold the process for that long, and stops background work.
+"""
+import threading
+
+from sqlalchemy import func
+
+from foodloop_app import db
+from . import background, events
+from .models import ROLES, Role
+
+_draining = threading.Event()
+
+
+def begin_shutdown():
+    _draining.set()
+    events.close()
+    background.shutdown(wait=False)
+
+
+def is_draining():
+    return _draining.is_set()
+
+
+def readiness_error():
+    """Why this process should not get traffic yet, or None when it is ready."""
+    if is_draining():
+        return "Shutting down"
+    try:
+        roles = db.session.query(func.count(Role.id)).filter(Role.name.in_(ROLES)).scalar()
+    except Exception as e:
+        db.session.rollback()
+        return f"Database unavailable: {e.__class__.__name__}"
+    if roles < len(ROLES):
+        return "Database not initialized; run `flask --app run init-db`"
+    return None
@@ -0,0 +1,295 @@
+# foodloop_app/metrics.py
+"""Request, SQL and model-call metrics in the Prometheus text format.
+
+:func:`register` times every request per blueprint and endpoint and counts
+the SQL statements it runs and the time they take (engine cursor events, on
+every engine including the replica). :func:`gemini_call` records model call
+latency and outcomes. ``GET /metrics`` renders everything.
+
+Requests slower than ``SLOW_REQUEST_SECONDS`` are logged with their SQL
+grouped by statement, slowest first. Streamed responses (event streams,
+``ndjson`` exports) are timed until the response starts.
+
+Values live in the worker process. With several workers set ``METRICS_DIR``
+to a directory shared by them (empty it on deploy): each process writes its
+values there every ``METRICS_WRITE_INTERVAL`` seconds and ``/metrics`` adds
+up all files, including those of workers that have exited, so counters only
+go up.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from . import background
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SLOW_LOG_STATEMENTS = 10  # distinct statements shown per slow request
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def lines(self, values):
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._values = {}  # label values -> [count per bucket and +Inf (not cumulative), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def lines(self, values):
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _labels(self.labels + ("le",), key + [_number(bound)])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {cumulative}"
+
+
+REQUEST_LABELS = ("blueprint", "endpoint", "method")
+
+REQUEST_SECONDS = Histogram(
+    "foodloop_http_request_duration_seconds", "Time to produce a response.", REQUEST_LABELS, LATENCY_BUCKETS
+)
+REQUESTS = Counter("foodloop_http_requests_total", "Responses by status code.", REQUEST_LABELS + ("status",))
+REQUEST_STATEMENTS = Histogram(
+    "foodloop_http_request_sql_statements", "SQL statements run per request.", REQUEST_LABELS, STATEMENT_BUCKETS
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "foodloop_http_request_sql_duration_seconds", "Time spent in SQL per request.", REQUEST_LABELS, LATENCY_BUCKETS
+)
+GEMINI_SECONDS = Histogram(
+    "foodloop_gemini_call_duration_seconds", "Model call latency, including the rate limit wait.", ("backend",),
+    LATENCY_BUCKETS,
+)
+GEMINI_CALLS = Counter("foodloop_gemini_calls_total", "Model calls by outcome.", ("backend", "outcome"))
+GEMINI_ERRORS = Counter("foodloop_gemini_errors_total", "Failed model calls by exception type.", ("backend", "error"))
+SHELF_LIFE_CACHE = Counter(
+    "foodloop_shelf_life_cache_total", "Shelf-life estimate cache hits, misses and evictions.", ("result",)
+)
+
+METRICS = (
+    REQUEST_SECONDS, REQUESTS, REQUEST_STATEMENTS, REQUEST_SQL_SECONDS, GEMINI_SECONDS, GEMINI_CALLS, GEMINI_ERRORS,
+    SHELF_LIFE_CACHE,
+)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def register(app):
+    """Time this app's requests and count the SQL they run on every engine of ``db``."""
+    from foodloop_app import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    @app.before_request
+    def start_request_timer():
+        g._metrics_started = time.perf_counter()
+        g._metrics_sql = {}  # statement -> [count, seconds]
+        if app.config["METRICS_DIR"]:
+            background.every("metrics-write", app.config["METRICS_WRITE_INTERVAL"], write_snapshot)
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("_metrics_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        sql = g.pop("_metrics_sql", {})
+        statements = sum(count for count, _ in sql.values())
+        sql_seconds = sum(seconds for _, seconds in sql.values())
+        labels = (request.blueprint or "", request.endpoint or "unmatched", request.method)
+        REQUEST_SECONDS.observe(elapsed, *labels)
+        REQUESTS.inc(*labels, str(response.status_code))
+        REQUEST_STATEMENTS.observe(statements, *labels)
+        REQUEST_SQL_SECONDS.observe(sql_seconds, *labels)
+        if elapsed >= app.config["SLOW_REQUEST_SECONDS"]:
+            _log_slow_request(response, elapsed, statements, sql_seconds, sql)
+        return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None or not has_request_context():
+        return
+    sql = g.get("_metrics_sql")
+    if sql is None:
+        return
+    entry = sql.get(statement)
+    if entry is None:
+        entry = sql[statement] = [0, 0.0]
+    entry[0] += 1
+    entry[1] += time.perf_counter() - started
+
+
+def _log_slow_request(response, elapsed, statements, sql_seconds, sql):
+    slowest = sorted(sql.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_LOG_STATEMENTS]
+    breakdown = "".join(
+        f"\n  {count:4}x {seconds * 1000:9.1f} ms  {' '.join(statement.split())[:300]}"
+        for statement, (count, seconds) in slowest
+    )
+    logger.warning(
+        "Slow request %s %s -> %s in %.0f ms: %s SQL statements in %.0f ms%s",
+        request.method, request.path, response.status_code, elapsed * 1000, statements, sql_seconds * 1000,
+        breakdown,
+    )
+
+
+@contextmanager
+def gemini_call(backend):
+    """Time the model call in the block and count its outcome."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        GEMINI_CALLS.inc(backend, "error")
+        GEMINI_ERRORS.inc(backend, type(e).__name__)
+        raise
+    else:
+        GEMINI_CALLS.inc(backend, "ok")
+    finally:
+        GEMINI_SECONDS.observe(time.perf_counter() - started, backend)
+
+
+def _snapshot():
+    return {metric.name: metric.snapshot() for metric in METRICS}
+
+
+_file_names = {}  # pid -> this process's file name
+
+
+def _snapshot_path(directory):
+    pid = os.getpid()
+    if pid not in _file_names:
+        # First-write time in the name: a later process reusing the pid must not overwrite these totals
+        _file_names[pid] = f"{pid}-{time.time_ns()}.json"
+    return os.path.join(directory, _file_names[pid])
+
+
+def write_snapshot():
+    """Write this process's values to ``METRICS_DIR``."""
+    directory = current_app.config["METRICS_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory)
+    with open(path + ".tmp", "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(path + ".tmp", path)
+
+
+def _snapshots():
+    directory = current_app.config["METRICS_DIR"]
+    if not directory:
+        return [_snapshot()]
+    write_snapshot()
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            logger.warning("Skipping unreadable metrics file %s", name, exc_info=True)
+    return snapshots
+
+
+def _merged(metric, snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.get(metric.name, []):
+            merged[tuple(key)] = metric.merge(merged.get(tuple(key)), value)
+    return merged
+
+
+def totals(metric):
+    """``{label values: value}`` of ``metric``, added up over all workers when ``METRICS_DIR`` is set."""
+    return _merged(metric, _snapshots())
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    snapshots = _snapshots()
+    lines = []
+    for metric in METRICS:
+        merged = _merged(metric, snapshots)
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.lines([[list(key), value] for key, value in sorted(merged.items())]))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,252 @@
+# foodloop_app/migrations.py
+"""In-place schema upgrades for databases created by older versions of the app.
+
+``db.create_all()`` only creates missing tables; it never changes existing
+ones. :func:`upgrade` brings an existing database up to the current models:
+it adds missing columns, relaxes NOT NULL constraints the models dropped,
+backfills derived and moved columns, drops moved ones and creates missing
+indexes. Every step checks the live schema first, so running it again is a
+no-op apart from refreshing the planner statistics.
+
+Run it with ``flask --app run upgrade-db``.
+"""
+import logging
+
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.schema import CreateColumn, CreateTable
+
+from foodloop_app import db
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade(engine):
+    """Upgrade the database behind ``engine`` to the current models."""
+    db.metadata.create_all(engine)
+    with engine.connect() as conn:
+        sqlite = conn.dialect.name == "sqlite"
+        if sqlite:
+            # Table rebuilds drop tables others refer to. SQLite ignores this
+            # pragma inside a transaction, so set it first; checked before commit.
+            foreign_keys = conn.exec_driver_sql("PRAGMA foreign_keys").scalar()
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            conn.commit()
+        try:
+            with conn.begin():
+                for step in STEPS:
+                    step(conn)
+                if sqlite:
+                    _check_foreign_keys(conn)
+        finally:
+            if sqlite:
+                conn.exec_driver_sql(f"PRAGMA foreign_keys={'ON' if foreign_keys else 'OFF'}")
+                conn.commit()
+    logger.info("Database schema is up to date.")
+
+
+def _check_foreign_keys(conn):
+    """Raise if the upgraded SQLite tables have rows referring to missing ones."""
+    violations = conn.exec_driver_sql("PRAGMA foreign_key_check").all()
+    if violations:
+        tables = sorted({f"{row[0]} -> {row[2]}" for row in violations})
+        raise RuntimeError(f"Upgrade left {len(violations)} rows with broken foreign keys: {', '.join(tables)}")
+
+
+def _columns(conn, table_name):
+    return {column["name"]: column for column in inspect(conn).get_columns(table_name)}
+
+
+def _rebuild_sqlite_table(conn, table):
+    """Recreate ``table`` from the model, copying the shared columns.
+
+    SQLite cannot alter a column's constraints in place; this is its documented
+    create-copy-drop-rename procedure, run with foreign keys off (see
+    :func:`upgrade`). Indexes are recreated by a later step.
+    """
+    live_columns = _columns(conn, table.name)
+    shared = ", ".join(f'"{column.name}"' for column in table.columns if column.name in live_columns)
+    temp_name = f"{table.name}__new"
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect))
+    ddl = ddl.replace(f"CREATE TABLE {table.name} ", f"CREATE TABLE {temp_name} ", 1)
+    ddl = ddl.replace(f'CREATE TABLE "{table.name}" ', f"CREATE TABLE {temp_name} ", 1)
+
+    # Left behind if an earlier run was interrupted (SQLite DDL is not always transactional)
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {temp_name}")
+    conn.exec_driver_sql(ddl)
+    conn.exec_driver_sql(f'INSERT INTO {temp_name} ({shared}) SELECT {shared} FROM "{table.name}"')
+    conn.exec_driver_sql(f'DROP TABLE "{table.name}"')
+    conn.exec_driver_sql(f'ALTER TABLE {temp_name} RENAME TO "{table.name}"')
+    logger.info("Rebuilt table %s", table.name)
+
+
+def relax_not_null(conn):
+    """Drop NOT NULL from columns the models now allow to be empty."""
+    for table in db.metadata.sorted_tables:
+        live_columns = _columns(conn, table.name)
+        relaxed = [
+            column for column in table.columns
+            if column.nullable and column.name in live_columns and not live_columns[column.name]["nullable"]
+        ]
+        if not relaxed:
+            continue
+        if conn.dialect.name == "sqlite":
+            _rebuild_sqlite_table(conn, table)
+        else:
+            for column in relaxed:
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" DROP NOT NULL')
+                logger.info("Made %s.%s nullable", table.name, column.name)
+
+
+def add_missing_columns(conn):
+    """Add model columns the live tables do not have yet.
+
+    Columns are added as nullable; NOT NULL is only enforced on new rows by
+    the models, since existing rows may still need a backfill.
+    """
+    for table in db.metadata.sorted_tables:
+        live_columns = _columns(conn, table.name)
+        for column in table.columns:
+            if column.name in live_columns:
+                continue
+            column_ddl = str(CreateColumn(column).compile(dialect=conn.dialect)).replace(" NOT NULL", "")
+            conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {column_ddl}')
+            logger.info("Added column %s.%s", table.name, column.name)
+
+
+def backfill_food_name_lower(conn):
+    """Fill ``food.name_lower`` for rows written before the column existed."""
+    food = db.metadata.tables["food"]
+    while True:
+        rows = conn.execute(
+            select(food.c.id, food.c.name).where(food.c.name_lower.is_(None)).limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        # Lowercase in Python: SQLite's lower() only folds ASCII
+        for row in rows:
+            conn.execute(update(food).where(food.c.id == row.id).values(name_lower=row.name.lower()))
+        logger.info("Backfilled name_lower for %s food rows", len(rows))
+
+
+def merge_duplicate_inventory_items(conn):
+    """Keep one inventory row per (user_id, food_id) before the unique index is built.
+
+    The kept row takes over the others' requests and their stock. It runs
+    before :func:`move_stock_to_inventory_items`, so old databases split the
+    food's quantity over the merged rows only.
+    """
+    duplicates = conn.execute(text(
+        "SELECT user_id, food_id, MIN(id) AS keep_id FROM inventory_item "
+        "GROUP BY user_id, food_id HAVING COUNT(*) > 1"
+    )).all()
+    for user_id, food_id, keep_id in duplicates:
+        params = {"user_id": user_id, "food_id": food_id, "keep_id": keep_id}
+        conn.execute(text(
+            "UPDATE food_request SET inventory_item_id = :keep_id WHERE inventory_item_id IN "
+            "(SELECT id FROM inventory_item WHERE user_id = :user_id AND food_id = :food_id AND id != :keep_id)"
+        ), params)
+        # Still NULL before the stock moved here from food; SUM keeps it so
+        conn.execute(text(
+            "UPDATE inventory_item SET "
+            "quantity = (SELECT SUM(quantity) FROM inventory_item AS same "
+            "WHERE same.user_id = :user_id AND same.food_id = :food_id), "
+            "held_quantity = (SELECT COALESCE(SUM(held_quantity), 0) FROM inventory_item AS same "
+            "WHERE same.user_id = :user_id AND same.food_id = :food_id) "
+            "WHERE id = :keep_id"
+        ), params)
+        conn.execute(text(
+            "DELETE FROM inventory_item WHERE user_id = :user_id AND food_id = :food_id AND id != :keep_id"
+        ), params)
+    if duplicates:
+        logger.info("Merged %s duplicate inventory rows", len(duplicates))
+
+
+# Stock columns that moved from the shared food row to each inventory item
+MOVED_FOOD_COLUMNS = ("quantity", "best_before", "expires_at", "status", "enrichment_attempts", "enrichment_error")
+
+
+def move_stock_to_inventory_items(conn):
+    """Copy stock from ``food`` rows onto the inventory items that stock them.
+
+    The old shared quantity was the sum of every retailer's additions, which
+    are not recorded separately; it is split evenly between the retailers
+    stocking the food so the total is kept. Dates and status are copied as is.
+    """
+    food_columns = _columns(conn, "food")
+    if "quantity" not in food_columns:
+        return
+    copied = [name for name in MOVED_FOOD_COLUMNS if name != "quantity" and name in food_columns]
+    assignments = [
+        "quantity = (SELECT COALESCE(food.quantity, 0) / "
+        "(SELECT COUNT(*) FROM inventory_item AS stocked WHERE stocked.food_id = food.id) "
+        "FROM food WHERE food.id = inventory_item.food_id)"
+    ] + [
+        f"{name} = (SELECT food.{name} FROM food WHERE food.id = inventory_item.food_id)"
+        for name in copied
+    ]
+    result = conn.execute(text(f"UPDATE inventory_item SET {', '.join(assignments)} WHERE quantity IS NULL"))
+    if result.rowcount:
+        logger.info("Moved stock onto %s inventory items", result.rowcount)
+
+
+def drop_moved_food_columns(conn):
+    """Drop the stock columns from ``food`` once they are copied to the inventory items."""
+    food_columns = _columns(conn, "food")
+    moved = [name for name in MOVED_FOOD_COLUMNS if name in food_columns]
+    if not moved:
+        return
+    if conn.dialect.name == "sqlite":
+        # The rebuild copies only the model's columns
+        _rebuild_sqlite_table(conn, db.metadata.tables["food"])
+        return
+    for name in moved:
+        conn.exec_driver_sql(f'ALTER TABLE food DROP COLUMN "{name}"')
+        logger.info("Dropped food.%s", name)
+
+
+def backfill_daily_demand(conn):
+    """Build the demand rollup from existing requests when it is still empty."""
+    from .demand import rebuild
+
+    has_rollup = conn.execute(text("SELECT 1 FROM daily_demand LIMIT 1")).first()
+    has_requests = conn.execute(text("SELECT 1 FROM food_request LIMIT 1")).first()
+    if has_requests and not has_rollup:
+        rebuild(conn)
+
+
+def create_missing_indexes(conn):
+    """Create every index declared on the models that the database lacks."""
+    for table in db.metadata.sorted_tables:
+        live_indexes = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in live_indexes:
+                index.create(conn)
+                logger.info("Created index %s", index.name)
+
+
+def refresh_statistics(conn):
+    """Refresh the query planner's statistics.
+
+    Without them SQLite guesses, and e.g. drives the nearby-food query from the
+    food status index instead of the much more selective pincode index.
+    """
+    if conn.dialect.name in ("sqlite", "postgresql"):
+        conn.exec_driver_sql("ANALYZE")
+        logger.info("Refreshed planner statistics")
+
+
+# Backfills run before relax_not_null, whose SQLite table rebuild enforces
+# the models' NOT NULL constraints on the copied rows
+STEPS = [
+    add_missing_columns,
+    backfill_food_name_lower,
+    merge_duplicate_inventory_items,
+    move_stock_to_inventory_items,
+    relax_not_null,
+    drop_moved_food_columns,
+    backfill_daily_demand,
+    create_missing_indexes,
+    refresh_statistics,
+]
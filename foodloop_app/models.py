@@ -1,6 +1,6 @@
 from foodloop_app import db
 from flask_security import UserMixin, RoleMixin
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy import Table, Column, Integer, ForeignKey
 from datetime import datetime
 
@@ -19,14 +19,19 @@ class User(db.Model, UserMixin):
     password = db.Column(db.String, nullable=False)
     active = db.Column(db.Boolean, default=True)
     city = db.Column(db.String)
-    pincode = db.Column(db.String)
+    pincode = db.Column(db.String, index=True)
     contact = db.Column(db.String)
     fs_uniquifier = db.Column(db.String(255), unique=True, nullable=False)
+    # Stamped on every update so other workers drop their cached identity (see identity.py)
+    changed_at = db.Column(db.DateTime, index=True)
 
     roles = relationship("Role", secondary=roles_users, back_populates="users")
     inventory_items = relationship("InventoryItem", back_populates="user")
     food_requests = relationship("FoodRequest", back_populates="user")
 
+# Created by ``flask --app run init-db``
+ROLES = ("Retailer", "Ngo", "Farmer", "Admin")
+
 class Role(db.Model, RoleMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, unique=True)
@@ -36,35 +41,200 @@ class InventoryItem(db.Model):
     __tablename__ = 'inventory_item'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    food_id = db.Column(db.Integer, db.ForeignKey("food.id"), nullable=False)
+    food_id = db.Column(db.Integer, db.ForeignKey("food.id"), nullable=False, index=True)
+    # This retailer's stock of the food; each retailer's row changes independently
+    quantity = db.Column(db.Float, nullable=False, default=0)
+    # Part of quantity held for pending NGO requests; available = quantity - held_quantity (see reservations.py)
+    held_quantity = db.Column(db.Float, nullable=False, default=0, server_default="0")
+    # Dates stay empty while status is "PendingDates" (see enrichment.py)
+    best_before = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime)
+    status = db.Column(db.String, default="Selling")
+    enrichment_attempts = db.Column(db.Integer, default=0)
+    enrichment_error = db.Column(db.String)
 
     food = db.relationship("Food", back_populates="inventory_items")
     user = db.relationship("User", back_populates="inventory_items")
 
+    __table_args__ = (
+        # One row per retailer and food type; also serves lookups by user_id alone
+        db.Index("uq_inventory_item_user_food", "user_id", "food_id", unique=True),
+        # Status filters of the listing feeds, with the in-stock check
+        db.Index("ix_inventory_item_status_quantity", "status", "quantity"),
+        # Date-window scans of the expiry sweep (see notifications.py)
+        db.Index("ix_inventory_item_best_before", "best_before"),
+        db.Index("ix_inventory_item_expires_at", "expires_at"),
+    )
+
 class FoodRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     inventory_item_id = db.Column(
-        db.Integer, db.ForeignKey("inventory_item.id"), nullable=False
+        db.Integer, db.ForeignKey("inventory_item.id"), nullable=False, index=True
     )
-    requester_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    requester_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     quantity = db.Column(db.Float, nullable=False)  # New field
     pickup_date = db.Column(db.DateTime)           # New field
     notes = db.Column(db.String)                   # New optional field
     status = db.Column(db.String, default="pending")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # A pending request holds its quantity until then; empty for requests made before holds existed
+    hold_expires_at = db.Column(db.DateTime)
 
     inventory_item = relationship("InventoryItem")
     user = relationship("User", back_populates="food_requests")
 
+    __table_args__ = (
+        db.Index("ix_food_request_status_created_at", "status", "created_at"),
+        # The hold sweeper's scan of pending requests by expiry
+        db.Index("ix_food_request_status_hold_expires_at", "status", "hold_expires_at"),
+    )
+
 class Food(db.Model):
+    """Catalog entry for a food type, shared by every retailer that stocks it.
+
+    Stock (quantity, dates and status) lives on each retailer's InventoryItem.
+    """
     __tablename__ = 'food'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False, unique=True)
+    # Lowercased copy of name so case-insensitive lookups can use an index
+    name_lower = db.Column(db.String, nullable=False)
     is_refrigerated = db.Column(db.Boolean, default=False)
-    quantity = db.Column(db.Float, nullable=False)
-    best_before = db.Column(db.DateTime, nullable=False)  # New field
-    expires_at = db.Column(db.DateTime, nullable=False)   # New field
-    status = db.Column(db.String, default="Selling")      # New field
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     inventory_items = db.relationship("InventoryItem", back_populates="food")
+
+    __table_args__ = (
+        db.Index("uq_food_name_lower", "name_lower", unique=True),
+    )
+
+    @validates("name")
+    def _sync_name_lower(self, key, name):
+        self.name_lower = name.lower() if name is not None else None
+        return name
+
+class ShelfLifeEstimate(db.Model):
+    """Cached shelf-life estimate for a food name in a city during a given month.
+
+    Dates are stored as day offsets from the day the estimate was made so a
+    cached entry can be re-applied on any later day within its TTL.
+    """
+    __tablename__ = 'shelf_life_estimate'
+    id = db.Column(db.Integer, primary_key=True)
+    name_key = db.Column(db.String, nullable=False)
+    city_key = db.Column(db.String, nullable=False, default="")
+    month = db.Column(db.Integer, nullable=False)
+    best_before_days = db.Column(db.Float, nullable=False)
+    expires_at_days = db.Column(db.Float, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint("name_key", "city_key", "month", name="uq_shelf_life_key"),
+    )
+
+class PincodeCentroid(db.Model):
+    """Approximate centre of a pincode area, loaded from a local data file (see geo.py)."""
+    __tablename__ = 'pincode_centroid'
+    pincode = db.Column(db.String, primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    # Grid cell of the centroid, for radius searches
+    cell_lat = db.Column(db.Integer, nullable=False)
+    cell_lon = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_pincode_centroid_cell", "cell_lat", "cell_lon"),
+    )
+
+class FeedVersion(db.Model):
+    """Version of the NGO listing feed for a pincode, bumped on every change (see feed_cache.py)."""
+    __tablename__ = 'feed_version'
+    pincode = db.Column(db.String, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyDemand(db.Model):
+    """Quantity requested by NGOs per retailer pincode, day, food and request status (see demand.py)."""
+    __tablename__ = 'daily_demand'
+    id = db.Column(db.Integer, primary_key=True)
+    pincode = db.Column(db.String, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    food_id = db.Column(db.Integer, db.ForeignKey("food.id"), nullable=False)
+    status = db.Column(db.String, nullable=False)
+    quantity = db.Column(db.Float, nullable=False, default=0)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Leading (pincode, day) serves the forecast's date-window scan
+        db.UniqueConstraint("pincode", "day", "food_id", "status", name="uq_daily_demand_key"),
+    )
+
+class DemandForecast(db.Model):
+    """Forecast weekly demand for a food in a pincode, with a 95% interval (see forecasting.py)."""
+    __tablename__ = 'demand_forecast'
+    id = db.Column(db.Integer, primary_key=True)
+    pincode = db.Column(db.String, nullable=False)
+    food_id = db.Column(db.Integer, db.ForeignKey("food.id"), nullable=False)
+    week_start = db.Column(db.Date, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    lower = db.Column(db.Float, nullable=False)
+    upper = db.Column(db.Float, nullable=False)
+    model = db.Column(db.String, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_demand_forecast_pincode_food_week", "pincode", "food_id", "week_start"),
+    )
+
+class ForecastRun(db.Model):
+    """When a pincode's forecasts were last computed, also for pincodes without demand (see forecasting.py)."""
+    __tablename__ = 'forecast_run'
+    pincode = db.Column(db.String, primary_key=True)
+    computed_at = db.Column(db.DateTime, nullable=False)
+    series = db.Column(db.Integer, nullable=False, default=0)  # 0: no demand history, nothing to forecast
+
+class Notification(db.Model):
+    """Notice to a retailer about one of their inventory items, written by the expiry sweep (see notifications.py)."""
+    __tablename__ = 'notification'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    inventory_item_id = db.Column(db.Integer, db.ForeignKey("inventory_item.id"), nullable=False)
+    kind = db.Column(db.String, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    # Set when the retailer dismisses the notification or acts on it
+    read_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Serves the unread-notifications read
+        db.Index("ix_notification_user_read_at", "user_id", "read_at"),
+        # At most one notification of each kind per item, however often the sweep runs
+        db.UniqueConstraint("inventory_item_id", "kind", name="uq_notification_item_kind"),
+    )
+
+class SweepWatermark(db.Model):
+    """How far a periodic sweep has scanned, so the next run only looks at newer rows."""
+    __tablename__ = 'sweep_watermark'
+    name = db.Column(db.String, primary_key=True)
+    swept_until = db.Column(db.DateTime, nullable=False)
+
+class EventLog(db.Model):
+    """Event published to clients, shared between workers by the database events backend (see events.py)."""
+    __tablename__ = 'event_log'
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String, nullable=False)
+    type = db.Column(db.String, nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    # Ids are cursors; SQLite must not reuse them once old events are pruned
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class RevokedToken(db.Model):
+    """JWT revoked before it expires, kept until it would have expired (see revocation.py)."""
+    __tablename__ = 'revoked_token'
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String, nullable=False, unique=True)
+    type = db.Column(db.String, nullable=False)  # "access" or "refresh"
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, index=True)  # workers sync by it
@@ -1,54 +1,102 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_current_user
 from .models import db, User, InventoryItem, FoodRequest, Food
 from sqlalchemy import and_
 from datetime import datetime 
 from sqlalchemy.exc import SQLAlchemyError
+from .pagination import Field, iso, list_response
+from .geo import distance_expression, nearby_pincodes
+from . import events, feed_cache, reservations
+from .reservations import ReservationError, available
 ngo_bp = Blueprint("ngo", __name__, url_prefix="/ngo")
 
+# Output fields of the list endpoints, selectable with ?fields= (see pagination.py)
+LISTING_FIELDS = {
+    "id": Field(InventoryItem.id.label("id")),
+    "name": Field(Food.name.label("name")),
+    # What is left to request: stock minus what pending requests hold
+    "quantity": Field(available().label("quantity")),
+    "best_before": Field(InventoryItem.best_before.label("best_before"), render=iso("best_before")),
+    "expires_at": Field(InventoryItem.expires_at.label("expires_at"), render=iso("expires_at")),
+    "location": Field(
+        User.city.label("city"),
+        User.pincode.label("pincode"),
+        render=lambda row: {"city": row.city, "pincode": row.pincode},
+    ),
+    "retailer_contact": Field(User.contact.label("retailer_contact")),
+}
+
+MY_REQUEST_FIELDS = {
+    "id": Field(FoodRequest.id.label("id")),
+    "inventory_item": Field(
+        InventoryItem.id.label("inventory_item_id"),
+        Food.name.label("name"),
+        InventoryItem.quantity.label("quantity"),
+        render=lambda row: {"id": row.inventory_item_id, "name": row.name, "quantity": row.quantity},
+    ),
+    "status": Field(FoodRequest.status.label("status")),
+    "created_at": Field(FoodRequest.created_at.label("created_at"), render=iso("created_at")),
+    "hold_expires_at": Field(FoodRequest.hold_expires_at.label("hold_expires_at"), render=iso("hold_expires_at")),
+}
+
+
+def _distance_km(row):
+    return round(row.distance_m / 1000, 2)
+
 
 @ngo_bp.route("/filtered_food", methods=["GET"])
 @jwt_required()
 def get_nearby_food():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    # Filter items by the same pincode
-    nearby_items = (
-        InventoryItem.query.join(Food)
-        .join(User)
+    # Search around the given pincode (default: the NGO's own) within radius_km
+    pincode = request.args.get("pincode") or user.pincode
+    max_radius = current_app.config["NEARBY_RADIUS_KM_MAX"]
+    try:
+        radius_km = float(request.args.get("radius_km", current_app.config["NEARBY_RADIUS_KM_DEFAULT"]))
+    except ValueError:
+        return jsonify({"error": "'radius_km' must be a number"}), 422
+    if not 0 <= radius_km <= max_radius:
+        return jsonify({"error": f"'radius_km' must be between 0 and {max_radius}"}), 422
+
+    distances = nearby_pincodes(pincode, radius_km)
+    # Unchanged feeds are answered from the ETag alone (304) or this process's cache
+    etag = feed_cache.feed_etag(distances)
+    cached = feed_cache.cached_response(etag)
+    if cached is not None:
+        return cached
+
+    distance_m = distance_expression(User.pincode, distances)
+    fields = dict(
+        LISTING_FIELDS,
+        distance_km=Field(distance_m.label("distance_m"), render=_distance_km),
+    )
+
+    # Nearest first; the pincode index narrows the join to the retailers in range
+    response = list_response(
+        fields,
+        (distance_m, InventoryItem.id),
+        lambda columns: db.session.query(*columns)
+        .select_from(User)
+        .join(InventoryItem, InventoryItem.user_id == User.id)
+        .join(Food, InventoryItem.food_id == Food.id)
         .filter(
             and_(
-                Food.status == "Listing",
-                User.pincode == user.pincode,
-                Food.quantity > 0
+                User.pincode.in_(list(distances)),
+                InventoryItem.status == "Listing",
+                available() > 0
             )
-        )
-        .all()
-    )
-    return jsonify(
-        [
-            {
-                "id": item.id,
-                "name": item.food.name,
-                "quantity": item.food.quantity,
-                "best_before": item.food.best_before.isoformat(),
-                "expires_at": item.food.expires_at.isoformat(),
-                "location": {"city": item.user.city, "pincode": item.user.pincode},
-                "retailer_contact": item.user.contact,
-            }
-            for item in nearby_items
-        ]
+        ),
     )
+    return feed_cache.store_response(etag, response)
 
 @ngo_bp.route("/request", methods=["POST"])
 @jwt_required()
 def create_food_request():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -57,11 +105,11 @@ def create_food_request():
 
     try:
         # Get required fields directly. If 'inventory_item_id' or 'quantity'
-        # are missing, this will raise a KeyError, caught below.
-        # We'll rely on SQLAlchemy/DB to handle type conversion and NOT NULL checks
-        # when we create the object and commit later.
-        inventory_item_id = data["inventory_item_id"]
-        quantity = data["quantity"]
+        # are missing or malformed, this raises a KeyError/ValueError/TypeError, caught below.
+        inventory_item_id = int(data["inventory_item_id"])
+        quantity = float(data["quantity"])
+        if quantity <= 0:
+            return jsonify({"error": "Quantity must be greater than 0"}), 422
 
         # Get optional fields safely using .get(), which returns None if the key is missing
         pickup_date_str = data.get("pickup_date")
@@ -80,9 +128,16 @@ def create_food_request():
                 return jsonify({"error": "Invalid pickup_date format. Use YYYY-MM-DDTHH:MM:SS"}), 422
 
 
+        # Hold the quantity on the listing first, in one conditional UPDATE, so
+        # concurrent requests can never hold more than is available (see reservations.py)
+        now = datetime.utcnow()
+        try:
+            hold_expires_at = reservations.place_hold(inventory_item_id, quantity, now)
+        except ReservationError as e:
+            db.session.rollback()
+            return jsonify({"error": e.message}), e.status_code
+
         # Create the FoodRequest object using the data retrieved.
-        # SQLAlchemy will handle converting data types (e.g., float for quantity)
-        # and will check NOT NULL constraints when committed.
         new_request = FoodRequest(
             inventory_item_id=inventory_item_id,
             requester_id=user.id, # User ID is guaranteed from the JWT check
@@ -90,10 +145,21 @@ def create_food_request():
             pickup_date=pickup_date, # This will be a datetime object or None
             notes=notes,             # This will be a string or None
             status="pending",        # Set default status
-            created_at=datetime.utcnow() # Set creation time
+            created_at=now,          # Set creation time
+            hold_expires_at=hold_expires_at
         )
 
         db.session.add(new_request)
+        db.session.flush()
+
+        # Pushed to the retailer once committed (see events.py)
+        retailer_id = db.session.query(InventoryItem.user_id).filter_by(id=inventory_item_id).scalar()
+        events.publish(events.user_channel(retailer_id), "request.created", {
+            "request_id": new_request.id,
+            "inventory_item_id": inventory_item_id,
+            "quantity": quantity,
+            "hold_expires_at": hold_expires_at.isoformat(),
+        })
         db.session.commit() # Database NOT NULL constraints are enforced here
 
         # Success response
@@ -101,6 +167,8 @@ def create_food_request():
             {
                 "id": new_request.id,
                 "message": "Food request created successfully",
+                # The quantity is held for this request until then, unless the retailer acts first
+                "hold_expires_at": hold_expires_at.isoformat(),
                 # Optional: return details of the created request
                 # "inventory_item_id": new_request.inventory_item_id,
                 # "quantity": new_request.quantity,
@@ -128,26 +196,17 @@ def create_food_request():
 @ngo_bp.route("/my_requests", methods=["GET"])
 @jwt_required()
 def get_my_requests():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    requests = FoodRequest.query.filter_by(requester_id=user.id).all()
-
-    return jsonify(
-        [
-            {
-                "id": req.id,
-                "inventory_item": {
-                    "id": req.inventory_item.id,
-                    "name": req.inventory_item.food.name,
-                    "quantity": req.inventory_item.food.quantity,
-                },
-                "status": req.status,
-                "created_at": req.created_at.isoformat(),
-            }
-            for req in requests
-        ]
+    return list_response(
+        MY_REQUEST_FIELDS,
+        FoodRequest.id,
+        lambda columns: db.session.query(*columns)
+        .select_from(FoodRequest)
+        .join(InventoryItem, FoodRequest.inventory_item_id == InventoryItem.id)
+        .join(Food, InventoryItem.food_id == Food.id)
+        .filter(FoodRequest.requester_id == user.id),
     )
@@ -0,0 +1,190 @@
+# foodloop_app/notifications.py
+"""Retailer notifications about ageing stock, written by a periodic sweep.
+
+:func:`sweep` only scans the inventory items whose ``best_before`` or
+``expires_at`` fell between the previous sweep and now (both columns are
+indexed), so its cost follows the number of items that just aged, not the
+size of the inventory:
+
+* a "Selling" item past its best-before date gets a ``best_before``
+  notification offering to list it for NGOs;
+* an item past its expiry date moves to "Expired", leaves the NGO feed,
+  gives back what pending requests held and gets an ``expired`` notification.
+
+Notifications are rows, so ``/retailers/notifications`` is an indexed read of
+a retailer's unread ones and a dismissal is stored instead of recomputed.
+Each process runs :func:`scheduled_sweep` every ``EXPIRY_SWEEP_INTERVAL``
+seconds; ``flask --app run sweep-expiry`` runs it once, e.g. from cron.
+Concurrent sweeps are harmless: there is one notification per item and kind,
+and the status change is conditional.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import and_, or_, update
+
+from foodloop_app import db
+from . import background, feed_cache, reservations
+from .models import InventoryItem, Notification, SweepWatermark, User
+from .upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+BEST_BEFORE = "best_before"
+EXPIRED = "expired"
+
+# Actions offered with each kind of notification
+OPTIONS = {
+    BEST_BEFORE: ["List", "Ignore"],
+    EXPIRED: ["Remove", "Ignore"],
+}
+
+# Statuses the sweep moves to "Expired"; items still waiting for dates have none to pass
+ACTIVE_STATUSES = ("Selling", "Listing")
+
+WATERMARK = "expiry"
+SWEEP_BATCH_SIZE = 500
+
+
+def register_sweeper(app):
+    """Start this process's expiry sweep with its first request."""
+
+    @app.before_request
+    def start_expiry_sweep():
+        interval = app.config["EXPIRY_SWEEP_INTERVAL"]
+        if interval:
+            background.every("expiry-sweep", interval, scheduled_sweep)
+
+
+def scheduled_sweep():
+    """Run :func:`sweep`, then release expired request holds, committing each batch."""
+    notified, expired = sweep()
+    db.session.commit()
+    while reservations.expire_holds():
+        db.session.commit()
+    return notified, expired
+
+
+def message(row):
+    """Text of a notification row with ``kind``, ``name`` and ``quantity``."""
+    if row.kind == EXPIRED:
+        return f"Your {row.name} (remaining: {row.quantity}) has expired and was taken off sale. Remove it or ignore."
+    return f"Your {row.name} (remaining: {row.quantity}) is past best before. List it or ignore."
+
+
+def current():
+    """Filter for notifications still worth showing, on a query joined to the item.
+
+    A best-before notice stops applying once the item is listed, expired or
+    sold out.
+    """
+    return or_(
+        Notification.kind != BEST_BEFORE,
+        and_(InventoryItem.status == "Selling", InventoryItem.quantity > 0),
+    )
+
+
+def dismiss(user_id, item_id, now=None, kind=None):
+    """Mark ``user_id``'s unread notifications about an item as read. Returns how many."""
+    conditions = [
+        Notification.user_id == user_id,
+        Notification.inventory_item_id == item_id,
+        Notification.read_at.is_(None),
+    ]
+    if kind is not None:
+        conditions.append(Notification.kind == kind)
+    result = db.session.execute(
+        update(Notification)
+        .where(*conditions)
+        .values(read_at=now or datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def sweep(now=None):
+    """Notify about and expire the items whose dates passed since the last sweep.
+
+    Returns ``(notified, expired)`` item counts. Writes in the caller's session.
+    """
+    now = now or datetime.utcnow()
+    since = db.session.query(SweepWatermark.swept_until).filter(SweepWatermark.name == WATERMARK).scalar()
+
+    past_best_before = db.session.query(InventoryItem.id, InventoryItem.user_id).filter(
+        InventoryItem.status == "Selling",
+        or_(InventoryItem.expires_at.is_(None), InventoryItem.expires_at > now),
+        *_passed(InventoryItem.best_before, since, now),
+    ).all()
+    notified = _notify(past_best_before, BEST_BEFORE, now)
+
+    past_expiry = db.session.query(
+        InventoryItem.id, InventoryItem.user_id, InventoryItem.status, User.pincode
+    ).join(User, InventoryItem.user_id == User.id).filter(
+        InventoryItem.status.in_(ACTIVE_STATUSES),
+        *_passed(InventoryItem.expires_at, since, now),
+    ).all()
+    expired = 0
+    for start in range(0, len(past_expiry), SWEEP_BATCH_SIZE):
+        expired += _expire(past_expiry[start:start + SWEEP_BATCH_SIZE], now)
+
+    _advance_watermark(now)
+    if notified or expired:
+        logger.info("Expiry sweep: %s items past best before, %s expired", notified, expired)
+    return notified, expired
+
+
+def _passed(column, since, now):
+    """``column`` fell in ``(since, now]``; everything up to now on the first sweep."""
+    conditions = [column <= now]
+    if since is not None:
+        conditions.append(column > since)
+    return conditions
+
+
+def _expire(items, now):
+    item_ids = [item.id for item in items]
+    result = db.session.execute(
+        update(InventoryItem)
+        .where(InventoryItem.id.in_(item_ids), InventoryItem.status.in_(ACTIVE_STATUSES))
+        .values(status="Expired")
+        .execution_options(synchronize_session=False)
+    )
+    _notify(items, EXPIRED, now)
+    feed_cache.invalidate_pincodes({item.pincode for item in items if item.status == "Listing"})
+
+    # Expired stock cannot be handed over; give back what pending requests hold
+    reservations.release_items(item_ids, reservations.EXPIRED)
+    return result.rowcount
+
+
+def _notify(items, kind, now):
+    """Insert a ``kind`` notification for each item that does not have one yet. Returns how many."""
+    item_ids = [item.id for item in items]
+    notified = set()
+    for start in range(0, len(item_ids), SWEEP_BATCH_SIZE):
+        batch = item_ids[start:start + SWEEP_BATCH_SIZE]
+        notified.update(
+            item_id for (item_id,) in db.session.query(Notification.inventory_item_id).filter(
+                Notification.inventory_item_id.in_(batch), Notification.kind == kind
+            )
+        )
+    rows = [
+        {"user_id": item.user_id, "inventory_item_id": item.id, "kind": kind, "created_at": now}
+        for item in items
+        if item.id not in notified
+    ]
+    for start in range(0, len(rows), SWEEP_BATCH_SIZE):
+        # Rows a concurrent sweep wrote meanwhile are skipped
+        upsert(Notification, rows[start:start + SWEEP_BATCH_SIZE])
+    return len(rows)
+
+
+def _advance_watermark(now):
+    # Never moves back, so an overlapping slower sweep cannot make the next one rescan
+    upsert(
+        SweepWatermark,
+        {"name": WATERMARK, "swept_until": now},
+        key=["name"],
+        update=lambda excluded: {"swept_until": excluded.swept_until},
+        where=lambda excluded: SweepWatermark.swept_until < excluded.swept_until,
+    )
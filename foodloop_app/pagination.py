@@ -0,0 +1,237 @@
+# foodloop_app/pagination.py
+"""Keyset pagination and field selection for list endpoints.
+
+List endpoints describe their output as a dict of :class:`Field` objects.
+Clients pick a subset with ``?fields=id,name`` and only those columns are
+selected in SQL. Pages are ordered on an indexed key column; ``?limit=``
+sets the page size and ``?after=`` takes the opaque cursor from the
+previous page's ``X-Next-Cursor`` header (also sent as a ``Link`` header).
+The key may also be a tuple of columns, e.g. ``(distance, id)``, ending in a
+unique column. The response body stays a plain JSON list.
+
+``?format=ndjson`` streams every matching row instead, one JSON object per
+line, from a server-side cursor read ``EXPORT_BATCH_SIZE`` rows at a time.
+Memory use does not depend on the row count and the first rows are sent
+before the query has finished.
+
+Rows become output dicts through a :func:`row_encoder` built once per
+field selection, then go to the app's JSON provider (see json_provider.py).
+"""
+import base64
+import json
+from functools import lru_cache
+from operator import itemgetter
+from urllib.parse import urlencode
+
+from flask import Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import and_, or_
+
+from foodloop_app import db
+
+CURSOR_KEY = "_cursor"
+
+
+class PaginationError(ValueError):
+    """Raised for malformed ``limit``, ``after`` or ``fields`` arguments."""
+
+
+class Field:
+    """One output field: the labeled columns it needs and how to render them.
+
+    Without ``render`` the field is the value of its single column.
+    """
+
+    def __init__(self, *columns, render=None):
+        self.columns = columns
+        self.render = render
+
+
+def iso(label):
+    """Render a datetime column as ISO 8601, or None."""
+
+    def render(row):
+        value = row._mapping[label]
+        return value.isoformat() if value else None
+
+    # Encoders skip the call when the JSON provider writes ISO 8601 itself
+    render.column = label
+    return render
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor in 'after'")
+    if not isinstance(values, list):
+        raise PaginationError("Invalid cursor in 'after'")
+    return values
+
+
+def parse_limit():
+    default = current_app.config["PAGE_SIZE_DEFAULT"]
+    maximum = current_app.config["PAGE_SIZE_MAX"]
+    raw = request.args.get("limit")
+    if raw is None:
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise PaginationError("'limit' must be an integer")
+    if limit < 1 or limit > maximum:
+        raise PaginationError(f"'limit' must be between 1 and {maximum}")
+    return limit
+
+
+def parse_fields(fields):
+    """Names from ``?fields=``, in the endpoint's own order; all fields when absent."""
+    raw = request.args.get("fields")
+    if not raw:
+        return list(fields)
+    requested = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = requested - set(fields)
+    if unknown:
+        raise PaginationError(
+            f"Unknown field(s): {', '.join(sorted(unknown))}. Available: {', '.join(fields)}"
+        )
+    return [name for name in fields if name in requested]
+
+
+def select_columns(fields, names):
+    """Distinct labeled columns needed to render ``names``."""
+    columns = {}
+    for name in names:
+        for column in fields[name].columns:
+            columns.setdefault(column.key, column)
+    return list(columns.values())
+
+
+@lru_cache(maxsize=256)
+def _compile(plan):
+    """Function from a row to the output dict of ``plan``, a (name, row position or render) per field."""
+    names = tuple(name for name, _ in plan)
+    sources = tuple(source for _, source in plan)
+    if sources == tuple(range(len(sources))):
+        # The row starts with exactly these fields, in order
+        return lambda row: dict(zip(names, row))
+    if all(isinstance(source, int) for source in sources):
+        if len(sources) == 1:
+            position = sources[0]
+            return lambda row: {names[0]: row[position]}
+        values = itemgetter(*sources)
+        return lambda row: dict(zip(names, values(row)))
+    getters = tuple(itemgetter(source) if isinstance(source, int) else source for source in sources)
+    return lambda row: dict(zip(names, [get(row) for get in getters]))
+
+
+def row_encoder(fields, names, columns):
+    """Function from a result row selecting ``columns`` to the output dict of ``names``.
+
+    Plain fields, and ``iso`` fields when the JSON provider writes datetimes
+    as ISO 8601, are read from the row by position; other fields call their
+    render. Encoders are cached per field selection.
+    """
+    positions = {}
+    for position, column in enumerate(columns):
+        positions.setdefault(column.key, position)
+    native_datetimes = getattr(current_app.json, "iso_datetimes", False)
+    plan = []
+    for name in names:
+        field = fields[name]
+        if field.render is None:
+            plan.append((name, positions[field.columns[0].key]))
+        elif native_datetimes and hasattr(field.render, "column"):
+            plan.append((name, positions[field.render.column]))
+        else:
+            plan.append((name, field.render))
+    return _compile(tuple(plan))
+
+
+def key_columns(key):
+    return tuple(key) if isinstance(key, (tuple, list)) else (key,)
+
+
+def after_key(columns, values):
+    """Rows strictly after ``values`` in ``ORDER BY columns``."""
+    column, value = columns[0], values[0]
+    if len(columns) == 1:
+        return column > value
+    return or_(column > value, and_(column == value, after_key(columns[1:], values[1:])))
+
+
+def fetch_page(fields, key, make_query):
+    """Run one page of a list endpoint.
+
+    ``make_query(columns)`` returns the endpoint's filtered query selecting
+    ``columns``. ``key`` is the column (or tuple of columns) the pages are
+    ordered on. Returns ``(items, next_cursor)``; ``next_cursor`` is None on
+    the last page.
+    """
+    names = parse_fields(fields)
+    limit = parse_limit()
+    columns = key_columns(key)
+    labels = [f"{CURSOR_KEY}{position}" for position in range(len(columns))]
+    selected = [column.label(label) for column, label in zip(columns, labels)] + select_columns(fields, names)
+    query = make_query(selected)
+
+    after = request.args.get("after")
+    if after:
+        cursor = decode_cursor(after)
+        if len(cursor) != len(columns):
+            raise PaginationError("Invalid cursor in 'after'")
+        query = query.filter(after_key(columns, cursor))
+
+    rows = query.order_by(*columns).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]._mapping[label] for label in labels])
+    encode = row_encoder(fields, names, selected)
+    return [encode(row) for row in rows], next_cursor
+
+
+def page_response(items, next_cursor):
+    """JSON list response carrying the next-page cursor in headers."""
+    response = jsonify(items)
+    if next_cursor:
+        args = request.args.to_dict()
+        args["after"] = next_cursor
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def stream_ndjson(fields, key, make_query):
+    """Stream all rows of a list endpoint as newline-delimited JSON."""
+    names = parse_fields(fields)
+    selected = select_columns(fields, names)
+    query = make_query(selected).order_by(*key_columns(key))
+    batch_size = current_app.config["EXPORT_BATCH_SIZE"]
+    encode = row_encoder(fields, names, selected)
+    dumps = current_app.json.dumps_bytes
+
+    def generate():
+        result = db.session.execute(query.statement, execution_options={"yield_per": batch_size})
+        for rows in result.partitions():
+            yield b"".join(dumps(encode(row), compact=True) + b"\n" for row in rows)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+def list_response(fields, key, make_query):
+    """Response for a list endpoint: a JSON page, or an NDJSON export with ``?format=ndjson``."""
+    output_format = request.args.get("format", "json")
+    try:
+        if output_format == "ndjson":
+            return stream_ndjson(fields, key, make_query)
+        if output_format != "json":
+            raise PaginationError("'format' must be 'json' or 'ndjson'")
+        return page_response(*fetch_page(fields, key, make_query))
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 422
@@ -0,0 +1,163 @@
+# foodloop_app/passwords.py
+"""Password hashing for sign-up and login, off the request thread.
+
+Hashes use Flask-Security's passlib context, so the scheme and cost come
+from ``SECURITY_PASSWORD_HASH`` and ``SECURITY_PASSWORD_HASH_PASSLIB_OPTIONS``;
+:func:`passlib_options` reads the costs from the environment. The password
+is HMAC-signed with ``SECURITY_PASSWORD_SALT`` first, exactly as
+``flask_security.utils.hash_password`` does, so both produce the same hashes.
+
+The hashing itself runs in a per-process pool of ``PASSWORD_HASH_WORKERS``
+processes (0: on the request thread). At most ``PASSWORD_HASH_MAX_PENDING``
+hashes wait for the pool; beyond that, or after ``PASSWORD_HASH_TIMEOUT``
+seconds, :class:`PasswordHashBusy` is raised and the route answers 503, so
+a burst of logins queues up to a bound instead of taking every request
+thread.
+
+:func:`verify_and_update` rehashes a user's password when the stored hash no
+longer matches the configured scheme or cost.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from flask_security.utils import get_hmac
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# Environment variable -> passlib option
+COST_SETTINGS = {
+    "PASSWORD_ARGON2_TIME_COST": ("argon2__time_cost",),
+    "PASSWORD_ARGON2_MEMORY_COST": ("argon2__memory_cost",),  # KiB
+    "PASSWORD_ARGON2_PARALLELISM": ("argon2__parallelism",),
+    "PASSWORD_BCRYPT_ROUNDS": ("bcrypt__rounds",),
+    "PASSWORD_PBKDF2_ROUNDS": ("pbkdf2_sha256__rounds", "pbkdf2_sha512__rounds"),
+}
+
+
+class PasswordHashBusy(Exception):
+    """Raised when the hashing pool is saturated; the client should retry shortly."""
+
+
+def passlib_options():
+    """``SECURITY_PASSWORD_HASH_PASSLIB_OPTIONS`` from the ``PASSWORD_*`` cost variables that are set."""
+    options = {}
+    for name, keys in COST_SETTINGS.items():
+        value = os.getenv(name)
+        if value not in (None, ""):
+            for key in keys:
+                options[key] = int(value)
+    return options
+
+
+_contexts = {}  # passlib context string -> CryptContext, in each pool process
+
+
+def _context(config):
+    context = _contexts.get(config)
+    if context is None:
+        context = _contexts[config] = CryptContext.from_string(config)
+    return context
+
+
+def _hash(config, secret):
+    return _context(config).hash(secret)
+
+
+def _verify(config, secret, password_hash):
+    context = _context(config)
+    verified = context.verify(secret, password_hash)
+    return verified, verified and context.needs_update(password_hash)
+
+
+_pool = None
+_pool_pid = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    """This process's pool; a forked child (e.g. a gunicorn worker) starts its own."""
+    global _pool, _pool_pid, _slots
+    config = current_app.config
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Spawned, not forked: forking a process with live threads can deadlock the child
+            _pool = ProcessPoolExecutor(
+                max_workers=config["PASSWORD_HASH_WORKERS"], mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(config["PASSWORD_HASH_WORKERS"] + config["PASSWORD_HASH_MAX_PENDING"])
+        return _pool, _slots
+
+
+def _reset(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(fn, *args):
+    if not current_app.config["PASSWORD_HASH_WORKERS"]:
+        return fn(*args)
+    timeout = current_app.config["PASSWORD_HASH_TIMEOUT"]
+    pool, slots = _executor()
+    if not slots.acquire(blocking=False):
+        raise PasswordHashBusy("Too many sign-ins at once; try again shortly")
+    try:
+        return pool.submit(fn, *args).result(timeout)
+    except TimeoutError:
+        raise PasswordHashBusy("Too many sign-ins at once; try again shortly")
+    except BrokenProcessPool:
+        # A pool process died (e.g. killed for memory); start a new pool for the next call
+        logger.error("Password hashing pool broke; restarting it", exc_info=True)
+        _reset(pool)
+        raise PasswordHashBusy("Password hashing is restarting; try again shortly")
+    finally:
+        slots.release()
+
+
+def _security():
+    return current_app.extensions["security"]
+
+
+def _secret(password, password_hash=None):
+    """What is hashed for ``password``: its HMAC unless the scheme is single-hash, as Flask-Security does."""
+    context = _security().pwd_context
+    scheme = context.identify(password_hash) if password_hash else current_app.config["SECURITY_PASSWORD_HASH"]
+    single_hash = current_app.config["SECURITY_PASSWORD_SINGLE_HASH"] or {"plaintext"}
+    if not (single_hash is True or scheme in single_hash):
+        password = get_hmac(password).decode("ascii")
+    if scheme == "bcrypt":
+        # bcrypt only uses the first 72 bytes, and newer releases reject longer input. Cut the UTF-8
+        # bytes: Flask-Security cuts 72 characters, which only fits ASCII such as the HMAC above
+        password = password.encode("utf-8")[:72]
+    return password
+
+
+def hash_password(password):
+    """Hash ``password`` with the configured scheme and cost."""
+    return _run(_hash, _security().pwd_context.to_string(), _secret(password))
+
+
+def verify_and_update(user, password):
+    """Check ``password`` against ``user``; rehash it in the session if the scheme or cost changed.
+
+    The caller commits. Returns whether the password matched.
+    """
+    if not user.password:
+        return False
+    verified, needs_update = _run(
+        _verify, _security().pwd_context.to_string(), _secret(password, user.password), user.password
+    )
+    if needs_update:
+        user.password = hash_password(password)
+        logger.info("Rehashed the password of user %s with the current settings", user.id)
+    return verified
@@ -0,0 +1,52 @@
+# foodloop_app/query_counter.py
+"""Helpers for checking how many SQL statements a piece of code runs.
+
+Meant for tests, e.g.::
+
+    with assert_max_queries(ENDPOINT_QUERY_BUDGETS["retailer.get_inventory"]):
+        client.get("/retailers/inventory", headers=auth)
+
+The budgets below are per request and do not grow with the number of rows
+returned, so a lazy load sneaking back into a serializer fails the check.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from foodloop_app import db
+
+# Maximum statements per request once the caller's identity is cached (see
+# identity.py): just the listing query. The nearby feed also reads the origin
+# centroid, the pincodes in range and their feed versions.
+ENDPOINT_QUERY_BUDGETS = {
+    "retailer.get_inventory": 1,
+    "retailer.get_food_requests": 1,
+    "ngo.get_my_requests": 1,
+    "ngo.get_nearby_food": 4,
+}
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Collect the SQL statements executed on ``engine`` (default ``db.engine``) inside the block."""
+    engine = engine or db.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(max_count, engine=None):
+    """Fail with ``AssertionError`` if the block runs more than ``max_count`` statements."""
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > max_count:
+        listing = "\n".join(f"  {number}. {statement}" for number, statement in enumerate(statements, start=1))
+        raise AssertionError(f"Expected at most {max_count} SQL statements, got {len(statements)}:\n{listing}")
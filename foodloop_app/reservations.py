@@ -0,0 +1,211 @@
+# foodloop_app/reservations.py
+"""Stock holds for NGO food requests.
+
+A new request holds its quantity on the listed item until
+``hold_expires_at`` (``REQUEST_HOLD_TTL`` after it is made), so NGOs only see
+and request what is still available: ``quantity - held_quantity``. Every step
+is one conditional ``UPDATE`` whose row count says whether it applied, so
+concurrent requests, approvals and sweeps cannot oversell or apply twice:
+
+* :func:`place_hold` adds to ``held_quantity`` only while enough is available;
+* :func:`allocate` (approval) moves a still-valid hold out of both
+  ``held_quantity`` and ``quantity``;
+* :func:`release` (ignore, expiry) gives a held quantity back, and
+  :func:`release_items` every hold on items whose stock is gone;
+* :func:`expire_holds` releases every hold past its expiry. Run it
+  periodically with ``flask --app run expire-holds``; a request that finds
+  too little available also sweeps that item first.
+
+Requests made before holds existed have no ``hold_expires_at`` and hold
+nothing; approving one allocates straight from the available stock.
+
+Functions write in the caller's session; the caller commits, or rolls back
+after a :class:`ReservationError`.
+"""
+import logging
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import or_, update
+
+from foodloop_app import db
+from . import demand, feed_cache
+from .models import FoodRequest, InventoryItem, User
+
+logger = logging.getLogger(__name__)
+
+HOLDING = "pending"
+ALLOCATED = "approved"
+IGNORED = "ignored"
+EXPIRED = "expired"
+
+SWEEP_BATCH_SIZE = 500
+
+
+class ReservationError(Exception):
+    """Raised when a reservation step cannot be applied."""
+
+    def __init__(self, message, status_code=409):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def available():
+    """SQL expression for the quantity of an item that is neither sold nor held."""
+    return InventoryItem.quantity - InventoryItem.held_quantity
+
+
+def _listed(now):
+    return (
+        InventoryItem.status == "Listing",
+        or_(InventoryItem.expires_at.is_(None), InventoryItem.expires_at >= now),
+    )
+
+
+def place_hold(item_id, quantity, now=None):
+    """Hold ``quantity`` of a listed, unexpired item if that much is available.
+
+    Returns ``hold_expires_at``. Raises :class:`ReservationError` (404 if the
+    item is not listed, 409 if too little is available) and changes nothing.
+    """
+    now = now or datetime.utcnow()
+    if not _add_hold(item_id, quantity, now):
+        # Holds that ran out may still be counted if the sweeper has not run yet
+        if not expire_holds(now, item_id=item_id) or not _add_hold(item_id, quantity, now):
+            item = db.session.query(available().label("available")).filter(
+                InventoryItem.id == item_id, *_listed(now)
+            ).first()
+            if item is None:
+                raise ReservationError("Food not found or not listed", 404)
+            raise ReservationError(f"Only {max(item.available, 0):g} available")
+    feed_cache.invalidate_pincodes([_retailer_pincode(item_id)])
+    return now + current_app.config["REQUEST_HOLD_TTL"]
+
+
+def _add_hold(item_id, quantity, now):
+    result = db.session.execute(
+        update(InventoryItem)
+        .where(InventoryItem.id == item_id, available() >= quantity, *_listed(now))
+        .values(held_quantity=InventoryItem.held_quantity + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def allocate(food_request, now=None):
+    """Approve a pending request, turning its hold into a sale of the held quantity."""
+    now = now or datetime.utcnow()
+    if food_request.hold_expires_at is None:
+        # Predates holds: nothing is held, so take from what is available
+        _transition(food_request, ALLOCATED, FoodRequest.hold_expires_at.is_(None))
+        taken = db.session.execute(
+            update(InventoryItem)
+            .where(InventoryItem.id == food_request.inventory_item_id, available() >= food_request.quantity)
+            .values(quantity=InventoryItem.quantity - food_request.quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if taken.rowcount != 1:
+            raise ReservationError("Not enough quantity available")
+        feed_cache.invalidate_pincodes([_retailer_pincode(food_request.inventory_item_id)])
+        return
+
+    if food_request.hold_expires_at < now:
+        raise ReservationError("The hold on this request has expired")
+    _transition(food_request, ALLOCATED, FoodRequest.hold_expires_at >= now)
+    # Available stock is unchanged: the held part leaves quantity and held_quantity alike
+    db.session.execute(
+        update(InventoryItem)
+        .where(InventoryItem.id == food_request.inventory_item_id)
+        .values(
+            quantity=InventoryItem.quantity - food_request.quantity,
+            held_quantity=InventoryItem.held_quantity - food_request.quantity,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def release(food_request, status=IGNORED, *conditions):
+    """Close a pending request with ``status`` and give back what it held."""
+    _transition(food_request, status, *conditions)
+    if food_request.hold_expires_at is None:
+        return  # Predates holds; nothing to give back
+    db.session.execute(
+        update(InventoryItem)
+        .where(InventoryItem.id == food_request.inventory_item_id)
+        .values(held_quantity=InventoryItem.held_quantity - food_request.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    feed_cache.invalidate_pincodes([_retailer_pincode(food_request.inventory_item_id)])
+
+
+def expire_holds(now=None, item_id=None):
+    """Release up to ``SWEEP_BATCH_SIZE`` holds past their expiry. Returns how many were released."""
+    now = now or datetime.utcnow()
+    query = db.session.query(
+        FoodRequest.id,
+        FoodRequest.inventory_item_id,
+        FoodRequest.quantity,
+        FoodRequest.created_at,
+        FoodRequest.hold_expires_at,
+    ).filter(FoodRequest.status == HOLDING, FoodRequest.hold_expires_at < now)
+    if item_id is not None:
+        query = query.filter(FoodRequest.inventory_item_id == item_id)
+
+    released = 0
+    for expired in query.limit(SWEEP_BATCH_SIZE).all():
+        try:
+            release(expired, EXPIRED, FoodRequest.hold_expires_at < now)
+        except ReservationError:
+            continue  # Approved or released concurrently
+        released += 1
+    if released:
+        logger.info("Released %s expired request holds", released)
+    return released
+
+
+def release_items(item_ids, status=EXPIRED):
+    """Close every pending request on ``item_ids`` with ``status``, giving back what they hold. Returns those closed."""
+    pending = db.session.query(
+        FoodRequest.id,
+        FoodRequest.inventory_item_id,
+        FoodRequest.quantity,
+        FoodRequest.created_at,
+        FoodRequest.hold_expires_at,
+        FoodRequest.requester_id,
+    ).filter(FoodRequest.inventory_item_id.in_(list(item_ids)), FoodRequest.status == HOLDING).all()
+    released = []
+    for food_request in pending:
+        try:
+            release(food_request, status)
+        except ReservationError:
+            continue  # Approved or released concurrently
+        released.append(food_request)
+    return released
+
+
+def _transition(food_request, status, *conditions):
+    """Move a pending request to ``status`` if it is still pending; the rollup follows."""
+    result = db.session.execute(
+        update(FoodRequest)
+        .where(FoodRequest.id == food_request.id, FoodRequest.status == HOLDING, *conditions)
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        raise ReservationError("Request not found or already processed", 404)
+    # The UPDATE bypasses the rollup's mapper events (see demand.py)
+    demand.status_changed(
+        db.session.connection(),
+        food_request.inventory_item_id,
+        food_request.created_at,
+        food_request.quantity,
+        HOLDING,
+        status,
+    )
+
+
+def _retailer_pincode(item_id):
+    return db.session.query(User.pincode).join(InventoryItem, InventoryItem.user_id == User.id).filter(
+        InventoryItem.id == item_id
+    ).scalar()
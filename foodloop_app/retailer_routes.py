@@ -1,50 +1,91 @@
 # retailer_routes.py
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from .models import db, User, InventoryItem, FoodRequest, Food
+from flask import Blueprint, request, jsonify, current_app, url_for
+from flask_jwt_extended import jwt_required, get_current_user
+from .models import db, User, InventoryItem, FoodRequest, Food, Notification
 from datetime import datetime, timedelta
 from sqlalchemy.exc import SQLAlchemyError
-import google.generativeai as genai
 from dotenv import load_dotenv
-import os
-import re
+import csv
+import io
 import logging
 
+from . import enrichment, events, feed_cache, gemini, notifications, reservations
+from .stock import RESTARTED, catalog_food, is_dead, restock, take_stock
+from .pagination import Field, iso, list_response
+from .reservations import ReservationError
+from .shelf_life import (
+    cached_shelf_life,
+    cached_shelf_life_many,
+    estimate_shelf_life_many,
+    generate_shelf_life,
+    cache_stats,
+    ShelfLifeError,
+)
+
 retailer_bp = Blueprint("retailer", __name__, url_prefix="/retailers")
-# Configure logging (ensure this is set up correctly in your app)
-logging.basicConfig(level=logging.DEBUG) # Make sure level is DEBUG or INFO to see the logs
+# Log levels are set by the entry point (LOG_LEVEL); debug lines below use lazy %-formatting
 logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Output fields of the list endpoints, selectable with ?fields= (see pagination.py)
+INVENTORY_FIELDS = {
+    "id": Field(InventoryItem.id.label("id")),
+    "name": Field(Food.name.label("name")),
+    "quantity": Field(InventoryItem.quantity.label("quantity")),
+    # Held for pending NGO requests; can still be approved but not sold
+    "held_quantity": Field(InventoryItem.held_quantity.label("held_quantity")),
+    "best_before": Field(InventoryItem.best_before.label("best_before"), render=iso("best_before")),
+    "expires_at": Field(InventoryItem.expires_at.label("expires_at"), render=iso("expires_at")),
+    "status": Field(InventoryItem.status.label("status"), render=lambda row: row.status or "Selling"),
+    # This created_at is from the Food item, not the InventoryItem creation time
+    "food_created_at": Field(Food.created_at.label("food_created_at"), render=iso("food_created_at")),
+}
+
+FOOD_REQUEST_FIELDS = {
+    "id": Field(FoodRequest.id.label("id")),
+    "food_id": Field(InventoryItem.food_id.label("food_id")),
+    "ngo_id": Field(FoodRequest.requester_id.label("ngo_id")),
+    "quantity": Field(FoodRequest.quantity.label("quantity")),
+    "status": Field(FoodRequest.status.label("status")),
+    "pickup_date": Field(FoodRequest.pickup_date.label("pickup_date"), render=iso("pickup_date")),
+    "created_at": Field(FoodRequest.created_at.label("created_at"), render=iso("created_at")),
+    "hold_expires_at": Field(FoodRequest.hold_expires_at.label("hold_expires_at"), render=iso("hold_expires_at")),
+}
+
+NOTIFICATION_FIELDS = {
+    # The inventory item's id, which the List/Remove/Ignore actions take
+    "id": Field(Notification.inventory_item_id.label("id")),
+    "notification_id": Field(Notification.id.label("notification_id")),
+    "kind": Field(Notification.kind.label("kind")),
+    "message": Field(
+        Notification.kind.label("kind"),
+        Food.name.label("name"),
+        InventoryItem.quantity.label("quantity"),
+        render=notifications.message,
+    ),
+    "options": Field(Notification.kind.label("kind"), render=lambda row: notifications.OPTIONS[row.kind]),
+    "food_id": Field(InventoryItem.food_id.label("food_id")),
+    "created_at": Field(Notification.created_at.label("created_at"), render=iso("created_at")),
+}
+
 @retailer_bp.route("/inventory", methods=["GET"])
 @jwt_required()
 def get_inventory():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    inventory = InventoryItem.query.filter_by(user_id=user.id).all()
-    return jsonify(
-        [
-            {
-                "id": item.id,
-                "name": item.food.name,
-                "quantity": item.food.quantity,
-                "best_before": item.food.best_before.isoformat() if item.food.best_before else None,
-                "expires_at": item.food.expires_at.isoformat() if item.food.expires_at else None,
-                "status": item.food.status or "Selling",
-                # This created_at is from the Food item, not the InventoryItem creation time
-                "food_created_at": item.food.created_at.isoformat() if item.food.created_at else None,
-                # You might also want to return the InventoryItem creation time if needed
-                # "inventory_created_at": item.created_at.isoformat() if item.created_at else None,
-            }
-            for item in inventory
-            if item.food # Ensure food relationship is loaded
-        ]
+    # Column projection over an inner join: one statement however many items there are
+    return list_response(
+        INVENTORY_FIELDS,
+        InventoryItem.id,
+        lambda columns: db.session.query(*columns)
+        .select_from(InventoryItem)
+        .join(Food, InventoryItem.food_id == Food.id)
+        .filter(InventoryItem.user_id == user.id),
     )
 
 
@@ -52,15 +93,14 @@ def get_inventory():
 @jwt_required()
 def add_inventory_item():
     logger.debug("Received request to add inventory item.")
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
-        logger.warning(f"User with email {current_user_email} not found.")
+        logger.warning("Authenticated user not found.")
         return jsonify({"error": "User not found"}), 404
 
     data = request.get_json()
-    logger.debug(f"Request JSON data: {data}")
+    logger.debug("Request JSON data: %s", data)
 
     required_fields = ["name", "quantity"]
     if not all(field in data for field in required_fields):
@@ -79,164 +119,96 @@ def add_inventory_item():
 
     item_name = data["name"].strip()
     input_quantity = quantity # Use the validated quantity
-    logger.debug(f"Validated item_name: {item_name}, quantity: {input_quantity}")
+    logger.debug("Validated item_name: %s, quantity: %s", item_name, input_quantity)
 
     # --- Main logic starts here ---
     try:
-        # --- CASE 1: Check if the Food item type already exists globally ---
-        # We MUST check this first to avoid the UNIQUE constraint error on INSERT
-        existing_food_type = Food.query.filter(Food.name.ilike(item_name)).first()
-        logger.debug(f"Checking for existing food type '{item_name}': {'Found' if existing_food_type else 'Not Found'}")
+        # --- Look up the food type in the catalog and this retailer's stock of it ---
+        existing_food_type = Food.query.filter(Food.name_lower == item_name.lower()).first()
+        logger.debug("Checking for existing food type '%s': %s", item_name, "Found" if existing_food_type else "Not Found")
 
+        existing_inventory_item = None
         if existing_food_type:
-            # The Food type exists. Now, does THIS retailer have an InventoryItem for it?
             existing_inventory_item = InventoryItem.query.filter_by(
                 user_id=user.id,
                 food_id=existing_food_type.id
             ).first()
-            logger.debug(f"Checking for existing inventory item for user {user.id} and food type {existing_food_type.id}: {'Found' if existing_inventory_item else 'Not Found'}")
-
-
-            if existing_inventory_item:
-                # --- CASE 1a: Food type exists, AND retailer already stocks it ---
-                logger.debug("Case 1a: Updating existing inventory item.")
-                # Update the quantity on the existing Food record (Note: affects global quantity due to schema)
-                existing_food_type.quantity += input_quantity
-                db.session.commit()
-                logger.debug(f"Updated quantity for existing inventory item ID {existing_inventory_item.id} ('{item_name}'). New global quantity: {existing_food_type.quantity}")
-                return jsonify({
-                   "id": existing_inventory_item.id, # Existing InventoryItem ID
-                   "food_id": existing_food_type.id,
-                   "name": existing_food_type.name,
-                   "quantity": existing_food_type.quantity, # Global quantity
-                   "best_before": existing_food_type.best_before.isoformat() if existing_food_type.best_before else None, # Shared dates
-                   "expires_at": existing_food_type.expires_at.isoformat() if existing_food_type.expires_at else None, # Shared dates
-                   "status": existing_food_type.status, # Shared status
-                   "message": f"Added {input_quantity} to existing '{item_name}'. Total quantity: {existing_food_type.quantity}"
-                }), 200 # OK for update
-
-            else:
-                # --- CASE 1b: Food type exists, BUT retailer does NOT stock it yet ---
-                logger.debug("Case 1b: Creating new inventory item linked to existing food type.")
-                # DO NOT create a new Food. Create a new InventoryItem linking this user to the *existing* Food.
-                logger.debug(f"Food type '{item_name}' exists (Food ID: {existing_food_type.id}), but user {user.id} does not have an inventory item for it. Creating new inventory link.")
-
-                # Add quantity to the existing Food object (updates global quantity)
-                existing_food_type.quantity += input_quantity
-
-                # Create the new InventoryItem linking to the existing Food
-                new_item = InventoryItem(user_id=user.id, food_id=existing_food_type.id)
-                db.session.add(new_item)
-                db.session.commit() # Commit both quantity update (on Food) and new inventory item (InventoryItem)
-
-                # Refresh the new_item to get its database-generated ID for the response
-                db.session.refresh(new_item)
-
-                logger.debug(f"Created new inventory item ID {new_item.id} for user {user.id} linking to existing food type '{item_name}' (ID: {existing_food_type.id}). Global quantity: {existing_food_type.quantity}")
-
-                return jsonify({
-                    "id": new_item.id, # This is the NEW InventoryItem ID for this user
-                    "food_id": existing_food_type.id,
-                    "name": existing_food_type.name,
-                    "quantity": existing_food_type.quantity, # Still global quantity
-                    "best_before": existing_food_type.best_before.isoformat() if existing_food_type.best_before else None,
-                    "expires_at": existing_food_type.expires_at.isoformat() if existing_food_type.expires_at else None,
-                    "status": existing_food_type.status,
-                    "message": f"Added '{item_name}' to your inventory."
-                }), 201 # Created a new inventory entry for this user
 
-        else:
-            # --- CASE 2: Food item type does NOT exist globally ---
-            logger.debug("Case 2: Creating new food type and inventory item.")
-            # Create a new Food item AND a new InventoryItem for this retailer.
-            logger.debug(f"Food type '{item_name}' does not exist. Creating new food type and inventory item.")
-
-            # Call Gemini API to get dates for this brand new food item type
-            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-            if not os.getenv("GEMINI_API_KEY"):
-                logger.error("Gemini API key not configured.")
-                return jsonify({"error": "Gemini API key not configured"}), 500
-
-            # --- Date calculation moved inside the function ---
-            current_utc_datetime = datetime.utcnow()
-            current_utc_date_str = current_utc_datetime.date().isoformat()
-            today_utc_date = current_utc_datetime.date()
-            seven_days_from_today_date = today_utc_date + timedelta(days=7)
-            # --- End of moved date calculation ---
-
-            logger.debug(f"Calculated current_utc_date_str: {current_utc_date_str}")
-            logger.debug(f"Calculated seven_days_from_today_date: {seven_days_from_today_date}")
-
-            prompt = f"Given a food item '{item_name}', the current date is {current_utc_date_str}, and the location is '{user.city}'. Considering typical storage conditions, temperature, and the current season in this region, provide an estimated 'best_before' and 'expires_at' date in the exact format 'best_before:YYYY-MM-DDTHH:MM:SS, expires_at:YYYY-MM-DDTHH:MM:SS'. Use 12:00:00 for the time component unless a specific time is highly relevant. Do not include any text outside of the specified format. If you cannot generate reasonable estimated dates, return 'ERROR: Unable to generate valid dates'."
-            logger.debug(f"Gemini prompt: {prompt}")
-
-            model = genai.GenerativeModel('gemini-1.5-pro')
-            response = model.generate_content(prompt)
-
-            logger.debug(f"Raw Gemini response text: {response.text}")
-
-            result = response.text.strip()
-            if result == "ERROR: Unable to generate valid dates":
-                logger.warning("Gemini returned error for date generation.")
-                return jsonify({"error": "Gemini failed to generate valid dates based on rules"}), 422
-
-            match = re.search(r"best_before:\s*(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}),\s*expires_at:\s*(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})", result)
-            if not match:
-                logger.error(f"Gemini response format mismatch. Expected 'best_before:YYYY-MM-DDTHH:MM:SS, expires_at:YYYY-MM-DDTHH:MM:SS', got: {result}")
-                return jsonify({"error": f"Invalid Gemini response format. Expected 'best_before:YYYY-MM-DDTHH:MM:SS, expires_at:YYYY-MM-DDTHH:MM:SS', got: {result}"}), 422
-
-            best_before_str = match.group(1)
-            expires_at_str = match.group(2)
-            logger.debug(f"Extracted best_before_str: {best_before_str}, expires_at_str: {expires_at_str}")
-
-            # Validate dates from Gemini
-            try:
-                # Use fromisoformat with the timezone offset directly if present ('Z')
-                best_before = datetime.fromisoformat(best_before_str.replace("Z", "+00:00"))
-                expires_at = datetime.fromisoformat(expires_at_str.replace("Z", "+00:00"))
-                logger.debug(f"Parsed best_before datetime: {best_before}, expires_at datetime: {expires_at}")
-
-            except ValueError as e:
-                 logger.error(f"Date parsing error from Gemini output: {best_before_str}, {expires_at_str} - {str(e)}", exc_info=True)
-                 return jsonify({"error": f"Error parsing dates from Gemini: {str(e)}"}), 500
-
-            # --- USE THE NEWLY CALCULATED seven_days_from_today_date ---
-            if best_before.date() < seven_days_from_today_date or expires_at < best_before + timedelta(days=14):
-                 logger.warning(f"Generated dates are invalid based on rules. best_before: {best_before}, expires_at: {expires_at}, seven_days_from_today_date: {seven_days_from_today_date}")
-                 return jsonify({"error": "Generated dates are invalid (best before must be at least 7 days from today, and expiry at least 14 days after best before)"}), 422
-
-            # Create the NEW Food item (since it's a new type)
-            # created_at should reflect the time THIS Food entry is created
-            food = Food(
-                name=item_name,
-                quantity=input_quantity, # Initial quantity for this new type
-                best_before=best_before, # Dates from Gemini
-                expires_at=expires_at,    # Dates from Gemini
-                created_at=datetime.utcnow(), # Use current UTC time for creation timestamp
-                status="Selling"
-                 # Add is_refrigerated if needed and available in data
-            )
-            db.session.add(food)
-            db.session.flush() # Get food.id
-            logger.debug(f"Created new Food object with ID: {food.id}, created_at: {food.created_at}")
-
-
-            # Create the NEW InventoryItem linking the user to this new Food type
-            new_item = InventoryItem(user_id=user.id, food_id=food.id)
-            db.session.add(new_item)
-            db.session.commit()
-            logger.debug(f"Created new inventory item ID {new_item.id} for user {user.id} linking to new food type '{food.name}' (ID: {food.id}). Quantity: {food.quantity}")
-
-            return jsonify({
-                "id": new_item.id,
-                "food_id": food.id,
-                "name": food.name,
-                "quantity": food.quantity,
-                "best_before": food.best_before.isoformat() if food.best_before else None,
-                "expires_at": food.expires_at.isoformat() if food.expires_at else None,
-                "status": food.status,
-                "food_created_at": food.created_at.isoformat() # Include the Food creation date in response
-            }), 201 # Created new InventoryItem and Food
+        if existing_inventory_item:
+            # --- CASE 1: Retailer already stocks it; add to their own row only ---
+            logger.debug("Case 1: Adding stock to existing inventory item.")
+            dates = None
+            if is_dead(existing_inventory_item):
+                # The restock starts a fresh lot, which needs dates of its own
+                try:
+                    dates = _shelf_life_dates(item_name, user.city)
+                except ShelfLifeError as e:
+                    return jsonify({"error": e.message}), e.status_code
+                reservations.release_items([existing_inventory_item.id])
+            outcome = restock(existing_inventory_item.id, input_quantity, dates)
+            if existing_inventory_item.status == "Listing":
+                feed_cache.invalidate_pincodes([user.pincode])
+            db.session.commit() # Expires the item, so the fields below are read back fresh
+            logger.debug("Added %s to inventory item ID %s ('%s'). New quantity: %s", input_quantity, existing_inventory_item.id, item_name, existing_inventory_item.quantity)
+            response = {
+               "id": existing_inventory_item.id,
+               "food_id": existing_food_type.id,
+               "name": existing_food_type.name,
+               "quantity": existing_inventory_item.quantity,
+               "best_before": existing_inventory_item.best_before.isoformat() if existing_inventory_item.best_before else None,
+               "expires_at": existing_inventory_item.expires_at.isoformat() if existing_inventory_item.expires_at else None,
+               "status": existing_inventory_item.status,
+               "message": f"Added {input_quantity} to existing '{item_name}'. Total quantity: {existing_inventory_item.quantity}"
+            }
+            if outcome == RESTARTED:
+                response["message"] = f"Replaced the unsellable stock of '{item_name}' with {input_quantity} fresh."
+                if existing_inventory_item.status == enrichment.PENDING:
+                    enrichment.enqueue(existing_inventory_item.id, user.city)
+                    status_url = url_for("retailer.get_food_enrichment", food_id=existing_food_type.id)
+                    response["enrichment_url"] = status_url
+                    return jsonify(response), 202, {"Location": status_url}
+            return jsonify(response), 200 # OK for update
+
+        # --- CASE 2: New stock for this retailer, with its own shelf-life dates ---
+        logger.debug("Case 2: Creating new inventory item.")
+        try:
+            dates = _shelf_life_dates(item_name, user.city)
+        except ShelfLifeError as e:
+            return jsonify({"error": e.message}), e.status_code
+        best_before, expires_at = dates if dates else (None, None)
+
+        # The catalog entry is created on first use of the name
+        food = existing_food_type or catalog_food(item_name)
+        new_item = InventoryItem(
+            user_id=user.id,
+            food_id=food.id,
+            quantity=input_quantity,
+            best_before=best_before, # Cached or model dates, None while pending
+            expires_at=expires_at,
+            status="Selling" if dates else enrichment.PENDING
+        )
+        db.session.add(new_item)
+        db.session.commit()
+        logger.debug("Created new inventory item ID %s for user %s linking to food type '%s' (ID: %s). Quantity: %s", new_item.id, user.id, food.name, food.id, new_item.quantity)
+
+        response = {
+            "id": new_item.id,
+            "food_id": food.id,
+            "name": food.name,
+            "quantity": new_item.quantity,
+            "best_before": new_item.best_before.isoformat() if new_item.best_before else None,
+            "expires_at": new_item.expires_at.isoformat() if new_item.expires_at else None,
+            "status": new_item.status,
+            "food_created_at": food.created_at.isoformat(), # When the food type entered the catalog
+            "message": f"Added '{item_name}' to your inventory."
+        }
+        if dates is None:
+            # Dates are filled in by the enrichment worker; the client polls enrichment_url
+            enrichment.enqueue(new_item.id, user.city)
+            status_url = url_for("retailer.get_food_enrichment", food_id=food.id)
+            response["enrichment_url"] = status_url
+            return jsonify(response), 202, {"Location": status_url}
+        return jsonify(response), 201 # Created new InventoryItem
 
     except SQLAlchemyError as e:
         db.session.rollback() # Roll back the transaction on error
@@ -247,44 +219,265 @@ def add_inventory_item():
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
 
+def _shelf_life_dates(item_name, city):
+    """Dates for a new lot of ``item_name``, or None while they are estimated in the background.
+
+    Raises ShelfLifeError if the model is needed and fails or is not configured.
+    """
+    # Shelf-life dates come from the persistent estimate cache when possible. On a
+    # miss the model is asked in the background, unless SHELF_LIFE_ASYNC is off.
+    dates = cached_shelf_life(item_name, city)
+    if dates is None:
+        if not gemini.is_configured():
+            logger.error("Gemini API key not configured.")
+            raise ShelfLifeError("Gemini API key not configured", 500, retryable=False)
+        if not current_app.config["SHELF_LIFE_ASYNC"]:
+            dates = generate_shelf_life(item_name, city)
+    return dates
+
+
+def _read_intake_rows():
+    """Rows for /add_items from a CSV upload (``file``) or a JSON array / ``{"items": [...]}``.
+
+    Raises ValueError if the upload cannot be read as CSV.
+    """
+    upload = request.files.get("file")
+    if upload is not None:
+        try:
+            text = upload.read().decode("utf-8-sig")
+            reader = csv.DictReader(io.StringIO(text))
+            return [
+                {(key or "").strip().lower(): (value or "").strip() for key, value in row.items()}
+                for row in reader
+            ]
+        except UnicodeDecodeError:
+            raise ValueError("The CSV file must be UTF-8 encoded")
+        except csv.Error as e:
+            raise ValueError(f"Malformed CSV file: {e}")
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("items")
+    return data if isinstance(data, list) else None
+
+
+@retailer_bp.route("/add_items", methods=["POST"])
+@jwt_required()
+def add_inventory_items():
+    user = get_current_user()
+
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    try:
+        rows = _read_intake_rows()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if rows is None:
+        return jsonify({"error": "Send a JSON array of items or a CSV file with name and quantity columns"}), 422
+    if not rows:
+        return jsonify({"error": "No items provided"}), 422
+    max_rows = current_app.config["BATCH_INTAKE_MAX_ROWS"]
+    if len(rows) > max_rows:
+        return jsonify({"error": f"At most {max_rows} items can be added per request"}), 413
+
+    # --- Validate every row up front; invalid rows are reported, the rest go ahead ---
+    results = []
+    valid = []  # (result, item_name, quantity)
+    for index, row in enumerate(rows):
+        result = {"row": index}
+        results.append(result)
+        if not isinstance(row, dict) or not row.get("name") or row.get("quantity") in (None, ""):
+            result.update(status="error", error="Missing required fields (name or quantity)")
+            continue
+        item_name = str(row["name"]).strip()
+        result["name"] = item_name
+        try:
+            quantity = float(row["quantity"])
+        except (TypeError, ValueError):
+            result.update(status="error", error="Invalid quantity format")
+            continue
+        if quantity <= 0:
+            result.update(status="error", error="Quantity must be greater than 0")
+            continue
+        valid.append((result, item_name, quantity))
+
+    if not valid:
+        return jsonify({"results": results, "summary": {"total": len(results), "errors": len(results)}}), 422
+
+    try:
+        # --- Resolve every name and this retailer's stock in one query each ---
+        names_by_key = {}
+        for _, item_name, _ in valid:
+            names_by_key.setdefault(item_name.lower(), item_name)
+        foods_by_key = {
+            food.name_lower: food
+            for food in Food.query.filter(Food.name_lower.in_(list(names_by_key))).all()
+        }
+        items_by_food_id = {}
+        if foods_by_key:
+            items_by_food_id = {
+                item.food_id: item
+                for item in InventoryItem.query.filter(
+                    InventoryItem.user_id == user.id,
+                    InventoryItem.food_id.in_([food.id for food in foods_by_key.values()]),
+                )
+            }
+
+        # --- Every name new to this retailer shares one cache lookup and, on misses, one batched estimate ---
+        # Restocking a dead lot starts a fresh one, which needs dates like a new item
+        dead_item_ids = {item.id for item in items_by_food_id.values() if is_dead(item)}
+        new_names = [
+            name for key, name in names_by_key.items()
+            if key not in foods_by_key
+            or foods_by_key[key].id not in items_by_food_id
+            or items_by_food_id[foods_by_key[key].id].id in dead_item_ids
+        ]
+        # Without SHELF_LIFE_ASYNC the model is asked for the misses here, before this batch writes anything
+        if current_app.config["SHELF_LIFE_ASYNC"] or not gemini.is_configured():
+            dates_by_name = cached_shelf_life_many(new_names, user.city) if new_names else {}
+        else:
+            dates_by_name = estimate_shelf_life_many(new_names, user.city)
+        if any(name not in dates_by_name for name in new_names) and not gemini.is_configured():
+            return jsonify({"error": "Gemini API key not configured"}), 500
+
+        pending_item_ids = []
+        created_item_ids = set()
+        restocked = {}  # existing item id -> quantity added by this batch
+        restock_dates = {}  # dead item id -> dates of its fresh lot, None while pending
+        for result, item_name, quantity in valid:
+            key = item_name.lower()
+            food = foods_by_key.get(key)
+            item = items_by_food_id.get(food.id) if food else None
+            if item is None:
+                dates = dates_by_name.get(names_by_key[key])
+                if isinstance(dates, ShelfLifeError):
+                    result.update(status="error", error=dates.message)
+                    continue
+                if food is None:
+                    food = foods_by_key[key] = catalog_food(names_by_key[key])
+                    result["status"] = "created"
+                else:
+                    result["status"] = "added"
+                if not dates:
+                    result["status"] = "pending"
+                best_before, expires_at = dates if dates else (None, None)
+                item = InventoryItem(
+                    user_id=user.id,
+                    food_id=food.id,
+                    quantity=quantity,
+                    best_before=best_before,
+                    expires_at=expires_at,
+                    status="Selling" if dates else enrichment.PENDING,
+                )
+                db.session.add(item)
+                db.session.flush() # Get item.id
+                items_by_food_id[food.id] = item
+                created_item_ids.add(item.id)
+                if not dates:
+                    pending_item_ids.append(item.id)
+            elif item.id in dead_item_ids:
+                dates = dates_by_name.get(names_by_key[key])
+                if isinstance(dates, ShelfLifeError):
+                    result.update(status="error", error=dates.message)
+                    continue
+                result["status"] = "restarted" if dates else "pending"
+                restocked[item.id] = restocked.get(item.id, 0) + quantity
+                restock_dates[item.id] = dates
+            else:
+                result["status"] = "updated"
+                if item.id in created_item_ids:
+                    item.quantity += quantity # Our own new row, not visible to anyone else yet
+                else:
+                    restocked[item.id] = restocked.get(item.id, 0) + quantity
+            result.update(id=item.id, food_id=food.id, quantity=quantity)
+
+        # Stock that already existed gets one atomic increment per item; dead lots start afresh
+        if restock_dates:
+            reservations.release_items(list(restock_dates))
+        for item_id, quantity in restocked.items():
+            dates = restock_dates.get(item_id)
+            if restock(item_id, quantity, dates) == RESTARTED and not dates:
+                pending_item_ids.append(item_id)
+        if any(item.status == "Listing" for item in items_by_food_id.values() if item.id in restocked):
+            feed_cache.invalidate_pincodes([user.pincode])
+        db.session.commit()
+    except ShelfLifeError as e:
+        # The model call failed as a whole, e.g. rate limited
+        db.session.rollback()
+        return jsonify({"error": e.message}), e.status_code
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error("Database error adding inventory batch: %s", e, exc_info=True)
+        return jsonify({"error": "Database error while adding items."}), 500
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Unexpected error adding inventory batch: %s", e, exc_info=True)
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+    for result in results:
+        if result.get("id") in pending_item_ids:
+            result["enrichment_url"] = url_for("retailer.get_food_enrichment", food_id=result["food_id"])
+    if pending_item_ids:
+        enrichment.enqueue_batch(pending_item_ids, user.city)
+
+    summary = {"total": len(results)}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return jsonify({"results": results, "summary": summary}), 202 if pending_item_ids else 200
+
+
+@retailer_bp.route("/shelf_life_cache/stats", methods=["GET"])
+def get_shelf_life_cache_stats():
+    # Unauthenticated on purpose so monitoring can scrape it; exposes counters only
+    return jsonify(cache_stats()), 200
+
+
+@retailer_bp.route("/food/<int:food_id>/enrichment", methods=["GET"])
+@jwt_required()
+def get_food_enrichment(food_id):
+    user = get_current_user()
+
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    item = InventoryItem.query.filter_by(user_id=user.id, food_id=food_id).first()
+    if not item:
+        return jsonify({"error": "Food not found in your inventory"}), 404
+
+    if item.status == enrichment.PENDING and not enrichment.is_in_flight(item.id):
+        # The process that queued it may have restarted; queue it again here
+        enrichment.enqueue(item.id, user.city)
+
+    return jsonify(enrichment.status_payload(item)), 200
+
+
 @retailer_bp.route("/requested_food", methods=["GET"])
 @jwt_required()
 def get_food_requests():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    requests = FoodRequest.query.join(InventoryItem).filter(InventoryItem.user_id == user.id).all()
-    return jsonify([
-        {
-            "id": req.id,
-            "food_id": req.inventory_item.food_id,
-            "ngo_id": req.requester_id,
-            "quantity": req.quantity if hasattr(req, "quantity") else req.inventory_item.food.quantity,
-            "status": req.status,
-            "pickup_date": req.pickup_date.isoformat() if req.pickup_date else None,
-            "created_at": req.created_at.isoformat(),
-        }
-        for req in requests
-    ])
+    return list_response(
+        FOOD_REQUEST_FIELDS,
+        FoodRequest.id,
+        lambda columns: db.session.query(*columns)
+        .select_from(FoodRequest)
+        .join(InventoryItem, FoodRequest.inventory_item_id == InventoryItem.id)
+        .filter(InventoryItem.user_id == user.id),
+    )
 
 
 @retailer_bp.route("/inventory/<int:id>/sell", methods=["POST"])
 @jwt_required()
 def sell_inventory_item(id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    # Find the specific InventoryItem belonging to this user
-    item = InventoryItem.query.filter_by(id=id, user_id=user.id).first()
-    if not item:
-        return jsonify({"error": "Inventory item not found"}), 404
-
     data = request.get_json()
     if not data: # Check if data is even present
          return jsonify({"error": "Request body must be JSON"}), 415 # 415 Unsupported Media Type if not JSON
@@ -296,31 +489,31 @@ def sell_inventory_item(id):
         if quantity_to_sell <= 0:
             return jsonify({"error": "Quantity must be greater than 0"}), 422
 
-        # Check if there's enough quantity in stock
-        if quantity_to_sell > item.food.quantity:
-            return jsonify({"error": "Insufficient quantity"}), 422
-
         current_date = datetime.utcnow()
-        # FIX: Changed item.food.expiry_date to item.food.expires_at
-        # This check means 'If current date is AFTER the expiration date...'
-        if item.food.expires_at and current_date > item.food.expires_at:
-             # Added check for expires_at being None just in case
-            return jsonify({"error": "Cannot sell after expiry date"}), 422
-
-        # Deduct the sold quantity from the stock
-        item.food.quantity -= quantity_to_sell
+        # Deduct the sold quantity in one conditional UPDATE on this retailer's own row:
+        # it only applies while enough unexpired stock is left (see stock.py)
+        if not take_stock(id, user.id, quantity_to_sell, current_date):
+            # Nothing changed; find out why
+            item = InventoryItem.query.filter_by(id=id, user_id=user.id).first()
+            if not item:
+                return jsonify({"error": "Inventory item not found"}), 404
+            if item.expires_at and current_date > item.expires_at:
+                return jsonify({"error": "Cannot sell after expiry date"}), 422
+            return jsonify({"error": "Insufficient quantity"}), 422
 
-        # If quantity drops to zero or less, you might want to change status,
-        # though the requirement here is just to sell.
-        # if item.food.quantity <= 0:
-        #     item.food.status = "SoldOut" # Example
+        # Read back within the transaction; the updated row stays locked until commit
+        item = db.session.query(InventoryItem.quantity, InventoryItem.status, Food.name).join(
+            Food, InventoryItem.food_id == Food.id
+        ).filter(InventoryItem.id == id).one()
+        if item.status == "Listing":
+            feed_cache.invalidate_pincodes([user.pincode])
 
         db.session.commit()
 
         # Return the updated remaining quantity
         return jsonify({
-            "message": f"Sold {quantity_to_sell} of {item.food.name}",
-            "remaining_quantity": item.food.quantity
+            "message": f"Sold {quantity_to_sell} of {item.name}",
+            "remaining_quantity": item.quantity
         }), 200
 
     except ValueError: # Catch if the "quantity" value cannot be converted to float
@@ -338,21 +531,33 @@ def sell_inventory_item(id):
 @retailer_bp.route("/inventory/<int:id>/list", methods=["POST"])
 @jwt_required()
 def list_inventory_item(id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
     item = InventoryItem.query.filter_by(id=id, user_id=user.id).first()
-    if not item or item.food.quantity <= 0:
+    if not item or item.quantity <= 0:
         return jsonify({"error": "Inventory item not found or no quantity available"}), 404
 
+    if item.status == enrichment.PENDING:
+        return jsonify({"error": "Shelf-life dates are still being estimated"}), 409
+
     current_date = datetime.utcnow()
-    if current_date > item.food.expires_at:
+    if item.expires_at and current_date > item.expires_at:
         return jsonify({"error": "Food has already expired"}), 422
     
-    item.food.status = "Listing"
+    if item.status != "Listing":
+        item.status = "Listing"
+        feed_cache.invalidate_pincodes([user.pincode])
+        events.publish(events.pincode_channel(user.pincode), "listing.created", {
+            "inventory_item_id": item.id,
+            "food_id": item.food_id,
+            "quantity": item.quantity - item.held_quantity,
+            "pincode": user.pincode,
+        })
+    # Listing is what the best-before notification asked for
+    notifications.dismiss(user.id, item.id, current_date, kind=notifications.BEST_BEFORE)
     try:
         db.session.commit()
         return jsonify({"message": "Food listed for NGOs"}), 200
@@ -368,60 +573,75 @@ def list_inventory_item(id):
 @retailer_bp.route("/notifications", methods=["GET"])
 @jwt_required()
 def get_notifications():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    # Mock notifications (replace with actual logic or database table)
-    inventory = InventoryItem.query.filter_by(user_id=user.id).all()
-    notifications = []
-    current_date = datetime.utcnow()
-    for item in inventory:
-        if item.food.quantity > 0 and item.food.status == "Selling" and current_date > item.food.expiry_date:
-            notifications.append({
-                "id": item.id,
-                "message": f"Your {item.food.name} (remaining: {item.food.quantity}) is past best before. List it or ignore.",
-                "options": ["List", "Ignore"]
-            })
-
-    return jsonify(notifications), 200
+    # Written by the expiry sweep (see notifications.py); only unread ones are shown
+    return list_response(
+        NOTIFICATION_FIELDS,
+        Notification.id,
+        lambda columns: db.session.query(*columns)
+        .select_from(Notification)
+        .join(InventoryItem, Notification.inventory_item_id == InventoryItem.id)
+        .join(Food, InventoryItem.food_id == Food.id)
+        .filter(
+            Notification.user_id == user.id,
+            Notification.read_at.is_(None),
+            notifications.current(),
+        ),
+    )
 
 @retailer_bp.route("/requests/<int:request_id>/approve", methods=["POST"])
 @jwt_required()
 def approve_request(request_id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
     request = FoodRequest.query.filter_by(id=request_id).first()
-    if not request or request.inventory_item.user_id != user.id or request.status != "pending":
+    if not request or not request.inventory_item or request.inventory_item.user_id != user.id or request.status != "pending":
         return jsonify({"error": "Request not found or already processed"}), 404
 
-    request.status = "approved"
-    request.inventory_item.food.status = "Approved"
-    db.session.commit()
+    # The request's hold becomes a sale; the rest of the item stays listed (see reservations.py)
+    try:
+        reservations.allocate(request)
+        events.publish(events.user_channel(request.requester_id), "request.approved", {
+            "request_id": request.id,
+            "inventory_item_id": request.inventory_item_id,
+        })
+        db.session.commit()
+    except ReservationError as e:
+        db.session.rollback()
+        return jsonify({"error": e.message}), e.status_code
 
     return jsonify({"message": "Request approved"}), 200
 
 @retailer_bp.route("/requests/<int:request_id>/ignore", methods=["POST"])
 @jwt_required()
 def ignore_request(request_id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
     request = FoodRequest.query.filter_by(id=request_id).first()
-    if not request or request.inventory_item.user_id != user.id or request.status != "pending":
+    if not request or not request.inventory_item or request.inventory_item.user_id != user.id or request.status != "pending":
         return jsonify({"error": "Request not found or already processed"}), 404
 
-    request.status = "ignored"
-    db.session.commit()
+    # Gives the held quantity back to the listing
+    try:
+        reservations.release(request)
+        events.publish(events.user_channel(request.requester_id), "request.ignored", {
+            "request_id": request.id,
+            "inventory_item_id": request.inventory_item_id,
+        })
+        db.session.commit()
+    except ReservationError as e:
+        db.session.rollback()
+        return jsonify({"error": e.message}), e.status_code
 
     return jsonify({"message": "Request ignored"}), 200
 
@@ -431,10 +651,9 @@ def ignore_request(request_id):
 @retailer_bp.route("/item/remove/<int:item_id>", methods=["DELETE"])
 @jwt_required()
 def remove_inventory_item(item_id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
-    if not user or "Retailer" not in [role.name for role in user.roles]:
+    if not user or "Retailer" not in user.roles:
         return jsonify({"error": "User not found or not a retailer"}), 404
 
     item = InventoryItem.query.filter_by(id=item_id, user_id=user.id).first()
@@ -442,7 +661,18 @@ def remove_inventory_item(item_id):
         return jsonify({"error": "Inventory item not found"}), 404
 
     try:
+        if item.status == "Listing":
+            # Only this retailer's row leaves the feed
+            feed_cache.invalidate_pincodes([user.pincode])
+        # Pending requests cannot be fulfilled any more; close them so their holds do not linger
+        released = reservations.release_items([item.id], reservations.IGNORED)
+        Notification.query.filter_by(inventory_item_id=item.id).delete(synchronize_session=False)
         db.session.delete(item)
+        for food_request in released:
+            events.publish(events.user_channel(food_request.requester_id), "request.ignored", {
+                "request_id": food_request.id,
+                "inventory_item_id": food_request.inventory_item_id,
+            })
         db.session.commit()
         return jsonify({"message": "Item removed successfully"}), 200
     except Exception as e:
@@ -452,16 +682,16 @@ def remove_inventory_item(item_id):
 @retailer_bp.route("/food/<int:id>/ignore", methods=["POST"])
 @jwt_required()
 def ignore_notification(id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
 
-    if not user or "Retailer" not in [role.name for role in user.roles]:
+    if not user or "Retailer" not in user.roles:
         return jsonify({"error": "User not found or not a retailer"}), 404
 
-    item = InventoryItem.query.filter_by(id=id, user_id=user.id).join(Food).first()
-    if not item or item.food.status not in ["Selling", "Listing"]:
+    item = InventoryItem.query.filter_by(id=id, user_id=user.id).first()
+    if not item or item.status not in ["Selling", "Listing", "Expired"]:
         return jsonify({"error": "Item not found or not eligible for ignore"}), 404
 
-    # No status change; simply acknowledge the ignore action
-    # Optionally, log this action in a notifications table if implemented
+    # No status change; the dismissal is stored so the notification stays hidden
+    notifications.dismiss(user.id, item.id)
+    db.session.commit()
     return jsonify({"message": "Notification ignored"}), 200
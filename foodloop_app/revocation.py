@@ -0,0 +1,187 @@
+# foodloop_app/revocation.py
+"""Revoked JWTs, rejected on every request without a database query.
+
+``/auth-logout`` revokes the tokens it is given; a refresh that rotates the
+refresh token revokes the old one. Each revocation is a ``revoked_token``
+row, kept until the token would have expired anyway, and an entry in this
+process's :class:`Revocations`: a set of revoked ``jti`` with a
+:class:`BloomFilter` in front. Almost every token checked was never revoked,
+and the filter answers those with a few bit probes; its hits are confirmed
+against the set, so a false positive never rejects a good token.
+
+Each process reads the rows revoked since its last sync every
+``REVOCATION_SYNC_INTERVAL`` seconds, so a token revoked through one worker
+is rejected by the others within that interval (by the revoking worker at
+once). It syncs by ``revoked_at`` rather than by id, since ids can commit out
+of order, and reads ``REVOCATION_SYNC_OVERLAP`` seconds back from the newest
+``revoked_at`` it has seen: a revocation stamped earlier but committed
+later, or stamped by a worker whose clock is behind, is still picked up.
+Rows read twice are skipped by ``jti``. Expired revocations are dropped from
+the table and the filter every ``REVOCATION_PRUNE_INTERVAL`` seconds.
+
+The state belongs to the app (``app.extensions["revocations"]``).
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify
+from sqlalchemy import delete, select
+
+from foodloop_app import db
+from . import background
+from .models import RevokedToken
+from .upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Set membership with no false negatives and about ``error_rate`` false positives up to ``capacity`` keys."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))  # bits
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class Revocations:
+    """This process's revoked ``jti`` values and when each token expires."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.expires = {}  # jti -> expiry, epoch seconds
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.synced_through = None  # newest revoked_at seen
+        self.pruned_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __contains__(self, jti):
+        return jti in self.bloom and jti in self.expires
+
+    def add(self, jti, expires):
+        with self.lock:
+            self.expires[jti] = expires
+            if len(self.expires) > self.bloom.capacity:
+                self._rebuild()
+            else:
+                self.bloom.add(jti)
+
+    def prune(self, now):
+        """Forget tokens that expired; they are rejected for that already."""
+        with self.lock:
+            self.expires = {jti: expires for jti, expires in self.expires.items() if expires > now}
+            self._rebuild()
+
+    def _rebuild(self):
+        # Filters cannot delete; build a new one sized for what is left and swap it in
+        bloom = BloomFilter(max(self.capacity, 2 * len(self.expires)), self.error_rate)
+        for jti in self.expires:
+            bloom.add(jti)
+        self.bloom = bloom
+
+
+_revocations_lock = threading.Lock()
+
+
+def _state():
+    """The app's revocations in this process, loaded from the table on first use."""
+    app = current_app._get_current_object()
+    revocations = app.extensions.get("revocations")
+    if revocations is None:
+        with _revocations_lock:
+            revocations = app.extensions.get("revocations")
+            if revocations is None:
+                config = app.config
+                revocations = Revocations(config["REVOCATION_BLOOM_CAPACITY"], config["REVOCATION_BLOOM_ERROR_RATE"])
+                _load(revocations)
+                app.extensions["revocations"] = revocations
+    background.every(f"revocation-sync-{id(app)}", app.config["REVOCATION_SYNC_INTERVAL"], sync)
+    return revocations
+
+
+def _load(revocations):
+    """Add revocations written since the last load, by any worker."""
+    now = datetime.utcnow()
+    config = current_app.config
+    prune = time.monotonic() - revocations.pruned_at > config["REVOCATION_PRUNE_INTERVAL"]
+    query = select(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at).where(
+        RevokedToken.expires_at > now
+    )
+    if revocations.synced_through is not None:
+        query = query.where(
+            RevokedToken.revoked_at >= revocations.synced_through - timedelta(seconds=config["REVOCATION_SYNC_OVERLAP"])
+        )
+    with db.engine.begin() as conn:
+        rows = conn.execute(query).all()
+        if prune:
+            pruned = conn.execute(delete(RevokedToken).where(RevokedToken.expires_at < now)).rowcount
+            if pruned:
+                logger.info("Pruned %s expired token revocations", pruned)
+    for row in rows:
+        if row.jti not in revocations.expires:
+            revocations.add(row.jti, _epoch(row.expires_at))
+        if revocations.synced_through is None or row.revoked_at > revocations.synced_through:
+            revocations.synced_through = row.revoked_at
+    if prune:
+        revocations.prune(time.time())
+        revocations.pruned_at = time.monotonic()
+
+
+def sync():
+    """Pick up tokens revoked through other workers."""
+    revocations = _state()
+    with _revocations_lock:
+        _load(revocations)
+
+
+def is_revoked(jti):
+    return jti in _state()
+
+
+def revoke(token):
+    """Reject the decoded JWT ``token`` from now until it expires."""
+    if token["exp"] <= time.time():
+        return  # Rejected as expired already
+    expires_at = datetime.utcfromtimestamp(token["exp"])
+    with db.engine.begin() as conn:
+        # Skipped if already revoked
+        upsert(
+            RevokedToken,
+            {"jti": token["jti"], "type": token["type"], "expires_at": expires_at, "revoked_at": datetime.utcnow()},
+            connection=conn,
+        )
+    _state().add(token["jti"], token["exp"])
+
+
+def _epoch(naive_utc):
+    return (naive_utc - datetime(1970, 1, 1)).total_seconds()
+
+
+def register(jwt):
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return is_revoked(jwt_payload["jti"])
+
+    @jwt.revoked_token_loader
+    def revoked_token(jwt_header, jwt_payload):
+        return jsonify({"error": "Token has been revoked"}), 401
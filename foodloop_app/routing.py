@@ -0,0 +1,149 @@
+# foodloop_app/routing.py
+"""Send read-only requests to a read replica when one is configured.
+
+With ``DATABASE_REPLICA_URL`` set, ``db.session`` is a :class:`RoutingSession`.
+In a ``GET``/``HEAD`` request it reads from the replica bind, except:
+
+* once the session writes (a flush, an INSERT/UPDATE/DELETE statement or a
+  ``SELECT ... FOR UPDATE``), everything else in that transaction, reads included, goes to the primary;
+* for ``READ_YOUR_WRITES_WINDOW`` after a user's request commits a write,
+  that user's reads go to the primary, so they see their own change even if
+  the replica lags. Each process remembers its own users' writes, and the
+  response to a write carries a signed marker (cookie :data:`MARKER_COOKIE`
+  and header :data:`MARKER_HEADER`) with the user id and time, so a request
+  sending it back reaches the primary on any worker;
+* code that must see the latest data uses ``with primary():`` (e.g. token
+  identity lookups, so a just-registered user is never unknown).
+
+Other methods, background threads and CLI commands always use the primary.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from itsdangerous import BadData, URLSafeTimedSerializer
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = "replica"
+READ_METHODS = ("GET", "HEAD")
+MAX_TRACKED_USERS = 100000
+
+# Where a client sends back the marker of its last write; browsers do it with the cookie
+MARKER_COOKIE = "read_your_writes"
+MARKER_HEADER = "X-Read-Your-Writes"
+
+WROTE_KEY = "wrote"
+
+_last_writes = OrderedDict()  # user id -> time.monotonic() of their last committed write
+_last_writes_lock = threading.Lock()
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return engine
+        if self._flushing or isinstance(clause, UpdateBase) or getattr(clause, "_for_update_arg", None) is not None:
+            self.info[WROTE_KEY] = True
+            return engine
+        engines = self._db.engines
+        if REPLICA in engines and engine is engines.get(None) and _reads_from_replica(self):
+            return engines[REPLICA]
+        return engine
+
+
+def _reads_from_replica(session):
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    if session.info.get(WROTE_KEY) or g.get("_routing_primary", 0):
+        return False
+    user_id = g.get("_routing_user_id")
+    return user_id is None or not wrote_recently(user_id)
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside this block, even in a read-only request."""
+    if not has_app_context():
+        yield
+        return
+    g._routing_primary = g.get("_routing_primary", 0) + 1
+    try:
+        yield
+    finally:
+        g._routing_primary -= 1
+
+
+def set_user(user_id):
+    """Record who the current request acts for, for read-your-writes routing."""
+    g._routing_user_id = user_id
+
+
+def wrote_recently(user_id):
+    with _last_writes_lock:
+        wrote_at = _last_writes.get(user_id)
+    if wrote_at is not None and time.monotonic() - wrote_at < current_app.config["READ_YOUR_WRITES_WINDOW"]:
+        return True
+    # Written through another worker
+    return has_request_context() and _marker_user() == user_id
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt="read-your-writes")
+
+
+def _marker_user():
+    """User id of this request's write marker, if it is genuine and within the window."""
+    if "_routing_marker_user" not in g:
+        marker = request.headers.get(MARKER_HEADER) or request.cookies.get(MARKER_COOKIE)
+        user_id = None
+        if marker:
+            try:
+                user_id = _serializer().loads(marker, max_age=current_app.config["READ_YOUR_WRITES_WINDOW"])
+            except BadData:
+                pass  # Tampered with or expired
+        g._routing_marker_user = user_id
+    return g._routing_marker_user
+
+
+def _mark_write(user_id):
+    with _last_writes_lock:
+        _last_writes[user_id] = time.monotonic()
+        _last_writes.move_to_end(user_id)
+        while len(_last_writes) > MAX_TRACKED_USERS:
+            _last_writes.popitem(last=False)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    if session.info.pop(WROTE_KEY, False) and has_request_context():
+        user_id = g.get("_routing_user_id")
+        if user_id is not None:
+            _mark_write(user_id)
+            g._routing_wrote = user_id  # the response carries the marker
+
+
+def register(app):
+    """Add the write marker to responses of requests that committed a write, when a replica is configured."""
+
+    @app.after_request
+    def set_write_marker(response):
+        user_id = g.get("_routing_wrote")
+        if user_id is None or REPLICA not in app.config["SQLALCHEMY_BINDS"]:
+            return response
+        marker = _serializer().dumps(user_id)
+        window = app.config["READ_YOUR_WRITES_WINDOW"]
+        response.set_cookie(MARKER_COOKIE, marker, max_age=math.ceil(window), httponly=True, samesite="Lax")
+        response.headers[MARKER_HEADER] = marker
+        return response
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(WROTE_KEY, None)
@@ -0,0 +1,350 @@
+# foodloop_app/shelf_life.py
+"""Shelf-life estimation for new food types.
+
+The model behind gemini.py is slow (several seconds per Gemini call), so every
+estimate is cached in the ``shelf_life_estimate`` table keyed by normalized item name, city and month.
+The cache lives in the app database, so it survives restarts and is shared by
+every worker. Entries expire after ``SHELF_LIFE_CACHE_TTL`` and the least
+recently used ones are evicted once ``SHELF_LIFE_CACHE_MAX_ENTRIES`` is reached.
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, update
+
+from foodloop_app import db
+from . import gemini, metrics
+from .gemini import GeminiNotConfigured, GeminiRateLimited
+from .models import ShelfLifeEstimate
+from .upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+DATE_PATTERN = re.compile(
+    r"best_before:\s*(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}),\s*expires_at:\s*(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})"
+)
+BATCH_LINE_PATTERN = re.compile(r"^(\d+)\s*[:.)]\s*(.+)$")
+
+# Process-local counters, exposed through /retailers/shelf_life_cache/stats
+# Counter names of cache_stats() -> result label of the metrics counter
+STATS = {"hits": "hit", "misses": "miss", "evictions": "eviction"}
+
+
+class ShelfLifeError(Exception):
+    """Raised when no valid shelf-life estimate can be produced for an item."""
+
+    def __init__(self, message, status_code=422, retryable=True):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        # False when asking again cannot help (e.g. the model is not configured)
+        self.retryable = retryable
+
+
+def _count(name, amount=1):
+    if amount:
+        metrics.SHELF_LIFE_CACHE.inc(STATS[name], amount=amount)
+
+
+def cache_stats():
+    """Return the hit/miss/eviction counters of all workers (see metrics.py) and the cache size."""
+    totals = metrics.totals(metrics.SHELF_LIFE_CACHE)
+    stats = {name: totals.get((result,), 0) for name, result in STATS.items()}
+    stats["entries"] = db.session.query(func.count(ShelfLifeEstimate.id)).scalar()
+    return stats
+
+
+def normalize_name(name):
+    """Cache key for an item name: lowercase with whitespace collapsed."""
+    return " ".join((name or "").split()).lower()
+
+
+def _start_of_day(moment):
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def cached_shelf_life(item_name, city, now=None):
+    """Return cached ``(best_before, expires_at)`` for an item, or None on a miss."""
+    now = now or datetime.utcnow()
+    name_key = normalize_name(item_name)
+    city_key = normalize_name(city)
+
+    cached = _lookup(name_key, city_key, now)
+    if cached is None:
+        _count("misses")
+        logger.debug("Shelf-life cache miss for '%s' in '%s'", name_key, city_key)
+        return None
+
+    _count("hits")
+    logger.debug("Shelf-life cache hit for '%s' in '%s'", name_key, city_key)
+    today = _start_of_day(now)
+    return (
+        today + timedelta(days=cached.best_before_days),
+        today + timedelta(days=cached.expires_at_days),
+    )
+
+
+def generate_shelf_life(item_name, city, now=None):
+    """Ask the model for ``(best_before, expires_at)`` and cache the answer.
+
+    Does not consult the cache first; use :func:`estimate_shelf_life` for that.
+    """
+    now = now or datetime.utcnow()
+    best_before, expires_at = _ask_model(item_name, city, now)
+    _store(normalize_name(item_name), normalize_name(city), best_before, expires_at, now)
+    return best_before, expires_at
+
+
+def estimate_shelf_life(item_name, city, now=None):
+    """Return ``(best_before, expires_at)`` for a new food type.
+
+    Served from the cache when possible; otherwise the model is asked and the
+    answer is cached. Raises :class:`ShelfLifeError` if no valid dates can
+    be produced. The cache row is written in the caller's session, so it is
+    persisted by the caller's commit.
+    """
+    now = now or datetime.utcnow()
+    cached = cached_shelf_life(item_name, city, now)
+    if cached is not None:
+        return cached
+    return generate_shelf_life(item_name, city, now)
+
+
+def cached_shelf_life_many(item_names, city, now=None):
+    """Batch form of :func:`cached_shelf_life`: one query for all names.
+
+    Returns ``{item_name: (best_before, expires_at)}`` for the hits only.
+    """
+    now = now or datetime.utcnow()
+    hits, entries = _lookup_many(item_names, city, now)
+    _touch(entries, now)
+    return hits
+
+
+def estimate_shelf_life_many(item_names, city, now=None):
+    """Batch form of :func:`estimate_shelf_life`.
+
+    Returns ``{item_name: (best_before, expires_at) or ShelfLifeError}`` like
+    :func:`generate_shelf_life_many`, which it calls for the misses. The model
+    is asked before the hits are counted, so a slow call holds no write lock.
+    """
+    now = now or datetime.utcnow()
+    hits, entries = _lookup_many(item_names, city, now)
+    misses = [name for name in item_names if name not in hits]
+    if misses:
+        hits.update(generate_shelf_life_many(misses, city, now))
+    _touch(entries, now)
+    return hits
+
+
+def _lookup_many(item_names, city, now):
+    city_key = normalize_name(city)
+    keys = {normalize_name(name): name for name in item_names}
+    if not keys:
+        return {}, []
+
+    oldest_valid = now - current_app.config["SHELF_LIFE_CACHE_TTL"]
+    entries = ShelfLifeEstimate.query.filter(
+        ShelfLifeEstimate.name_key.in_(list(keys)),
+        ShelfLifeEstimate.city_key == city_key,
+        ShelfLifeEstimate.month == now.month,
+        ShelfLifeEstimate.created_at >= oldest_valid,
+    ).all()
+
+    today = _start_of_day(now)
+    hits = {
+        keys[entry.name_key]: (
+            today + timedelta(days=entry.best_before_days),
+            today + timedelta(days=entry.expires_at_days),
+        )
+        for entry in entries
+    }
+    _count("hits", len(hits))
+    _count("misses", len(keys) - len(hits))
+    return hits, entries
+
+
+def _touch(entries, now):
+    if entries:
+        db.session.execute(
+            update(ShelfLifeEstimate)
+            .where(ShelfLifeEstimate.id.in_([entry.id for entry in entries]))
+            .values(hits=ShelfLifeEstimate.hits + 1, last_used_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def generate_shelf_life_many(item_names, city, now=None):
+    """Batch form of :func:`generate_shelf_life`.
+
+    Items are sent to the model in chunks of ``SHELF_LIFE_BATCH_SIZE`` names per
+    prompt. Returns ``{item_name: (best_before, expires_at) or ShelfLifeError}``;
+    a failure that affects the whole call (model not configured, network error)
+    is raised instead.
+    """
+    now = now or datetime.utcnow()
+    city_key = normalize_name(city)
+    chunk_size = current_app.config["SHELF_LIFE_BATCH_SIZE"]
+    item_names = list(item_names)
+
+    results = {}
+    for start in range(0, len(item_names), chunk_size):
+        chunk = item_names[start:start + chunk_size]
+        for index, outcome in _ask_model_many(chunk, city, now).items():
+            results[chunk[index]] = outcome
+            if not isinstance(outcome, ShelfLifeError):
+                _store(normalize_name(chunk[index]), city_key, outcome[0], outcome[1], now, evict=False)
+    _evict()
+    return results
+
+
+def _lookup(name_key, city_key, now):
+    entry = ShelfLifeEstimate.query.filter_by(
+        name_key=name_key, city_key=city_key, month=now.month
+    ).first()
+    if entry is None:
+        return None
+    if entry.created_at and entry.created_at < now - current_app.config["SHELF_LIFE_CACHE_TTL"]:
+        return None
+
+    # Touch the entry for LRU ordering without a read-modify-write race on hits
+    db.session.execute(
+        update(ShelfLifeEstimate)
+        .where(ShelfLifeEstimate.id == entry.id)
+        .values(hits=ShelfLifeEstimate.hits + 1, last_used_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    return entry
+
+
+def _store(name_key, city_key, best_before, expires_at, now, evict=True):
+    today = _start_of_day(now)
+    best_before_days = (best_before - today).total_seconds() / 86400
+    expires_at_days = (expires_at - today).total_seconds() / 86400
+
+    # An existing row has outlived its TTL or was just stored by another
+    # worker, whose estimate is as good; either way it is refreshed in place
+    upsert(
+        ShelfLifeEstimate,
+        {
+            "name_key": name_key,
+            "city_key": city_key,
+            "month": now.month,
+            "best_before_days": best_before_days,
+            "expires_at_days": expires_at_days,
+            "hits": 0,
+            "created_at": now,
+            "last_used_at": now,
+        },
+        key=["name_key", "city_key", "month"],
+        update=lambda excluded: {
+            "best_before_days": excluded.best_before_days,
+            "expires_at_days": excluded.expires_at_days,
+            "hits": 0,
+            "created_at": excluded.created_at,
+            "last_used_at": excluded.last_used_at,
+        },
+    )
+
+    if evict:
+        _evict()
+
+
+def _evict():
+    max_entries = current_app.config["SHELF_LIFE_CACHE_MAX_ENTRIES"]
+    total = db.session.query(func.count(ShelfLifeEstimate.id)).scalar()
+    overflow = total - max_entries
+    if overflow <= 0:
+        return
+
+    stale_ids = [
+        row.id
+        for row in db.session.query(ShelfLifeEstimate.id)
+        .order_by(ShelfLifeEstimate.last_used_at.asc())
+        .limit(overflow)
+    ]
+    ShelfLifeEstimate.query.filter(ShelfLifeEstimate.id.in_(stale_ids)).delete(
+        synchronize_session=False
+    )
+    _count("evictions", len(stale_ids))
+
+
+def _call_model(prompt):
+    logger.debug("Gemini prompt: %s", prompt)
+    try:
+        result = gemini.generate(prompt)
+    except GeminiNotConfigured:
+        logger.error("Gemini API key not configured.")
+        raise ShelfLifeError("Gemini API key not configured", 500, retryable=False)
+    except GeminiRateLimited as e:
+        logger.warning("Gemini call rate limited: %s", e)
+        raise ShelfLifeError(str(e), 503)
+    logger.debug("Raw Gemini response text: %s", result)
+    return result
+
+
+def _parse_dates(result, now):
+    """Turn one model answer into validated ``(best_before, expires_at)``."""
+    seven_days_from_today_date = now.date() + timedelta(days=7)
+
+    if result == "ERROR: Unable to generate valid dates":
+        logger.warning("Gemini returned error for date generation.")
+        raise ShelfLifeError("Gemini failed to generate valid dates based on rules")
+
+    match = DATE_PATTERN.search(result)
+    if not match:
+        logger.error("Gemini response format mismatch, got: %s", result)
+        raise ShelfLifeError(
+            f"Invalid Gemini response format. Expected 'best_before:YYYY-MM-DDTHH:MM:SS, expires_at:YYYY-MM-DDTHH:MM:SS', got: {result}"
+        )
+
+    try:
+        best_before = datetime.fromisoformat(match.group(1))
+        expires_at = datetime.fromisoformat(match.group(2))
+    except ValueError as e:
+        logger.error("Date parsing error from Gemini output: %s", result, exc_info=True)
+        raise ShelfLifeError(f"Error parsing dates from Gemini: {str(e)}", 500)
+
+    if best_before.date() < seven_days_from_today_date or expires_at < best_before + timedelta(days=14):
+        logger.warning(
+            "Generated dates are invalid based on rules. best_before: %s, expires_at: %s",
+            best_before, expires_at,
+        )
+        raise ShelfLifeError(
+            "Generated dates are invalid (best before must be at least 7 days from today, and expiry at least 14 days after best before)"
+        )
+
+    return best_before, expires_at
+
+
+def _ask_model(item_name, city, now):
+    current_utc_date_str = now.date().isoformat()
+    prompt = f"Given a food item '{item_name}', the current date is {current_utc_date_str}, and the location is '{city}'. Considering typical storage conditions, temperature, and the current season in this region, provide an estimated 'best_before' and 'expires_at' date in the exact format 'best_before:YYYY-MM-DDTHH:MM:SS, expires_at:YYYY-MM-DDTHH:MM:SS'. Use 12:00:00 for the time component unless a specific time is highly relevant. Do not include any text outside of the specified format. If you cannot generate reasonable estimated dates, return 'ERROR: Unable to generate valid dates'."
+    return _parse_dates(_call_model(prompt), now)
+
+
+def _ask_model_many(item_names, city, now):
+    """One prompt for several items. Returns ``{index: dates or ShelfLifeError}``."""
+    current_utc_date_str = now.date().isoformat()
+    numbered = "\n".join(f"{number}. {name}" for number, name in enumerate(item_names, start=1))
+    prompt = f"Given the following numbered food items, the current date is {current_utc_date_str}, and the location is '{city}'. Considering typical storage conditions, temperature, and the current season in this region, provide an estimated 'best_before' and 'expires_at' date for each item. Reply with exactly one line per item in the exact format '<number>: best_before:YYYY-MM-DDTHH:MM:SS, expires_at:YYYY-MM-DDTHH:MM:SS'. Use 12:00:00 for the time component unless a specific time is highly relevant. If you cannot generate reasonable estimated dates for an item, reply '<number>: ERROR: Unable to generate valid dates' for it. Do not include any other text.\nItems:\n{numbered}"
+    result = _call_model(prompt)
+
+    answers = {}
+    for line in result.splitlines():
+        match = BATCH_LINE_PATTERN.match(line.strip())
+        if match:
+            answers[int(match.group(1)) - 1] = match.group(2).strip()
+
+    outcome = {}
+    for index in range(len(item_names)):
+        if index not in answers:
+            outcome[index] = ShelfLifeError("Gemini response did not include this item")
+            continue
+        try:
+            outcome[index] = _parse_dates(answers[index], now)
+        except ShelfLifeError as e:
+            outcome[index] = e
+    return outcome
@@ -0,0 +1,109 @@
+# foodloop_app/stock.py
+"""Per-retailer stock changes as single atomic statements.
+
+Quantity, dates and status live on each retailer's ``InventoryItem``, and
+``Food`` is only the shared catalog entry for a name. Stock is changed with
+``UPDATE ... SET quantity = quantity +/- :q`` instead of read-modify-write, so
+concurrent sells and restocks neither lose updates nor oversell, and writes to
+different retailers' rows never wait on each other.
+
+An item is one lot with one set of dates. Restocking an expired one, or one
+whose dates could not be estimated, replaces it with a fresh lot rather than
+adding sellable stock under dead dates.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, or_, update
+
+from foodloop_app import db
+from . import enrichment
+from .models import Food, InventoryItem
+from .upsert import upsert
+
+# Statuses of a lot that can no longer be sold; restocking it starts a fresh lot
+DEAD_STATUSES = ("Expired", enrichment.FAILED)
+
+ADDED = "added"
+RESTARTED = "restarted"
+
+
+def catalog_food(name):
+    """The catalog Food named ``name`` (case-insensitive), created on first use."""
+    food = Food.query.filter(Food.name_lower == name.lower()).first()
+    if food is not None:
+        return food
+    # Skipped if another retailer added the same name concurrently; use theirs
+    upsert(Food, {"name": name, "name_lower": name.lower(), "created_at": datetime.utcnow()})
+    return Food.query.filter(Food.name_lower == name.lower()).one()
+
+
+def is_dead(item, now=None):
+    """Whether ``item``'s lot can no longer be sold: expired, without dates for good, or past its expiry."""
+    now = now or datetime.utcnow()
+    return item.status in DEAD_STATUSES or (item.expires_at is not None and item.expires_at < now)
+
+
+def _dead(now):
+    return or_(
+        InventoryItem.status.in_(DEAD_STATUSES),
+        and_(InventoryItem.expires_at.is_not(None), InventoryItem.expires_at < now),
+    )
+
+
+def restock(item_id, quantity, dates=None, now=None):
+    """Add ``quantity`` to an item's stock, or start a fresh lot of it if the item is dead (see :func:`is_dead`).
+
+    A fresh lot replaces the dead stock with ``quantity`` and ``dates``
+    (``(best_before, expires_at)``), or waits for shelf-life enrichment without
+    them. Release the dead lot's holds first. Returns ``ADDED``, ``RESTARTED``
+    or None if the item does not exist.
+    """
+    now = now or datetime.utcnow()
+    best_before, expires_at = dates or (None, None)
+    # A concurrent restock can revive the lot between the two statements; then add to it
+    for _ in range(2):
+        result = db.session.execute(
+            update(InventoryItem)
+            .where(InventoryItem.id == item_id, ~_dead(now))
+            .values(quantity=InventoryItem.quantity + quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            return ADDED
+        result = db.session.execute(
+            update(InventoryItem)
+            .where(InventoryItem.id == item_id, _dead(now))
+            .values(
+                quantity=quantity,
+                best_before=best_before,
+                expires_at=expires_at,
+                status=enrichment.READY if dates else enrichment.PENDING,
+                enrichment_attempts=0,
+                enrichment_error=None,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            return RESTARTED
+    return None
+
+
+def take_stock(item_id, user_id, quantity, now=None):
+    """Remove ``quantity`` from ``user_id``'s unexpired item if that much is in stock and not held.
+
+    Returns False, changing nothing, if the item is missing, expired or short.
+    Quantity held for NGO requests (see reservations.py) cannot be taken.
+    """
+    now = now or datetime.utcnow()
+    result = db.session.execute(
+        update(InventoryItem)
+        .where(
+            InventoryItem.id == item_id,
+            InventoryItem.user_id == user_id,
+            InventoryItem.quantity - InventoryItem.held_quantity >= quantity,
+            or_(InventoryItem.expires_at.is_(None), InventoryItem.expires_at >= now),
+        )
+        .values(quantity=InventoryItem.quantity - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
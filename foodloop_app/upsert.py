@@ -0,0 +1,46 @@
+# foodloop_app/upsert.py
+"""Race-safe get-or-create as one ``INSERT ... ON CONFLICT`` statement.
+
+Rows that several workers may create at once (catalog foods, feed versions,
+rollup buckets, cache entries) are written with :func:`upsert`. The database
+settles a clash with an existing row itself, by skipping the new row or
+updating the old one, so callers never catch ``IntegrityError``.
+
+This replaces ``begin_nested()`` plus ``except IntegrityError``. Besides a
+savepoint per row, that pattern broke transactions on SQLite: pysqlite only
+opens a transaction before DML, so a SAVEPOINT issued first became the
+outermost transaction and releasing it committed. A later rollback, such as a
+failed intake batch, then kept the rows written inside it.
+
+SQLite (3.24+) and PostgreSQL both support the clause.
+"""
+from sqlalchemy.dialects import postgresql, sqlite
+
+from foodloop_app import db
+
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def upsert(model, rows, key=None, update=None, where=None, connection=None):
+    """INSERT ``rows`` (a dict or a list of them) into ``model``'s table, skipping any that clash.
+
+    With ``update``, a row clashing on the ``key`` columns updates the existing
+    one instead: ``update(excluded)`` returns the values to set, ``excluded``
+    being the row that was not inserted, and ``where(excluded)`` optionally
+    limits which existing rows change. Runs on ``connection`` (e.g. inside a
+    flush) or else the session, and returns the result.
+    """
+    table = getattr(model, "__table__", model)
+    dialect = (connection if connection is not None else db.engine).dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f"upsert needs SQLite or PostgreSQL, not {dialect}")
+    statement = _INSERTS[dialect](table)
+    if update is None:
+        statement = statement.on_conflict_do_nothing(index_elements=key)
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=key,
+            set_=update(statement.excluded),
+            where=where(statement.excluded) if where is not None else None,
+        )
+    return (connection if connection is not None else db.session).execute(statement, rows)
@@ -0,0 +1,56 @@
+"""Production server settings: ``gunicorn -c gunicorn.conf.py``.
+
+Each setting can be overridden from the environment. Workers are processes
+with ``GUNICORN_THREADS`` threads each; a waiting ``/events`` long-poll or
+stream occupies one thread, so size threads for the expected number of
+open connections rather than for CPU. Run ``flask --app run init-db`` once
+before starting the server; workers do no schema work on start.
+"""
+import multiprocessing
+import os
+import signal
+
+wsgi_app = "wsgi:app"
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '3000')}")
+
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Import and build the app once in the master; workers fork from it
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# gthread workers heartbeat from their main loop, so long-polls do not count against this
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Recycle workers now and then to bound per-process cache growth
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None  # empty turns it off
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_fork(server, worker):
+    # Database connections opened in the master must not be shared with workers
+    from foodloop_app import db
+    from wsgi import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    # On SIGTERM, end long-polls and event streams before gunicorn waits for requests in flight
+    from foodloop_app.lifecycle import begin_shutdown
+
+    stop_worker = signal.getsignal(signal.SIGTERM)
+
+    def on_sigterm(signum, frame):
+        begin_shutdown()
+        stop_worker(signum, frame)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
@@ -1,20 +1,13 @@
-from foodloop_app import create_app, db
-from foodloop_app.models import Role  # Make sure all models are imported somewhere so SQLAlchemy registers them
+import logging
+import os
 
-app = create_app()
+from foodloop_app import create_app
 
-def init_roles():
-    with app.app_context():
-        db.create_all()  # 🔧 Will only create tables that don't exist
-        # Create roles if they don't exist
-        roles = ['Retailer', 'Ngo', 'Farmer', 'Admin']
-        for role_name in roles:
-            if not Role.query.filter_by(name=role_name).first():
-                role = Role(name=role_name)
-                db.session.add(role)
-        db.session.commit()
-        print("Database initialized with roles.")
+# Development server. Create the schema and roles once with
+# `flask --app run init-db`; in production serve with `gunicorn -c gunicorn.conf.py`.
+# LOG_LEVEL=DEBUG turns on the per-request debug lines.
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+app = create_app()
 
 if __name__ == "__main__":
-    init_roles()
     app.run(debug=True, port=3000)
@@ -0,0 +1,98 @@
+"""Fixtures: the app on a scratch SQLite database, offline model, and clients signed in by role."""
+from collections import OrderedDict
+
+import pytest
+
+from foodloop_app import (
+    background, create_app, db, enrichment, events, feed_cache, forecasting, gemini, identity, insights,
+)
+from foodloop_app.migrations import upgrade
+from foodloop_app.models import ROLES, Role
+
+PASSWORD = "test-password"
+
+
+def build_app(path, monkeypatch, replica_path=None, **env):
+    """An app on the SQLite file ``path`` with its schema and roles; no model calls leave the process.
+
+    With ``replica_path``, a second SQLite file with the schema only is its read replica.
+    ``env`` overrides environment variables, e.g. the password hashing settings.
+    """
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{path}")
+    monkeypatch.setenv("GEMINI_BACKEND", "stub")
+    monkeypatch.setenv("PASSWORD_HASH_WORKERS", "0")  # hash inline, no process pool
+    monkeypatch.setenv("PASSWORD_HASH_SCHEME", "pbkdf2_sha256")
+    monkeypatch.setenv("PASSWORD_PBKDF2_ROUNDS", "1000")
+    monkeypatch.delenv("METRICS_DIR", raising=False)
+    if replica_path is None:
+        monkeypatch.delenv("DATABASE_REPLICA_URL", raising=False)
+    else:
+        monkeypatch.setenv("DATABASE_REPLICA_URL", f"sqlite:///{replica_path}")
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        EVENTS_BACKEND="memory",
+        EXPIRY_SWEEP_INTERVAL=0,
+        ENRICHMENT_RETRY_BACKOFF=0.01,
+        GEMINI_CALLS_PER_SECOND=1000.0,
+        GEMINI_BURST=1000,
+    )
+    with app.app_context():
+        for engine in db.engines.values():
+            upgrade(engine)
+        existing = {name for (name,) in db.session.query(Role.name)}  # another app may share the database
+        db.session.add_all(Role(name=name) for name in ROLES if name not in existing)
+        db.session.commit()
+    return app
+
+
+@pytest.fixture(autouse=True)
+def process_state(monkeypatch):
+    """Fresh process-wide caches per test; they are keyed by ids that repeat across scratch databases."""
+    monkeypatch.setattr(feed_cache, "_feeds", OrderedDict())
+    monkeypatch.setattr(identity, "_identities", OrderedDict())
+    monkeypatch.setattr(insights, "_entries", OrderedDict())
+    monkeypatch.setattr(insights, "_latest", {})
+    monkeypatch.setattr(insights, "_in_flight", set())
+    monkeypatch.setattr(insights, "_failures", OrderedDict())
+    monkeypatch.setattr(enrichment, "_in_flight", set())
+    monkeypatch.setattr(forecasting, "_in_flight", set())
+    monkeypatch.setattr(events, "_backend", None)
+    monkeypatch.setattr(gemini, "_bucket", None)
+    yield
+    background.shutdown()  # also stops schedules bound to this test's app
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    app = build_app(tmp_path / "test.sqlite3", monkeypatch)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def sign_up(app):
+    """``sign_up(email, role, pincode=...)``: create a user and return the Authorization header of their login."""
+
+    def sign_up(email, role, pincode="560001", city="Bangalore"):
+        client = app.test_client()  # its own, so the login session cookie does not follow the test's requests
+        response = client.post("/sign-up", json={
+            "email": email, "password": PASSWORD, "city": city, "pincode": pincode, "contact": "9999999999",
+            "role": role,
+        })
+        assert response.status_code == 201, response.get_json()
+        response = client.post("/auth-login", json={"email": email, "password": PASSWORD})
+        assert response.status_code == 200, response.get_json()
+        return {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+    return sign_up
@@ -0,0 +1,73 @@
+"""Daily demand rollup kept by the request mapper events and status updates (demand.py)."""
+from datetime import datetime, timedelta
+
+from benchmarks import holds
+from foodloop_app import db, demand, reservations
+from foodloop_app.models import DailyDemand, FoodRequest
+
+
+def rollup(app):
+    """``{status: (quantity, requests)}`` of today's buckets."""
+    with app.app_context():
+        rows = db.session.query(DailyDemand.status, DailyDemand.quantity, DailyDemand.requests).all()
+    return {status: (quantity, requests) for status, quantity, requests in rows}
+
+
+def assert_matches_rebuild(app):
+    before = rollup(app)
+    with app.app_context():
+        demand.rebuild(db.session.connection())
+        db.session.commit()
+    assert rollup(app) == before
+
+
+def test_rollup_follows_request_status_changes(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    ngo = sign_up("ngo@example.com", "Ngo")
+    item_id = holds.listed_item(app, retailer, 20)
+    request_ids = []
+    for quantity in (1, 2, 3, 4):
+        response = client.post("/ngo/request", json={"inventory_item_id": item_id, "quantity": quantity}, headers=ngo)
+        assert response.status_code == 201, response.get_json()
+        request_ids.append(response.get_json()["id"])
+    assert rollup(app) == {reservations.HOLDING: (10, 4)}
+
+    assert client.post(f"/retailers/requests/{request_ids[0]}/approve", headers=retailer).status_code == 200
+    assert client.post(f"/retailers/requests/{request_ids[1]}/ignore", headers=retailer).status_code == 200
+    with app.app_context():
+        db.session.get(FoodRequest, request_ids[3]).hold_expires_at = datetime.utcnow() - timedelta(minutes=1)
+        db.session.commit()
+        assert reservations.expire_holds() == 1
+        db.session.commit()
+
+    assert rollup(app) == {
+        reservations.HOLDING: (3, 1),
+        reservations.ALLOCATED: (1, 1),
+        reservations.IGNORED: (2, 1),
+        reservations.EXPIRED: (4, 1),
+    }
+    assert_matches_rebuild(app)
+
+
+def test_rollup_follows_orm_edits_and_deletes(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    ngo = sign_up("ngo@example.com", "Ngo")
+    item_id = holds.listed_item(app, retailer, 20)
+    request_ids = []
+    for quantity in (2, 5):
+        response = client.post("/ngo/request", json={"inventory_item_id": item_id, "quantity": quantity}, headers=ngo)
+        assert response.status_code == 201, response.get_json()
+        request_ids.append(response.get_json()["id"])
+
+    with app.app_context():
+        food_request = db.session.get(FoodRequest, request_ids[0])
+        food_request.quantity, food_request.status = 3, reservations.IGNORED
+        db.session.commit()
+    assert rollup(app) == {reservations.HOLDING: (5, 1), reservations.IGNORED: (3, 1)}
+
+    with app.app_context():
+        db.session.delete(db.session.get(FoodRequest, request_ids[1]))
+        db.session.commit()
+    # The emptied bucket is dropped, not left at zero
+    assert rollup(app) == {reservations.IGNORED: (3, 1)}
+    assert_matches_rebuild(app)
@@ -0,0 +1,105 @@
+"""Background shelf-life enrichment of items added without cached dates (enrichment.py)."""
+import time
+
+from foodloop_app import enrichment
+from foodloop_app.shelf_life import ShelfLifeError
+
+
+def wait_for_status(client, url, headers, timeout=5):
+    """Poll the enrichment URL until the item leaves ``PendingDates``."""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        if not body["pending"] or time.monotonic() > deadline:
+            return body
+        time.sleep(0.02)
+
+
+def add_item(client, headers, name):
+    return client.post("/retailers/add_item", json={"name": name, "quantity": 5}, headers=headers)
+
+
+def test_add_item_without_cached_dates_is_accepted_pending(client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+
+    response = add_item(client, retailer, "Dragon fruit")
+
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["status"] == enrichment.PENDING
+    assert body["best_before"] is None and body["expires_at"] is None
+    assert response.headers["Location"] == body["enrichment_url"] == f"/retailers/food/{body['food_id']}/enrichment"
+
+
+def test_worker_fills_in_dates(client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    url = add_item(client, retailer, "Jackfruit").get_json()["enrichment_url"]
+
+    body = wait_for_status(client, url, retailer)
+
+    assert body["status"] == enrichment.READY
+    assert body["best_before"] and body["expires_at"]
+    assert body["best_before"] < body["expires_at"]
+    assert body["attempts"] == 1
+    assert body["error"] is None
+    # Cached now, so the next retailer adding it gets dates at once
+    other = sign_up("other-shop@example.com", "Retailer")
+    response = add_item(client, other, "Jackfruit")
+    assert response.status_code == 201
+    assert response.get_json()["status"] == enrichment.READY
+
+
+def test_retries_exhaust_into_failed(app, client, sign_up, monkeypatch):
+    calls = []
+
+    def fail(names, city):
+        calls.append(list(names))
+        raise ShelfLifeError("model unavailable")
+
+    monkeypatch.setattr(enrichment, "generate_shelf_life_many", fail)
+    retailer = sign_up("shop@example.com", "Retailer")
+    url = add_item(client, retailer, "Mangosteen").get_json()["enrichment_url"]
+
+    body = wait_for_status(client, url, retailer)
+
+    assert body["status"] == enrichment.FAILED
+    assert body["attempts"] == app.config["ENRICHMENT_MAX_ATTEMPTS"]
+    assert body["error"] == "model unavailable"
+    assert body["best_before"] is None
+    assert len(calls) == app.config["ENRICHMENT_MAX_ATTEMPTS"]
+
+
+def test_non_retryable_error_fails_at_once(client, sign_up, monkeypatch):
+    def fail(names, city):
+        raise ShelfLifeError("model not configured", retryable=False)
+
+    monkeypatch.setattr(enrichment, "generate_shelf_life_many", fail)
+    retailer = sign_up("shop@example.com", "Retailer")
+    url = add_item(client, retailer, "Rambutan").get_json()["enrichment_url"]
+
+    body = wait_for_status(client, url, retailer)
+
+    assert body["status"] == enrichment.FAILED
+    assert body["attempts"] == 1
+
+
+def test_rate_limited_request_answers_503(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    app.config.update(
+        SHELF_LIFE_ASYNC=False,
+        GEMINI_CALLS_PER_SECOND=0.001,
+        GEMINI_BURST=1,
+        GEMINI_REQUEST_RATE_LIMIT_TIMEOUT=0,
+    )
+    assert add_item(client, retailer, "Jackfruit").status_code == 201  # Takes the only slot
+
+    started = time.monotonic()
+    response = add_item(client, retailer, "Durian")
+    batch = client.post("/retailers/add_items", json=[{"name": "Rambutan", "quantity": 1}], headers=retailer)
+
+    assert time.monotonic() - started < 5  # Not GEMINI_RATE_LIMIT_TIMEOUT
+    assert response.status_code == 503
+    assert response.get_json()["error"] == "Too many model calls; try again shortly"
+    assert batch.status_code == 503
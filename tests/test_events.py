@@ -0,0 +1,67 @@
+"""The event_log tail of the database event backend (events.py)."""
+import json
+import time
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+from foodloop_app import db, events
+from foodloop_app.models import EventLog
+
+
+@pytest.fixture
+def backend(app):
+    app.config.update(EVENTS_BACKEND="database", EVENTS_POLL_INTERVAL=3600, EVENTS_GAP_WAIT=0.2)
+    with app.app_context():
+        yield events.backend()
+
+
+def write(*ids):
+    """Commit event_log rows with these ids, as workers whose transactions finish in this order would."""
+    with db.engine.begin() as conn:
+        conn.execute(insert(EventLog), [
+            {"id": id, "channel": "user:1", "type": "test", "payload": json.dumps({"n": id}),
+             "created_at": datetime.utcnow()}
+            for id in ids
+        ])
+
+
+def read_ids(backend, since):
+    messages, cursor, reset = backend.read({"user:1"}, since, 0, 100)
+    assert not reset
+    return [message.id for message in messages], cursor
+
+
+def test_lower_id_committed_late_is_not_skipped(backend):
+    write(1)
+    assert read_ids(backend, 0) == ([1], 1)
+
+    write(3)  # id 2 is still being inserted by another worker
+    backend.poll()
+    assert read_ids(backend, 1) == ([], 1)
+
+    write(2)
+    backend.poll()
+    assert read_ids(backend, 1) == ([2, 3], 3)
+
+
+def test_id_that_never_commits_holds_back_for_gap_wait_only(backend):
+    write(1)
+    backend.latest()
+    write(3)  # id 2 was rolled back
+    backend.poll()
+    assert backend.latest() == 1
+
+    time.sleep(0.25)
+    backend.poll()
+    assert read_ids(backend, 1) == ([3], 3)
+
+
+def test_published_events_are_delivered(app, backend):
+    events.backend().latest()
+    with app.test_request_context():
+        events.publish("user:1", "test", {"n": 1})
+        db.session.commit()
+    messages, _, _ = backend.read({"user:1"}, 0, 0, 100)
+    assert [(message.type, message.data) for message in messages] == [("test", {"n": 1})]
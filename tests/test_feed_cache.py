@@ -0,0 +1,72 @@
+"""ETags of the NGO listing feed and their invalidation (feed_cache.py)."""
+from benchmarks import holds
+
+FEED = "/ngo/filtered_food"
+
+
+def list_item(client, retailer, name, quantity=5):
+    response = client.post("/retailers/add_item", json={"name": name, "quantity": quantity}, headers=retailer)
+    assert response.status_code == 201, response.get_json()
+    item_id = response.get_json()["id"]
+    response = client.post(f"/retailers/inventory/{item_id}/list", headers=retailer)
+    assert response.status_code == 200, response.get_json()
+    return item_id
+
+
+def get_feed(client, ngo, etag=None):
+    headers = dict(ngo, **({"If-None-Match": f'"{etag}"'} if etag else {}))
+    return client.get(FEED, headers=headers)
+
+
+def test_unchanged_feed_answers_304(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    ngo = sign_up("ngo@example.com", "Ngo")
+    item_id = holds.listed_item(app, retailer, 10)
+
+    first = get_feed(client, ngo)
+    assert first.status_code == 200
+    etag = first.get_etag()[0]
+    assert [item["id"] for item in first.get_json()] == [item_id]
+
+    again = get_feed(client, ngo, etag)
+    assert again.status_code == 304
+    assert again.get_etag()[0] == etag
+    # Without If-None-Match, the cached body under the same ETag
+    cached = get_feed(client, ngo)
+    assert cached.get_etag()[0] == etag
+    assert cached.get_json() == first.get_json()
+    # Other arguments are another feed
+    assert client.get(f"{FEED}?fields=id", headers=dict(ngo, **{"If-None-Match": f'"{etag}"'})).status_code == 200
+
+
+def test_new_request_changes_the_feed(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    ngo = sign_up("ngo@example.com", "Ngo")
+    item_id = holds.listed_item(app, retailer, 10)
+    etag = get_feed(client, ngo).get_etag()[0]
+
+    response = client.post("/ngo/request", json={"inventory_item_id": item_id, "quantity": 4}, headers=ngo)
+    assert response.status_code == 201, response.get_json()
+
+    response = get_feed(client, ngo, etag)
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+    assert response.get_json()[0]["quantity"] == 6
+
+
+def test_listing_changes_only_feeds_covering_its_pincode(app, client, sign_up):
+    app.config["SHELF_LIFE_ASYNC"] = False
+    retailer = sign_up("shop@example.com", "Retailer")
+    far_retailer = sign_up("far@example.com", "Retailer", pincode="110001", city="Delhi")
+    ngo = sign_up("ngo@example.com", "Ngo")
+    first_id = list_item(client, retailer, "Rice")
+    etag = get_feed(client, ngo).get_etag()[0]
+
+    list_item(client, far_retailer, "Bread")
+    assert get_feed(client, ngo, etag).status_code == 304
+
+    second_id = list_item(client, retailer, "Milk")
+    response = get_feed(client, ngo, etag)
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+    assert sorted(item["id"] for item in response.get_json()) == sorted([first_id, second_id])
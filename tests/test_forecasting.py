@@ -0,0 +1,97 @@
+"""Farmer demand forecasts (forecasting.py and /farmer/demand_forecast)."""
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from foodloop_app import background, db, forecasting
+from foodloop_app.models import DailyDemand, DemandForecast, Food, ForecastRun
+
+
+def add_history(pincode, days=28):
+    food = Food(name="Rice", name_lower="rice")
+    db.session.add(food)
+    db.session.flush()
+    today = datetime.utcnow().date()
+    db.session.add_all(
+        DailyDemand(pincode=pincode, day=today - timedelta(days=day), food_id=food.id, status="Approved",
+                    quantity=10 + day % 7, requests=1)
+        for day in range(1, days + 1)
+    )
+    db.session.commit()
+
+
+def settle(timeout=5):
+    deadline = time.monotonic() + timeout
+    while forecasting._in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not forecasting._in_flight
+
+
+def test_get_serves_stored_rows_and_refreshes_in_background(app, client, sign_up):
+    farmer = sign_up("farmer@example.com", "Farmer")
+    with app.app_context():
+        add_history("560001")
+
+    body = client.get("/farmer/demand_forecast", headers=farmer).get_json()
+    assert body["status"] == "pending" and body["forecasts"] == []
+    settle()
+
+    body = client.get("/farmer/demand_forecast", headers=farmer).get_json()
+    assert body["status"] == "fresh"
+    assert [entry["item_name"] for entry in body["forecasts"]] == ["Rice"]
+    assert len(body["forecasts"][0]["weeks"]) == 4
+
+
+def test_pincode_without_demand_is_not_recomputed_per_request(app, client, sign_up, monkeypatch):
+    farmer = sign_up("farmer@example.com", "Farmer")
+    client.get("/farmer/demand_forecast", headers=farmer)
+    settle()
+    with app.app_context():
+        assert db.session.get(ForecastRun, "560001").series == 0
+
+    scheduled = []
+    monkeypatch.setattr(background, "submit", lambda *args: scheduled.append(args))
+    for _ in range(3):
+        body = client.get("/farmer/demand_forecast", headers=farmer).get_json()
+        assert body["status"] == "fresh" and body["forecasts"] == []
+    assert scheduled == []
+
+
+def test_concurrent_refreshes_do_not_duplicate_rows(app):
+    with app.app_context():
+        add_history("560001")
+    errors = []
+
+    def refresh():
+        with app.app_context():
+            try:
+                forecasting.refresh(["560001"])
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with app.app_context():
+        weeks = [week for (week,) in db.session.query(DemandForecast.week_start)]
+        assert len(weeks) == len(set(weeks)) == app.config["FORECAST_HORIZON_WEEKS"]
+        assert db.session.get(ForecastRun, "560001").series == 1
+
+
+def test_full_refresh_records_every_pincode(app):
+    with app.app_context():
+        add_history("560001")
+        db.session.add(ForecastRun(pincode="560099", computed_at=datetime(2020, 1, 1), series=3))
+        db.session.commit()
+
+        assert forecasting.refresh(today=date.today()) == 1
+        db.session.commit()
+
+        runs = {run.pincode: run.series for run in ForecastRun.query}
+        assert runs == {"560001": 1, "560099": 0}
+        assert not forecasting.is_stale(db.session.get(ForecastRun, "560099"))
@@ -0,0 +1,74 @@
+"""Radius search over pincode centroids (geo.py) and its limits on the NGO feed."""
+import pytest
+
+from foodloop_app import geo
+
+# About 3 km, 16 km and 1,700 km from 560001
+CENTROIDS = {
+    "560001": (12.9716, 77.5946),
+    "560002": (12.9716, 77.6222),
+    "560100": (12.8452, 77.6602),
+    "110001": (28.6328, 77.2197),
+}
+
+
+@pytest.fixture
+def centroids(app):
+    with app.app_context():
+        geo.load_centroids(CENTROIDS)
+
+
+@pytest.mark.parametrize("radius_km, expected", [
+    (0, {"560001"}),
+    (5, {"560001", "560002"}),
+    (20, {"560001", "560002", "560100"}),
+])
+def test_nearby_pincodes_within_radius(app, centroids, radius_km, expected):
+    with app.app_context():
+        distances = geo.nearby_pincodes("560001", radius_km)
+
+    assert set(distances) == expected
+    assert distances["560001"] == 0
+    assert all(0 <= metres <= radius_km * 1000 for metres in distances.values())
+
+
+def test_unknown_pincode_matches_itself(app, centroids):
+    with app.app_context():
+        assert geo.nearby_pincodes("999999", 50) == {"999999": 0}
+
+
+@pytest.mark.parametrize("radius_km", ["abc", "-1", "100.5"])
+def test_feed_rejects_radius_out_of_range(client, sign_up, radius_km):
+    ngo = sign_up("ngo@example.com", "Ngo")
+
+    response = client.get(f"/ngo/filtered_food?radius_km={radius_km}", headers=ngo)
+
+    assert response.status_code == 422
+    assert "radius_km" in response.get_json()["error"]
+
+
+def test_feed_lists_items_in_radius_nearest_first(app, client, sign_up, centroids):
+    app.config["SHELF_LIFE_ASYNC"] = False
+    ngo = sign_up("ngo@example.com", "Ngo")
+    listed = {}
+    for pincode in ("560100", "560002", "110001", "560001"):
+        retailer = sign_up(f"shop-{pincode}@example.com", "Retailer", pincode=pincode)
+        response = client.post("/retailers/add_item", json={"name": "Rice", "quantity": 5}, headers=retailer)
+        assert response.status_code == 201, response.get_json()
+        listed[pincode] = response.get_json()["id"]
+        assert client.post(f"/retailers/inventory/{listed[pincode]}/list", headers=retailer).status_code == 200
+
+    def feed(query):
+        response = client.get(f"/ngo/filtered_food?{query}", headers=ngo)
+        assert response.status_code == 200, response.get_json()
+        return [(item["id"], item["distance_km"]) for item in response.get_json()]
+
+    near = feed("radius_km=5")
+    assert [item_id for item_id, _ in near] == [listed["560001"], listed["560002"]]
+    assert near[0][1] == 0 and 2 < near[1][1] < 4
+
+    wide = feed("radius_km=100")
+    assert [item_id for item_id, _ in wide] == [listed["560001"], listed["560002"], listed["560100"]]
+
+    # Around another pincode than the NGO's own
+    assert [item_id for item_id, _ in feed("pincode=110001&radius_km=100")] == [listed["110001"]]
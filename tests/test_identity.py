@@ -0,0 +1,52 @@
+"""Cached token identities (identity.py) and their eviction across workers."""
+from datetime import datetime
+
+from flask_jwt_extended import decode_token
+from sqlalchemy import update
+
+from foodloop_app import db, identity
+from foodloop_app.models import Role, User
+
+
+def test_sync_evicts_users_changed_by_another_worker(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    assert client.get("/retailers/inventory", headers=retailer).status_code == 200  # Cached now
+
+    with app.app_context():
+        identity.sync()
+        # What another worker's deactivation writes; its eviction stays in that worker
+        db.session.execute(
+            update(User).where(User.email == "shop@example.com").values(active=False, changed_at=datetime.utcnow())
+        )
+        db.session.commit()
+    assert client.get("/retailers/inventory", headers=retailer).status_code == 200  # Still the cached snapshot
+
+    with app.app_context():
+        identity.sync()
+    response = client.get("/retailers/inventory", headers=retailer)
+    assert response.status_code == 401
+    assert response.get_json() == {"error": "User not found or inactive"}
+
+
+def test_updates_stamp_changed_at(app, sign_up):
+    sign_up("shop@example.com", "Retailer")
+    with app.app_context():
+        user = User.query.filter_by(email="shop@example.com").one()
+        user.roles.append(Role.query.filter_by(name="Ngo").one())
+        db.session.commit()
+        stamped = user.changed_at
+        assert stamped is not None
+
+        # Re-read within the overlap window, the same change is not evicted again
+        identity.sync()
+        identity.remember(user)
+        identity.sync()
+        assert identity.lookup(user.fs_uniquifier) is not None
+        assert len(identity._identities) == 1
+
+
+def test_access_tokens_carry_no_roles(app, sign_up):
+    headers = sign_up("shop@example.com", "Retailer")
+    with app.app_context():
+        claims = decode_token(headers["Authorization"].removeprefix("Bearer "))
+    assert "roles" not in claims
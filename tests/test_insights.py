@@ -0,0 +1,69 @@
+"""Cached demand insight text (insights.py)."""
+import time
+
+import pytest
+
+from foodloop_app import background, gemini, insights
+
+
+def settle(timeout=5):
+    """Wait for background insight generation to finish."""
+    deadline = time.monotonic() + timeout
+    while insights._in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not insights._in_flight
+
+
+def test_generated_text_is_fresh(app, monkeypatch):
+    monkeypatch.setattr(gemini, "generate", lambda prompt: f"Insight for {prompt}")
+    with app.app_context():
+        assert insights.insight_for("560001", "rice 10kg", "rice") == (insights.PENDING_TEXT, "pending")
+        settle()
+        assert insights.insight_for("560001", "rice 10kg", "rice") == ("Insight for rice", "fresh")
+
+
+def test_failure_is_an_error_not_cached_text(app, monkeypatch):
+    def fail(prompt):
+        raise RuntimeError("quota exceeded")
+
+    monkeypatch.setattr(gemini, "generate", fail)
+    with app.app_context():
+        insights.insight_for("560001", "rice 10kg", "rice")
+        settle()
+        assert insights.insight_for("560001", "rice 10kg", "rice") == (insights.FAILED_TEXT, "error")
+        assert not insights._in_flight  # not retried before INSIGHTS_RETRY_AFTER
+
+        monkeypatch.setattr(gemini, "generate", lambda prompt: "Rice is in demand")
+        insights._failures.update(dict.fromkeys(insights._failures, 0))  # retry time reached
+        assert insights.insight_for("560001", "rice 10kg", "rice") == (insights.FAILED_TEXT, "error")
+        settle()
+        assert insights.insight_for("560001", "rice 10kg", "rice") == ("Rice is in demand", "fresh")
+
+
+def test_failure_keeps_older_text_stale(app, monkeypatch):
+    monkeypatch.setattr(gemini, "generate", lambda prompt: "Rice is in demand")
+    with app.app_context():
+        insights.insight_for("560001", "rice 10kg", "rice")
+        settle()
+
+        def fail(prompt):
+            raise RuntimeError("quota exceeded")
+
+        monkeypatch.setattr(gemini, "generate", fail)
+        # Demand changed; its text fails, so the region's older text is still shown as stale
+        insights.insight_for("560001", "rice 12kg", "rice")
+        settle()
+        assert insights.insight_for("560001", "rice 12kg", "rice") == ("Rice is in demand", "stale")
+        # The older summary's own entry is untouched
+        assert insights.insight_for("560001", "rice 10kg", "rice") == ("Rice is in demand", "fresh")
+
+
+def test_submit_failure_releases_key(app, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise RuntimeError("cannot schedule new futures after shutdown")
+
+    monkeypatch.setattr(background, "submit", refuse)
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            insights.insight_for("560001", "rice 10kg", "rice")
+        assert not insights._in_flight
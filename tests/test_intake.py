@@ -0,0 +1,146 @@
+"""Batch intake through ``/retailers/add_items``."""
+import csv
+import io
+import sqlite3
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from foodloop_app import db, enrichment, retailer_routes, shelf_life
+from foodloop_app.models import Food, InventoryItem
+from tests.test_enrichment import wait_for_status
+
+
+def test_failed_batch_rolls_back_new_catalog_foods(app, client, sign_up, monkeypatch):
+    retailer = sign_up("shop@example.com", "Retailer")
+    catalog_food = retailer_routes.catalog_food
+
+    def fail_after_creating(name):
+        catalog_food(name)
+        raise OperationalError("INSERT", {}, Exception("disk I/O error"))
+
+    monkeypatch.setattr(retailer_routes, "catalog_food", fail_after_creating)
+
+    response = client.post(
+        "/retailers/add_items", json=[{"name": "Breadfruit", "quantity": 3}], headers=retailer
+    )
+
+    assert response.status_code == 500
+    with app.app_context():
+        # The batch is one transaction, its first write included
+        assert Food.query.filter_by(name_lower="breadfruit").count() == 0
+        assert InventoryItem.query.count() == 0
+
+
+def expire(app, item_id, status="Expired"):
+    with app.app_context():
+        item = db.session.get(InventoryItem, item_id)
+        item.status = status
+        item.expires_at = datetime.utcnow() - timedelta(days=1)
+        db.session.commit()
+
+
+def stocked_item(client, headers, name, quantity=5):
+    """A ``Selling`` item of ``name`` with estimated dates."""
+    body = client.post("/retailers/add_item", json={"name": name, "quantity": quantity}, headers=headers).get_json()
+    wait_for_status(client, body["enrichment_url"], headers)
+    return body["id"]
+
+
+def test_restocking_an_expired_item_starts_a_fresh_lot(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    item_id = stocked_item(client, retailer, "Mango")
+    expire(app, item_id)
+
+    response = client.post("/retailers/add_item", json={"name": "Mango", "quantity": 10}, headers=retailer)
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["quantity"] == 10  # The expired stock is gone
+    assert body["status"] == "Selling"
+    assert body["expires_at"] > datetime.utcnow().isoformat()
+    sold = client.post(f"/retailers/inventory/{item_id}/sell", json={"quantity": 10}, headers=retailer)
+    assert sold.status_code == 200, sold.get_json()
+
+
+def test_restocking_a_live_item_adds_to_it(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    stocked_item(client, retailer, "Mango")
+
+    response = client.post("/retailers/add_item", json={"name": "Mango", "quantity": 10}, headers=retailer)
+
+    assert response.status_code == 200
+    assert response.get_json()["quantity"] == 15
+
+
+def test_batch_restarts_dead_items(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    expired_id = stocked_item(client, retailer, "Mango")
+    failed_id = stocked_item(client, retailer, "Papaya")
+    expire(app, expired_id)
+    expire(app, failed_id, enrichment.FAILED)
+
+    response = client.post(
+        "/retailers/add_items",
+        json=[{"name": "Mango", "quantity": 4}, {"name": "Papaya", "quantity": 6}, {"name": "mango", "quantity": 1}],
+        headers=retailer,
+    )
+
+    assert response.status_code == 200
+    assert [result["status"] for result in response.get_json()["results"]] == ["restarted"] * 3
+    with app.app_context():
+        for item_id, quantity in ((expired_id, 5), (failed_id, 6)):
+            item = db.session.get(InventoryItem, item_id)
+            assert (item.quantity, item.status) == (quantity, enrichment.READY)
+            assert item.expires_at > datetime.utcnow()
+
+
+def upload(client, headers, content):
+    return client.post(
+        "/retailers/add_items",
+        data={"file": (io.BytesIO(content), "items.csv")},
+        headers=headers,
+        content_type="multipart/form-data",
+    )
+
+
+def test_unreadable_csv_is_rejected(client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+
+    response = upload(client, retailer, "name,quantity\nCrème fraîche,2\n".encode("latin-1"))
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "The CSV file must be UTF-8 encoded"
+
+    response = upload(client, retailer, b'name,quantity\n"' + b"x" * (csv.field_size_limit() + 1) + b'",2\n')
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Malformed CSV file")
+
+
+def test_synchronous_batch_asks_the_model_before_writing(app, client, sign_up, monkeypatch):
+    stocked_item(client, sign_up("other-shop@example.com", "Retailer"), "Mango")  # Cached now
+    retailer = sign_up("shop@example.com", "Retailer")
+    app.config["SHELF_LIFE_ASYNC"] = False
+    with app.app_context():
+        path = db.engine.url.database
+    ask_model_many = shelf_life._ask_model_many
+
+    def ask_model_unlocked(names, city, now):
+        # Another writer must not have to wait for the model call
+        other = sqlite3.connect(path, timeout=0)
+        try:
+            other.execute("BEGIN IMMEDIATE")
+            other.rollback()
+        finally:
+            other.close()
+        return ask_model_many(names, city, now)
+
+    monkeypatch.setattr(shelf_life, "_ask_model_many", ask_model_unlocked)
+
+    response = client.post(
+        "/retailers/add_items",
+        json=[{"name": "Mango", "quantity": 1}, {"name": "Guava", "quantity": 2}],
+        headers=retailer,
+    )
+
+    assert response.status_code == 200, response.get_json()
+    assert [result["status"] for result in response.get_json()["results"]] == ["added", "created"]
@@ -0,0 +1,23 @@
+"""Metrics shared between workers through METRICS_DIR (metrics.py)."""
+import json
+
+from foodloop_app import metrics
+
+
+def test_shelf_life_counters_add_up_across_workers(app, client, sign_up, tmp_path):
+    app.config["METRICS_DIR"] = str(tmp_path / "metrics")
+    (tmp_path / "metrics").mkdir()
+    # Another worker's last snapshot
+    (tmp_path / "metrics" / "1-1.json").write_text(json.dumps({
+        metrics.SHELF_LIFE_CACHE.name: [[["hit"], 40], [["miss"], 2]],
+    }))
+    before = client.get("/retailers/shelf_life_cache/stats").get_json()
+    retailer = sign_up("shop@example.com", "Retailer")
+
+    client.post("/retailers/add_item", json={"name": "Dragon fruit", "quantity": 5}, headers=retailer)
+
+    stats = client.get("/retailers/shelf_life_cache/stats").get_json()
+    assert stats["misses"] == before["misses"] + 1
+    assert stats["hits"] >= 40 and stats["misses"] >= 3
+    body = client.get("/metrics").get_data(as_text=True)
+    assert f'foodloop_shelf_life_cache_total{{result="miss"}} {stats["misses"]}' in body
@@ -0,0 +1,136 @@
+"""In-place schema upgrades (migrations.py)."""
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import StaticPool
+
+from foodloop_app import db
+from foodloop_app.migrations import upgrade
+from foodloop_app.models import FoodRequest, InventoryItem
+from tests.conftest import build_app
+
+# The tables as the first release created them: stock on the shared food row
+BASELINE_SCHEMA = """
+CREATE TABLE user (
+    id INTEGER PRIMARY KEY, email VARCHAR UNIQUE, password VARCHAR NOT NULL, active BOOLEAN, city VARCHAR,
+    pincode VARCHAR, contact VARCHAR, fs_uniquifier VARCHAR(255) NOT NULL UNIQUE
+);
+CREATE TABLE role (id INTEGER PRIMARY KEY, name VARCHAR UNIQUE);
+CREATE TABLE roles_users (user_id INTEGER REFERENCES user (id), role_id INTEGER REFERENCES role (id));
+CREATE TABLE food (
+    id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE, is_refrigerated BOOLEAN, quantity FLOAT NOT NULL,
+    best_before DATETIME NOT NULL, expires_at DATETIME NOT NULL, status VARCHAR, created_at DATETIME
+);
+CREATE TABLE inventory_item (
+    id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),
+    food_id INTEGER NOT NULL REFERENCES food (id)
+);
+CREATE TABLE food_request (
+    id INTEGER PRIMARY KEY, inventory_item_id INTEGER NOT NULL REFERENCES inventory_item (id),
+    requester_id INTEGER NOT NULL REFERENCES user (id), quantity FLOAT NOT NULL, pickup_date DATETIME,
+    notes VARCHAR, status VARCHAR, created_at DATETIME
+);
+"""
+
+
+def baseline_database(path, *statements):
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.execute("INSERT INTO user (id, email, password, active, fs_uniquifier) VALUES (1, 'a@x', 'x', 1, 'a')")
+        conn.execute("INSERT INTO food VALUES (1, 'Milk', 0, 10, '2030-01-01', '2030-01-08', 'Selling', NULL)")
+        conn.execute("INSERT INTO inventory_item (id, user_id, food_id) VALUES (1, 1, 1)")
+        for statement in statements:
+            conn.execute(statement)
+
+
+def foreign_keys_engine(path):
+    """One connection with foreign key enforcement on, as a deployment may configure it."""
+    engine = create_engine(f"sqlite:///{path}", poolclass=StaticPool)
+    event.listen(engine, "connect", lambda dbapi_connection, record: dbapi_connection.execute("PRAGMA foreign_keys=ON"))
+    return engine
+
+
+def index_names(table):
+    return {index["name"] for index in inspect(db.engine).get_indexes(table)}
+
+
+def test_upgrade_creates_missing_indexes(app):
+    with app.app_context():
+        assert "ix_inventory_item_status_quantity" in index_names("inventory_item")
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_inventory_item_status_quantity"))
+
+        upgrade(db.engine)
+
+        assert "ix_inventory_item_status_quantity" in index_names("inventory_item")
+
+
+def test_upgrade_merges_duplicate_items_without_losing_stock(tmp_path, monkeypatch):
+    path = tmp_path / "baseline.sqlite3"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany("INSERT INTO user (id, email, password, active, pincode, fs_uniquifier) "
+                         "VALUES (?, ?, 'x', 1, '560001', ?)", [(1, "shop@example.com", "a"),
+                                                               (2, "other@example.com", "b"),
+                                                               (3, "ngo@example.com", "c")])
+        conn.execute("INSERT INTO food VALUES (1, 'Milk', 0, 40, '2030-01-01', '2030-01-08', 'Listing', "
+                     "'2024-01-01')")
+        # Three rows of one retailer, one of another: 40 units over two retailers
+        conn.executemany("INSERT INTO inventory_item (id, user_id, food_id) VALUES (?, ?, 1)",
+                         [(1, 1), (2, 1), (3, 1), (4, 2)])
+        conn.execute("INSERT INTO food_request VALUES (1, 3, 3, 2, NULL, NULL, 'approved', '2024-01-02')")
+
+    app = build_app(path, monkeypatch)  # runs upgrade()
+
+    with app.app_context():
+        items = {item.user_id: item for item in InventoryItem.query}
+        assert set(items) == {1, 2}
+        assert items[1].quantity == items[2].quantity == 20
+        assert items[1].held_quantity == 0
+        assert items[1].status == "Listing"
+        assert db.session.get(FoodRequest, 1).inventory_item_id == items[1].id
+
+
+def test_merge_adds_moved_stock_of_duplicates(app):
+    # Duplicates in a database whose stock already lives on the items
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP INDEX uq_inventory_item_user_food"))
+            conn.execute(text("INSERT INTO user (id, email, password, active, fs_uniquifier) "
+                              "VALUES (1, 'shop@example.com', 'x', 1, 'a')"))
+            conn.execute(text("INSERT INTO food (id, name, name_lower, created_at) "
+                              "VALUES (1, 'Milk', 'milk', '2024-01-01')"))
+            conn.execute(text("INSERT INTO inventory_item (id, user_id, food_id, quantity, held_quantity, status) "
+                              "VALUES (1, 1, 1, 5, 1, 'Listing'), (2, 1, 1, 7, 2, 'Listing')"))
+
+        upgrade(db.engine)
+
+        (item,) = InventoryItem.query.all()
+        assert (item.id, item.quantity, item.held_quantity) == (1, 12, 3)
+
+
+def test_table_rebuilds_run_with_foreign_keys_off_and_restore_them(app, tmp_path):
+    path = tmp_path / "baseline.sqlite3"
+    baseline_database(path)
+    engine = foreign_keys_engine(path)
+
+    with app.app_context():
+        upgrade(engine)  # rebuilds food, which inventory_item refers to
+
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+        assert "quantity" not in {column["name"] for column in inspect(conn).get_columns("food")}
+        assert conn.exec_driver_sql("SELECT quantity FROM inventory_item").scalar() == 10
+
+
+def test_upgrade_refuses_to_commit_broken_foreign_keys(app, tmp_path):
+    path = tmp_path / "baseline.sqlite3"
+    baseline_database(path, "INSERT INTO food_request VALUES (1, 99, 1, 2, NULL, NULL, 'pending', NULL)")
+    engine = foreign_keys_engine(path)
+
+    with app.app_context(), pytest.raises(RuntimeError, match="food_request -> inventory_item"):
+        upgrade(engine)
+
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
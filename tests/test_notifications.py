@@ -0,0 +1,109 @@
+"""Expiry sweep (notifications.py): watermark, one notification per item and kind, and ignoring them."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete
+
+from benchmarks import holds
+from foodloop_app import db, notifications, reservations
+from foodloop_app.models import FoodRequest, InventoryItem, Notification, SweepWatermark
+
+NOW = datetime(2030, 1, 10, 12, 0)
+
+
+def add_item(client, retailer, name):
+    response = client.post("/retailers/add_item", json={"name": name, "quantity": 4}, headers=retailer)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["id"]
+
+
+def set_dates(app, item_id, best_before, expires_at):
+    with app.app_context():
+        item = db.session.get(InventoryItem, item_id)
+        item.best_before, item.expires_at = best_before, expires_at
+        db.session.commit()
+
+
+def sweep(app, now):
+    with app.app_context():
+        result = notifications.sweep(now)
+        db.session.commit()
+        return result
+
+
+def notification_rows(app):
+    with app.app_context():
+        return sorted(db.session.query(Notification.inventory_item_id, Notification.kind))
+
+
+@pytest.fixture
+def retailer(app, sign_up):
+    app.config["SHELF_LIFE_ASYNC"] = False
+    return sign_up("shop@example.com", "Retailer")
+
+
+def test_sweep_notifies_and_expires_items_once(app, client, sign_up, retailer):
+    ngo = sign_up("ngo@example.com", "Ngo")
+    aged_id = add_item(client, retailer, "Bread")
+    set_dates(app, aged_id, NOW - timedelta(hours=1), NOW + timedelta(days=3))
+    expired_id = holds.listed_item(app, retailer, 10)
+    response = client.post("/ngo/request", json={"inventory_item_id": expired_id, "quantity": 3}, headers=ngo)
+    assert response.status_code == 201, response.get_json()
+    request_id = response.get_json()["id"]
+    set_dates(app, expired_id, NOW - timedelta(days=2), NOW - timedelta(hours=1))
+
+    assert sweep(app, NOW) == (1, 1)
+
+    expected = [(aged_id, notifications.BEST_BEFORE), (expired_id, notifications.EXPIRED)]
+    assert notification_rows(app) == sorted(expected)
+    with app.app_context():
+        item = db.session.get(InventoryItem, expired_id)
+        assert (item.status, item.held_quantity) == ("Expired", 0)
+        assert db.session.get(FoodRequest, request_id).status == reservations.EXPIRED
+    listed = client.get("/retailers/notifications", headers=retailer).get_json()
+    assert sorted((row["id"], row["kind"]) for row in listed) == sorted(expected)
+
+    # Nothing new since the watermark
+    assert sweep(app, NOW + timedelta(minutes=5)) == (0, 0)
+    # A full rescan, as by a first or concurrent sweep, adds no second notification
+    with app.app_context():
+        db.session.execute(delete(SweepWatermark))
+        db.session.commit()
+    assert sweep(app, NOW + timedelta(minutes=10)) == (0, 0)
+    assert notification_rows(app) == sorted(expected)
+
+
+def test_sweep_scans_only_dates_passed_since_the_watermark(app, client, retailer):
+    assert sweep(app, NOW) == (0, 0)
+    behind_id = add_item(client, retailer, "Bread")
+    set_dates(app, behind_id, NOW - timedelta(hours=1), NOW + timedelta(days=3))
+    ahead_id = add_item(client, retailer, "Milk")
+    set_dates(app, ahead_id, NOW + timedelta(hours=1), NOW + timedelta(days=3))
+
+    # Dates before the watermark were already scanned
+    assert sweep(app, NOW + timedelta(hours=2)) == (1, 0)
+    assert notification_rows(app) == [(ahead_id, notifications.BEST_BEFORE)]
+
+    # A slower sweep finishing late does not move the watermark back
+    sweep(app, NOW)
+    with app.app_context():
+        assert db.session.get(SweepWatermark, notifications.WATERMARK).swept_until == NOW + timedelta(hours=2)
+
+
+def test_ignored_notification_stays_hidden(app, client, sign_up, retailer):
+    item_id = add_item(client, retailer, "Bread")
+    set_dates(app, item_id, NOW - timedelta(hours=1), NOW + timedelta(days=3))
+    sweep(app, NOW)
+    assert len(client.get("/retailers/notifications", headers=retailer).get_json()) == 1
+
+    other = sign_up("other@example.com", "Retailer")
+    assert client.post(f"/retailers/food/{item_id}/ignore", headers=other).status_code == 404
+    assert len(client.get("/retailers/notifications", headers=retailer).get_json()) == 1
+
+    assert client.post(f"/retailers/food/{item_id}/ignore", headers=retailer).status_code == 200
+    assert client.get("/retailers/notifications", headers=retailer).get_json() == []
+    with app.app_context():
+        db.session.execute(delete(SweepWatermark))
+        db.session.commit()
+    sweep(app, NOW + timedelta(minutes=5))
+    assert client.get("/retailers/notifications", headers=retailer).get_json() == []
@@ -0,0 +1,162 @@
+"""Row encoders of the list endpoints (pagination.py)."""
+import json
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+from benchmarks import holds
+from benchmarks.serialization import cases, render
+from foodloop_app import json_provider
+from foodloop_app.pagination import row_encoder, select_columns
+
+PROVIDERS = [DefaultJSONProvider, json_provider.JSONProvider]
+if json_provider.orjson is not None:
+    PROVIDERS.append(json_provider.OrjsonProvider)
+
+
+@pytest.fixture
+def listings(app, client, sign_up):
+    """A listed item with a pending request, and an item still waiting for dates."""
+    retailer = sign_up("shop@example.com", "Retailer")
+    ngo = sign_up("ngo@example.com", "Ngo")
+    item_id = holds.listed_item(app, retailer, 10)
+    response = client.post("/ngo/request", json={"inventory_item_id": item_id, "quantity": 2}, headers=ngo)
+    assert response.status_code == 201, response.get_json()
+    app.config["SHELF_LIFE_ASYNC"] = True
+    response = client.post("/retailers/add_item", json={"name": "Dragon fruit", "quantity": 3}, headers=retailer)
+    assert response.status_code == 202, response.get_json()
+
+
+def selections(fields):
+    names = list(fields)
+    return [names, names[1::2], names[-1:]]
+
+
+@pytest.mark.parametrize("provider", PROVIDERS, ids=lambda provider: provider.__name__)
+def test_encoders_match_per_field_rendering(app, listings, provider):
+    with app.test_request_context():
+        app.json = provider(app)
+        for endpoint, fields, make_query in cases():
+            for names in selections(fields):
+                columns = select_columns(fields, names)
+                for order in (columns, columns[::-1]):
+                    rows = make_query(order).all()
+                    assert rows, endpoint
+                    expected = DefaultJSONProvider(app).dumps(render(fields, names, rows))
+                    encode = row_encoder(fields, names, order)
+                    actual = app.json.dumps([encode(row) for row in rows])
+                    # Same values, and the same key order
+                    assert json.loads(actual, object_pairs_hook=list) == json.loads(
+                        expected, object_pairs_hook=list
+                    ), (endpoint, names)
+
+
+def add_items(client, retailer, names):
+    for name in names:
+        response = client.post("/retailers/add_item", json={"name": name, "quantity": 3}, headers=retailer)
+        assert response.status_code in (201, 202), response.get_json()
+
+
+def test_keyset_pages_cover_every_row_once(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    add_items(client, retailer, ["Apples", "Bread", "Carrots", "Dates", "Eggs"])
+
+    ids, url, pages = [], "/retailers/inventory?limit=2", 0
+    while url:
+        response = client.get(url, headers=retailer)
+        assert response.status_code == 200, response.get_json()
+        ids += [item["id"] for item in response.get_json()]
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor and pages == 1:
+            assert f"after={cursor}" in response.headers["Link"]
+            # Rows added behind the cursor are not skipped or repeated
+            add_items(client, retailer, ["Figs"])
+        url = f"/retailers/inventory?limit=2&after={cursor}" if cursor else None
+
+    assert pages == 3
+    assert len(ids) == 6
+    assert ids == sorted(set(ids))
+
+
+def test_keyset_pages_on_a_composite_key(app, client, sign_up):
+    ngo = sign_up("ngo@example.com", "Ngo")
+    retailer = sign_up("shop@example.com", "Retailer")
+    listed = [holds.listed_item(app, retailer, 5)]
+    app.config["SHELF_LIFE_ASYNC"] = False
+    for name in ("Bread", "Milk"):
+        response = client.post("/retailers/add_item", json={"name": name, "quantity": 5}, headers=retailer)
+        listed.append(response.get_json()["id"])
+        assert client.post(f"/retailers/inventory/{listed[-1]}/list", headers=retailer).status_code == 200
+
+    ids, cursor = [], None
+    for _ in listed:
+        response = client.get("/ngo/filtered_food?limit=1" + (f"&after={cursor}" if cursor else ""), headers=ngo)
+        assert response.status_code == 200, response.get_json()
+        ids += [item["id"] for item in response.get_json()]
+        cursor = response.headers.get("X-Next-Cursor")
+    # Same distance for all, so the pages follow the id
+    assert ids == sorted(listed)
+    assert cursor is None
+
+
+@pytest.mark.parametrize("query", [
+    "after=!!!",
+    "after=e30",  # {}
+    "after=WzEsMl0",  # [1,2], a cursor of another endpoint's key
+    "limit=0",
+    "limit=abc",
+    "limit=1001",
+    "fields=id,colour",
+    "format=xml",
+])
+def test_malformed_list_arguments_are_422(client, sign_up, query):
+    retailer = sign_up("shop@example.com", "Retailer")
+
+    response = client.get(f"/retailers/inventory?{query}", headers=retailer)
+
+    assert response.status_code == 422
+    assert "error" in response.get_json()
+
+
+def test_fields_select_a_subset_in_endpoint_order(client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    add_items(client, retailer, ["Apples"])
+
+    response = client.get("/retailers/inventory?fields=name, id", headers=retailer)
+
+    assert response.status_code == 200
+    assert [list(item) for item in response.get_json()] == [["id", "name"]]
+    assert response.get_json()[0]["name"] == "Apples"
+
+
+def test_ndjson_export_streams_every_row(app, client, sign_up):
+    app.config["EXPORT_BATCH_SIZE"] = 2
+    retailer = sign_up("shop@example.com", "Retailer")
+    add_items(client, retailer, ["Apples", "Bread", "Carrots", "Dates", "Eggs"])
+
+    response = client.get("/retailers/inventory?format=ndjson&limit=1&fields=id,name", headers=retailer)
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == "application/x-ndjson"
+    body = response.get_data()
+    assert body.endswith(b"\n")
+    rows = [json.loads(line) for line in body.splitlines()]
+    # Every row, not a page, in key order
+    assert [row["name"] for row in rows] == ["Apples", "Bread", "Carrots", "Dates", "Eggs"]
+    assert all(list(row) == ["id", "name"] for row in rows)
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_ndjson_feed_is_not_cached(app, client, sign_up):
+    ngo = sign_up("ngo@example.com", "Ngo")
+    retailer = sign_up("shop@example.com", "Retailer")
+    item_id = holds.listed_item(app, retailer, 5)
+
+    for _ in range(2):
+        response = client.get("/ngo/filtered_food?format=ndjson", headers=ngo)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.get_etag() == (None, None)
+        assert [json.loads(line)["id"] for line in response.get_data().splitlines()] == [item_id]
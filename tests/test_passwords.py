@@ -0,0 +1,65 @@
+"""Password hashing settings (passwords.py)."""
+import pytest
+
+from foodloop_app import db
+from foodloop_app.models import User
+from tests.conftest import PASSWORD, build_app
+
+
+@pytest.fixture
+def bcrypt_app(tmp_path, monkeypatch):
+    app = build_app(tmp_path / "bcrypt.sqlite3", monkeypatch, PASSWORD_HASH_SCHEME="bcrypt", PASSWORD_BCRYPT_ROUNDS="4")
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def sign_up_and_login(app, email, password):
+    client = app.test_client()
+    response = client.post("/sign-up", json={
+        "email": email, "password": password, "city": "Bangalore", "pincode": "560001", "contact": "0",
+        "role": "Retailer",
+    })
+    assert response.status_code == 201, response.get_json()
+    return client.post("/auth-login", json={"email": email, "password": password})
+
+
+@pytest.mark.parametrize("single_hash", [False, True])
+def test_bcrypt_takes_long_non_ascii_passwords(bcrypt_app, single_hash):
+    bcrypt_app.config["SECURITY_PASSWORD_SINGLE_HASH"] = single_hash
+    password = "пароль-" * 12  # 84 characters, 156 UTF-8 bytes
+
+    assert sign_up_and_login(bcrypt_app, "shop@example.com", password).status_code == 200
+    client = bcrypt_app.test_client()
+    wrong = client.post("/auth-login", json={"email": "shop@example.com", "password": "пароль"})
+    assert wrong.status_code == 401
+
+
+@pytest.mark.parametrize("settings, prefix", [
+    ({"PASSWORD_PBKDF2_ROUNDS": "1200"}, "$pbkdf2-sha256$1200$"),
+    ({"PASSWORD_HASH_SCHEME": "bcrypt", "PASSWORD_BCRYPT_ROUNDS": "4"}, "$2b$04$"),
+])
+def test_login_rehashes_after_the_cost_changes(tmp_path, monkeypatch, settings, prefix):
+    path = tmp_path / "rehash.sqlite3"
+    old_app = build_app(path, monkeypatch)
+    assert sign_up_and_login(old_app, "shop@example.com", PASSWORD).status_code == 200
+    with old_app.app_context():
+        old_hash = db.session.query(User.password).filter_by(email="shop@example.com").scalar()
+        db.engine.dispose()
+    assert old_hash.startswith("$pbkdf2-sha256$1000$")
+
+    new_app = build_app(path, monkeypatch, **settings)
+    client = new_app.test_client()
+    assert client.post("/auth-login", json={"email": "shop@example.com", "password": PASSWORD}).status_code == 200
+    with new_app.app_context():
+        new_hash = db.session.query(User.password).filter_by(email="shop@example.com").scalar()
+    assert new_hash.startswith(prefix)
+
+    # Rehashed once; the new hash keeps working and is not replaced again
+    assert client.post("/auth-login", json={"email": "shop@example.com", "password": PASSWORD}).status_code == 200
+    with new_app.app_context():
+        assert db.session.query(User.password).filter_by(email="shop@example.com").scalar() == new_hash
+        db.session.remove()
+        db.engine.dispose()
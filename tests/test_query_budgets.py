@@ -0,0 +1,54 @@
+"""SQL statements per request of the list endpoints stay within query_counter.ENDPOINT_QUERY_BUDGETS."""
+import pytest
+
+from foodloop_app import db, feed_cache
+from foodloop_app.geo import load_centroids
+from foodloop_app.query_counter import ENDPOINT_QUERY_BUDGETS, assert_max_queries
+
+ENDPOINT_URLS = {
+    "retailer.get_inventory": ("retailer", "/retailers/inventory"),
+    "retailer.get_food_requests": ("retailer", "/retailers/requested_food"),
+    "ngo.get_my_requests": ("ngo", "/ngo/my_requests"),
+    "ngo.get_nearby_food": ("ngo", "/ngo/filtered_food?radius_km=20"),
+}
+
+
+@pytest.fixture
+def users(app, client, sign_up):
+    """Two retailers in neighbouring pincodes with listed items, and an NGO that requested some of them."""
+    app.config["SHELF_LIFE_ASYNC"] = False  # dates from the stub model at once, so items can be listed
+    with app.app_context():
+        load_centroids({"560001": (12.97, 77.59), "560002": (12.96, 77.58)})
+    headers = {
+        "retailer": sign_up("shop@example.com", "Retailer", pincode="560001"),
+        "other": sign_up("other-shop@example.com", "Retailer", pincode="560002"),
+        "ngo": sign_up("ngo@example.com", "Ngo", pincode="560001"),
+    }
+    for retailer in ("retailer", "other"):
+        for name in ("Rice", "Lentils", "Bananas", "Bread", "Milk"):
+            response = client.post("/retailers/add_item", json={"name": name, "quantity": 10}, headers=headers[retailer])
+            assert response.status_code == 201, response.get_json()
+            item_id = response.get_json()["id"]
+            assert client.post(f"/retailers/inventory/{item_id}/list", headers=headers[retailer]).status_code == 200
+            response = client.post("/ngo/request", json={"inventory_item_id": item_id, "quantity": 2},
+                                   headers=headers["ngo"])
+            assert response.status_code == 201, response.get_json()
+    return headers
+
+
+def test_every_budget_has_a_url():
+    assert ENDPOINT_URLS.keys() == ENDPOINT_QUERY_BUDGETS.keys()
+
+
+@pytest.mark.parametrize("endpoint", sorted(ENDPOINT_QUERY_BUDGETS))
+def test_endpoint_within_query_budget(app, client, users, endpoint):
+    role, url = ENDPOINT_URLS[endpoint]
+    warm_up = client.get(url, headers=users[role])  # caches the caller's identity
+    assert warm_up.status_code == 200, warm_up.get_json()
+    assert warm_up.get_json(), "expected rows; an empty page would not show per-row queries"
+    feed_cache._feeds.clear()  # measure a feed built from the database, not the cached page
+
+    with app.app_context(), assert_max_queries(ENDPOINT_QUERY_BUDGETS[endpoint], db.engine):
+        response = client.get(url, headers=users[role])
+
+    assert response.status_code == 200
@@ -0,0 +1,61 @@
+"""Holds and approvals under concurrent requests (reservations.py), on a file-backed SQLite database."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+
+from benchmarks import holds
+from foodloop_app import db, reservations
+from foodloop_app.models import FoodRequest, InventoryItem
+
+
+def test_concurrent_holds_and_approvals(app):
+    result = holds.run(app, quantity=20, requests=60, threads=8, approvers=3)
+
+    assert result.held == 20
+    assert result.rejected == 40
+    assert result.approved == 20
+    assert result.duplicate_approvals == 0
+
+
+def test_more_capacity_than_requests(app):
+    result = holds.run(app, quantity=30, requests=12, threads=6, approvers=2)
+
+    assert result.held == 12
+    assert result.rejected == 0
+
+
+def request_food(client, ngo, item_id, quantity=2):
+    response = client.post("/ngo/request", json={"inventory_item_id": item_id, "quantity": quantity}, headers=ngo)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["id"]
+
+
+def test_removing_an_item_closes_its_pending_requests(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    ngo = sign_up("ngo@example.com", "Ngo")
+    item_id = holds.listed_item(app, retailer, 10)
+    request_id = request_food(client, ngo, item_id)
+
+    response = client.delete(f"/retailers/item/remove/{item_id}", headers=retailer)
+
+    assert response.status_code == 200
+    with app.app_context():
+        assert db.session.get(FoodRequest, request_id).status == reservations.IGNORED
+        assert reservations.expire_holds(datetime.utcnow() + timedelta(days=30)) == 0
+    response = client.post(f"/retailers/requests/{request_id}/approve", headers=retailer)
+    assert response.status_code == 404
+
+
+def test_requests_on_a_deleted_item_are_not_found(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    ngo = sign_up("ngo@example.com", "Ngo")
+    item_id = holds.listed_item(app, retailer, 10)
+    request_id = request_food(client, ngo, item_id)
+    with app.app_context():
+        # As left behind by removals before pending requests were closed
+        db.session.execute(delete(InventoryItem).where(InventoryItem.id == item_id))
+        db.session.commit()
+
+    for action in ("approve", "ignore"):
+        response = client.post(f"/retailers/requests/{request_id}/{action}", headers=retailer)
+        assert response.status_code == 404, response.get_json()
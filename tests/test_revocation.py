@@ -0,0 +1,56 @@
+"""Token revocation shared by the workers of one database (revocation.py)."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from foodloop_app import db, revocation
+from foodloop_app.models import RevokedToken
+from tests.conftest import build_app
+
+
+@pytest.fixture
+def other_app(tmp_path, monkeypatch, app):
+    """A second app on the same database, standing in for another worker."""
+    other = build_app(tmp_path / "test.sqlite3", monkeypatch)
+    yield other
+    with other.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_token_revoked_through_one_worker_is_rejected_by_another(app, other_app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    other_client = other_app.test_client()
+    assert other_client.get("/retailers/inventory", headers=retailer).status_code == 200
+
+    assert client.post("/auth-logout", headers=retailer).status_code == 200
+    assert client.get("/retailers/inventory", headers=retailer).status_code == 401
+    with other_app.app_context():
+        revocation.sync()  # what its sync thread does every REVOCATION_SYNC_INTERVAL
+
+    response = other_client.get("/retailers/inventory", headers=retailer)
+    assert response.status_code == 401
+    assert response.get_json() == {"error": "Token has been revoked"}
+
+
+def test_revocation_committed_after_a_newer_one_is_picked_up(app):
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=1)
+
+    def write(jti, revoked_at):
+        with db.engine.begin() as conn:
+            conn.execute(insert(RevokedToken).values(jti=jti, type="access", expires_at=expires_at,
+                                                     revoked_at=revoked_at))
+
+    with app.app_context():
+        write("newer", now)
+        assert revocation.is_revoked("newer")
+        # Stamped before "newer" but committed after this worker synced past it
+        write("late", now - timedelta(seconds=5))
+        assert not revocation.is_revoked("late")
+
+        revocation.sync()
+
+        assert revocation.is_revoked("late")
+        assert revocation.is_revoked("newer")
@@ -0,0 +1,74 @@
+"""Read replica routing and read-your-writes across workers (routing.py)."""
+import time
+from collections import OrderedDict
+
+import pytest
+
+from foodloop_app import db, routing
+from tests.conftest import build_app
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # The replica never syncs, so it lags behind every write
+    app = build_app(tmp_path / "primary.sqlite3", monkeypatch, replica_path=tmp_path / "replica.sqlite3")
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def inventory_names(client, headers):
+    response = client.get("/retailers/inventory", headers=headers)
+    assert response.status_code == 200
+    return [item["name"] for item in response.get_json()]
+
+
+def add_item(client, retailer):
+    response = client.post("/retailers/add_item", json={"name": "Rice", "quantity": 5}, headers=retailer)
+    assert response.status_code in (201, 202), response.get_json()
+    return response
+
+
+def test_reads_after_a_write_go_to_the_primary(app, client, sign_up):
+    retailer = sign_up("shop@example.com", "Retailer")
+    add_item(client, retailer)
+
+    assert inventory_names(client, retailer) == ["Rice"]
+
+
+def test_write_marker_carries_over_to_another_worker(app, client, sign_up, monkeypatch):
+    retailer = sign_up("shop@example.com", "Retailer")
+    response = add_item(client, retailer)
+    marker = response.headers[routing.MARKER_HEADER]
+    # Another worker: it has not seen this user's write
+    monkeypatch.setattr(routing, "_last_writes", OrderedDict())
+
+    assert inventory_names(client, retailer) == ["Rice"]  # the cookie
+    other = app.test_client()
+    assert inventory_names(other, {**retailer, routing.MARKER_HEADER: marker}) == ["Rice"]
+    assert inventory_names(other, retailer) == []  # no marker: the lagging replica
+
+
+def test_marker_is_only_honoured_for_its_user(app, client, sign_up, monkeypatch):
+    retailer = sign_up("shop@example.com", "Retailer")
+    marker = add_item(client, retailer).headers[routing.MARKER_HEADER]
+    other_retailer = sign_up("other-shop@example.com", "Retailer")
+    add_item(client, other_retailer)
+    monkeypatch.setattr(routing, "_last_writes", OrderedDict())
+
+    other = app.test_client()
+    assert inventory_names(other, {**other_retailer, routing.MARKER_HEADER: marker}) == []
+    assert inventory_names(other, {**retailer, routing.MARKER_HEADER: marker + "x"}) == []
+
+
+def test_marker_expires_with_the_window(app, client, sign_up, monkeypatch):
+    app.config["READ_YOUR_WRITES_WINDOW"] = 0
+    retailer = sign_up("shop@example.com", "Retailer")
+    marker = add_item(client, retailer).headers[routing.MARKER_HEADER]
+    monkeypatch.setattr(routing, "_last_writes", OrderedDict())
+    time.sleep(1.1)  # markers carry whole seconds
+
+    other = app.test_client()
+    assert inventory_names(other, {**retailer, routing.MARKER_HEADER: marker}) == []
@@ -0,0 +1,8 @@
+"""WSGI entry point for production servers: ``gunicorn -c gunicorn.conf.py``."""
+import logging
+import os
+
+from foodloop_app import create_app
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+app = create_app()